@@ -0,0 +1,131 @@
+"""Time how long Airflow takes to parse the DAG files.
+
+Parses ``dags/`` with a DagBag the way the scheduler's file processor does,
+and fails when the median parse time regresses against a saved baseline, when
+a file fails to import, or when parsing reads an Airflow Variable, which
+costs a metastore query every time the file is parsed.
+
+Usage::
+
+    python benchmarks/dag_parse.py --save-baseline
+    python benchmarks/dag_parse.py
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+PLUGINS = os.path.join(ROOT, "plugins")
+sys.path[:0] = [PLUGINS, os.path.join(PLUGINS, "operators")]
+
+# pylint: disable=wrong-import-position
+from airflow.models import Variable
+from airflow.models.dagbag import DagBag
+
+DEFAULT_DAG_FOLDER = os.path.join(ROOT, "dags")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "dag_parse_baseline.json")
+
+
+def parse(dag_folder: str, repeat: int) -> Dict[str, Any]:
+    """Parse the DAG folder ``repeat`` times, counting Variable reads.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The median and all samples in seconds, the DAG IDs, the import
+        errors and the number of Variable reads per parse.
+    """
+    variable_reads: List[str] = []
+    original_get = Variable.get
+
+    def counting_get(key: str, *args: Any, **kwargs: Any) -> Any:
+        variable_reads.append(key)
+        return original_get(key, *args, **kwargs)
+
+    Variable.get = counting_get
+    samples = []
+
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            dagbag = DagBag(dag_folder=dag_folder, include_examples=False)
+            samples.append(time.perf_counter() - started)
+    finally:
+        Variable.get = original_get
+
+    return {
+        "median": statistics.median(samples),
+        "samples": samples,
+        "dag_ids": sorted(dagbag.dag_ids),
+        "import_errors": dagbag.import_errors,
+        "variable_reads": len(variable_reads) // repeat,
+    }
+
+
+def main() -> None:
+    """Parse the command line, time the parse and check for regressions."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dag-folder", default=DEFAULT_DAG_FOLDER)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="Allowed slowdown share."
+    )
+    parser.add_argument(
+        "--min-delta", type=float, default=0.05, help="Ignored slowdown seconds."
+    )
+    args = parser.parse_args()
+
+    result = parse(args.dag_folder, args.repeat)
+    result["run_at"] = datetime.now(timezone.utc).isoformat()
+
+    print(
+        f"Parsed {len(result['dag_ids'])} DAGs in {result['median']:.3f}s "
+        f"(median of {args.repeat}), {result['variable_reads']} Variable reads."
+    )
+
+    failures = [
+        f"{path}: {error}" for path, error in result["import_errors"].items()
+    ]
+
+    if result["variable_reads"]:
+        failures.append(
+            f"{result['variable_reads']} Variable reads at parse time, "
+            "use {{ var.value.<key> }} in templated fields instead."
+        )
+
+    if args.save_baseline and not failures:
+        with open(args.baseline, "w", encoding="utf-8") as target:
+            json.dump(result, target, indent=2)
+        print(f"Saved baseline to {args.baseline}.")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as source:
+            base = json.load(source)["median"]
+
+        if (
+            result["median"] > base * (1 + args.tolerance)
+            and result["median"] - base > args.min_delta
+        ):
+            failures.append(
+                f"parse time {result['median']:.3f}s vs baseline {base:.3f}s "
+                f"(+{(result['median'] / base - 1) * 100:.0f}%)"
+            )
+    else:
+        print(f"No baseline at {args.baseline}, run with --save-baseline first.")
+
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
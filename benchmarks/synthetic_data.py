@@ -0,0 +1,262 @@
+"""Generate synthetic log-data and song-data JSON for benchmarks.
+
+The files follow the layout and field names of the Udacity source buckets, so
+the same COPY statements and jsonpaths file apply:
+
+- ``log-data/{year}/{month}/{ds}-events.json``, one JSON event per line.
+- ``song-data/songs-{n}.json``, one JSON song per line.
+
+Rows are written as they are generated, so memory use does not grow with
+the scale.
+
+Usage::
+
+    python benchmarks/synthetic_data.py --events 1000000 --output /tmp/bench
+"""
+
+import argparse
+import json
+import os
+import random
+import string
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List
+
+EPOCH = datetime(1970, 1, 1)
+SONGS_PER_FILE = 100_000
+PAGES = ["NextSong"] * 8 + ["Home", "Logout"]
+LEVELS = ["free", "paid"]
+GENDERS = ["F", "M"]
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_4) AppleWebKit/537.78.2",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:31.0) Gecko/20100101 Firefox/31.0",
+]
+
+
+def _word(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(length)).title()
+
+
+def generate_songs(count: int, artists: int, seed: int) -> Iterator[Dict[str, Any]]:
+    """Yield synthetic songs in the song-data format.
+
+    Parameters
+    ----------
+    count : int
+        The number of songs.
+    artists : int
+        The number of distinct artists the songs are spread over.
+    seed : int
+        The random seed. The same seed yields the same songs.
+    """
+    rng = random.Random(seed)
+
+    for index in range(count):
+        artist = index % artists
+        artist_rng = random.Random(seed * 7919 + artist)
+
+        yield {
+            "num_songs": 1,
+            "artist_id": f"AR{artist:016d}",
+            "artist_latitude": round(artist_rng.uniform(-90, 90), 5),
+            "artist_longitude": round(artist_rng.uniform(-180, 180), 5),
+            "artist_location": f"{_word(artist_rng, 7)}, {_word(artist_rng, 2)}",
+            "artist_name": f"{_word(artist_rng, 6)} {_word(artist_rng, 8)}",
+            "song_id": f"SO{index:016d}",
+            "title": f"{_word(rng, 5)} {_word(rng, 7)} {index}",
+            "duration": round(rng.uniform(60, 600), 5),
+            "year": rng.choice([0] + list(range(1960, 2019))),
+        }
+
+
+def generate_events(
+    count: int,
+    songs: List[Dict[str, Any]],
+    users: int,
+    start: datetime,
+    days: int,
+    match_rate: float,
+    seed: int,
+) -> Iterator[Dict[str, Any]]:
+    """Yield synthetic events in the log-data format, ordered by time.
+
+    Parameters
+    ----------
+    count : int
+        The number of events.
+    songs : List[Dict[str, Any]]
+        A sample of the generated songs that plays refer to.
+    users : int
+        The number of distinct users.
+    start : datetime
+        The time of the first event.
+    days : int
+        The number of days the events are spread over.
+    match_rate : float
+        The share of plays whose song, artist and length match a song.
+    seed : int
+        The random seed. The same seed yields the same events.
+    """
+    rng = random.Random(seed)
+    step = timedelta(days=days) / max(count, 1)
+
+    for index in range(count):
+        user = rng.randrange(users)
+        user_rng = random.Random(seed * 104729 + user)
+        page = rng.choice(PAGES)
+        event = {
+            "artist": None,
+            "auth": "Logged In",
+            "firstName": _word(user_rng, 6),
+            "gender": user_rng.choice(GENDERS),
+            "itemInSession": index % 50,
+            "lastName": _word(user_rng, 8),
+            "length": None,
+            "level": rng.choice(LEVELS),
+            "location": f"{_word(user_rng, 8)}, {_word(user_rng, 2)}",
+            "method": "PUT" if page == "NextSong" else "GET",
+            "page": page,
+            "registration": 1540000000000.0 + user,
+            "sessionId": user * 1000 + index // 500,
+            "song": None,
+            "status": 200,
+            "ts": int((start + step * index - EPOCH).total_seconds() * 1000),
+            "userAgent": user_rng.choice(USER_AGENTS),
+            "userId": str(user + 1),
+        }
+
+        if page == "NextSong":
+            song = rng.choice(songs)
+
+            if rng.random() < match_rate:
+                event.update(
+                    artist=song["artist_name"],
+                    length=song["duration"],
+                    song=song["title"],
+                )
+            else:
+                event.update(
+                    artist=_word(rng, 9),
+                    length=round(rng.uniform(60, 600), 5),
+                    song=_word(rng, 10),
+                )
+
+        yield event
+
+
+def write_dataset(
+    output: str,
+    events: int,
+    songs: int,
+    artists: int,
+    users: int,
+    start: datetime,
+    days: int,
+    match_rate: float,
+    seed: int,
+) -> Dict[str, int]:
+    """Write the song-data and log-data files under ``output``.
+
+    Returns
+    -------
+    Dict[str, int]
+        The number of files and rows written per prefix.
+    """
+    stats = {"song_files": 0, "songs": 0, "event_files": 0, "events": 0}
+    sample: List[Dict[str, Any]] = []
+    sample_size = min(songs, 100_000)
+    song_file = None
+
+    os.makedirs(os.path.join(output, "song-data"), exist_ok=True)
+
+    for index, song in enumerate(generate_songs(songs, artists, seed)):
+        if index % SONGS_PER_FILE == 0:
+            if song_file:
+                song_file.close()
+
+            path = os.path.join(
+                output, "song-data", f"songs-{index // SONGS_PER_FILE:05d}.json"
+            )
+            song_file = open(path, "w", encoding="utf-8")
+            stats["song_files"] += 1
+
+        song_file.write(json.dumps(song) + "\n")
+        stats["songs"] += 1
+
+        # Plays draw from an evenly spread sample so memory stays bounded.
+        if index % max(songs // sample_size, 1) == 0 and len(sample) < sample_size:
+            sample.append(song)
+
+    if song_file:
+        song_file.close()
+
+    day = None
+    event_file = None
+
+    for event in generate_events(
+        events, sample, users, start, days, match_rate, seed + 1
+    ):
+        event_day = (EPOCH + timedelta(milliseconds=event["ts"])).date()
+
+        if event_day != day:
+            if event_file:
+                event_file.close()
+
+            day = event_day
+            directory = os.path.join(
+                output, "log-data", str(day.year), f"{day.month:02d}"
+            )
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{day.isoformat()}-events.json")
+            event_file = open(path, "w", encoding="utf-8")
+            stats["event_files"] += 1
+
+        event_file.write(json.dumps(event) + "\n")
+        stats["events"] += 1
+
+    if event_file:
+        event_file.close()
+
+    return stats
+
+
+def main() -> None:
+    """Parse the command line and write the dataset."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", required=True, help="Directory to write to.")
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument(
+        "--songs", type=int, help="Defaults to one song per 20 events."
+    )
+    parser.add_argument(
+        "--artists", type=int, help="Defaults to one artist per 10 songs."
+    )
+    parser.add_argument(
+        "--users", type=int, help="Defaults to one user per 1000 events."
+    )
+    parser.add_argument("--start", default="2018-11-01", help="First event date.")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--match-rate", type=float, default=0.7)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    songs = args.songs or max(args.events // 20, 1)
+
+    stats = write_dataset(
+        output=args.output,
+        events=args.events,
+        songs=songs,
+        artists=args.artists or max(songs // 10, 1),
+        users=args.users or max(args.events // 1000, 1),
+        start=datetime.fromisoformat(args.start),
+        days=args.days,
+        match_rate=args.match_rate,
+        seed=args.seed,
+    )
+
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,22 +4,28 @@
 # pylint: disable=expression-not-assigned
 
 from datetime import timedelta
+from typing import Any, List, Optional
 
 import pendulum
 
-from airflow.decorators import dag
+from airflow.decorators import dag, task
 from airflow.operators.dummy import DummyOperator
-from airflow.models import Variable
 
 from operators import (
     StageToRedshiftOperator,
     LoadFactOperator,
-    LoadDimensionOperator,
+    LoadDimensionsOperator,
     DataQualityOperator,
     CreateTablesOperator,
+    TableMaintenanceOperator,
+    CompactS3FilesOperator,
+    UnloadToS3Operator,
+    RefreshRollupsOperator,
+    SourceFingerprintOperator,
 )
 
 import helpers.sql_queries as SQL_QUERIES
+from helpers.s3_objects import partition_prefixes
 import config as CONFIG
 
 default_args = {
@@ -44,102 +50,257 @@ def final_project():
 
     begin_execution = DummyOperator(task_id="begin_execution")
 
-    s3_bucket_name = Variable.get("s3_bucket_name")
-    iam_role_arn = Variable.get("iam_role_arn")
+    # Resolved by Jinja when each task runs, so parsing this file never
+    # reads the metastore.
+    s3_bucket_name = "{{ var.value.s3_bucket_name }}"
+    iam_role_arn = "{{ var.value.iam_role_arn }}"
+
+    # The embedded DuckDB backend has no S3 to list or catalog to reconcile.
+    redshift = CONFIG.CONNECTION_TYPE == "Redshift"
+
+    # A scheduled hour with no new source objects skips everything after
+    # this, rather than restaging and reloading the same data.
+    check_new_data = SourceFingerprintOperator(
+        task_id="check_new_data",
+        sources=[
+            {"bucket_name": s3_bucket_name, "prefix": CONFIG.LOG_DATA_S3_KEY},
+            {"bucket_name": "udacity-dend", "prefix": CONFIG.SONG_DATA_S3_KEY},
+        ],
+        db_connection_id=CONFIG.DB_CONNECTION_ID,
+        connection_type=CONFIG.CONNECTION_TYPE,
+    )
 
     create_tables = CreateTablesOperator(
         task_id="create_tables",
-        db_connection_id="redshift",
+        db_connection_id=CONFIG.DB_CONNECTION_ID,
         create_table_stmts=SQL_QUERIES.CREATE_TABLE_STATEMENTS,
         drop_table_stmts=SQL_QUERIES.DROP_TABLE_STATEMENTS,
-        connection_type="Redshift",
+        connection_type=CONFIG.CONNECTION_TYPE,
+        single_session=True,
+        single_transaction=True,
+        reconcile=redshift,
+        on_recreate_stmts=[SQL_QUERIES.DELETE_LOAD_LEDGER_ENTRIES],
+        truncate_on_create={
+            "staging_load_ledger": ["staging_events", "staging_songs"]
+        },
+        backfill_tables=CONFIG.TABLE_NAMES + CONFIG.ROLLUP_TABLE_NAMES,
     )
 
-    stage_events_to_redshift = StageToRedshiftOperator(
+    @task
+    def list_log_data_days(**context: Any) -> List[Optional[str]]:
+        """List the days of the data interval, one log-data partition each.
+
+        An unscheduled run has an empty interval and stages the whole prefix
+        as a single shard, without a day.
+        """
+        start = context["data_interval_start"]
+        end = context["data_interval_end"]
+
+        if end <= start:
+            return [None]
+
+        return partition_prefixes("{ds}", start, end)
+
+    log_data_days = list_log_data_days()
+
+    # One mapped task per day, so a backfill retries only the days that
+    # failed; the pool caps how many COPYs run at once.
+    stage_events_to_redshift = StageToRedshiftOperator.partial(
         task_id="stage_events",
-        db_connection_id="redshift",
+        pool=CONFIG.STAGING_POOL,
+        db_connection_id=CONFIG.DB_CONNECTION_ID,
         bucket_name=s3_bucket_name,
         iam_role=iam_role_arn,
         copy_table_stmt=SQL_QUERIES.COPY_STAGING_EVENTS,
+        s3_key=CONFIG.LOG_DATA_S3_KEY,
+        s3_partition_template=CONFIG.LOG_DATA_PARTITION_TEMPLATE,
         region_name="us-west-2",
         json_format=f"s3://{s3_bucket_name}/log_json_path.json",
+        use_manifest=redshift,
+        table_name="staging_events",
+        connection_type=CONFIG.CONNECTION_TYPE,
+        post_copy_stmts=[SQL_QUERIES.STAGING_EVENTS_SONG_KEY_UPDATE],
+        copy_options={"compupdate": False, "statupdate": False},
+        check_slices=redshift,
+        deferrable=CONFIG.DEFERRABLE,
+    ).expand(partition_date=log_data_days)
+
+    # `udacity-dend` holds one small file per song, far too many to COPY
+    # quickly, so they are compacted into one gzip file per slice in our own
+    # bucket first. The embedded backend reads the local copies as they are.
+    compact_song_data = CompactS3FilesOperator(
+        task_id="compact_song_data",
+        db_connection_id=CONFIG.DB_CONNECTION_ID,
+        source_bucket="udacity-dend",
+        source_prefix=CONFIG.SONG_DATA_S3_KEY,
+        target_bucket=s3_bucket_name,
+        target_prefix=CONFIG.SONG_DATA_COMPACTED_S3_KEY,
+        compression="gzip",
+        connection_type=CONFIG.CONNECTION_TYPE,
     )
 
-    # Have to load from `udacity-dend` because CloudShell will not let me
-    # place songs in root directory. It runs out of space.
     stage_songs_to_redshift = StageToRedshiftOperator(
         task_id="stage_songs",
-        db_connection_id="redshift",
-        bucket_name="udacity-dend",
+        db_connection_id=CONFIG.DB_CONNECTION_ID,
+        bucket_name=s3_bucket_name if redshift else "udacity-dend",
         iam_role=iam_role_arn,
         copy_table_stmt=SQL_QUERIES.COPY_STAGING_SONGS,
+        s3_key=(
+            CONFIG.SONG_DATA_COMPACTED_S3_KEY if redshift else CONFIG.SONG_DATA_S3_KEY
+        ),
         region_name="us-west-2",
         json_format="auto",
+        use_manifest=redshift,
+        table_name="staging_songs",
+        connection_type=CONFIG.CONNECTION_TYPE,
+        post_copy_stmts=[SQL_QUERIES.STAGING_SONGS_SONG_KEY_UPDATE],
+        copy_options=(
+            {"compression": "gzip", "compupdate": False, "statupdate": False}
+            if redshift
+            else {}
+        ),
+        check_slices=redshift,
+        deferrable=CONFIG.DEFERRABLE,
     )
 
     load_songplays_fact_table = LoadFactOperator(
         task_id="load_songplays_fact_table",
-        db_connection_id="redshift",
+        db_connection_id=CONFIG.DB_CONNECTION_ID,
         insert_fact_stmt=SQL_QUERIES.SONGPLAY_TABLE_INSERT,
-        connection_type="Redshift",
+        connection_type=CONFIG.CONNECTION_TYPE,
+        incremental=True,
+        incremental_fact_stmt=SQL_QUERIES.SONGPLAY_TABLE_INCREMENTAL_INSERT,
+        deferrable=CONFIG.DEFERRABLE,
     )
 
-    load_user_dimension_table = LoadDimensionOperator(
-        task_id="load_user_dim_table",
-        db_connection_id="redshift",
-        insert_dim_stmt=SQL_QUERIES.USER_TABLE_INSERT,
-        connection_type="Redshift",
+    # One task loads all four dimensions concurrently; each load is short,
+    # so separate tasks would spend more time scheduling than in SQL.
+    load_dimension_tables = LoadDimensionsOperator(
+        task_id="load_dimension_tables",
+        db_connection_id=CONFIG.DB_CONNECTION_ID,
+        connection_type=CONFIG.CONNECTION_TYPE,
+        deferrable=CONFIG.DEFERRABLE,
+        dimensions=[
+            {
+                "table_name": "users",
+                "insert_dim_stmt": SQL_QUERIES.USER_TABLE_INSERT,
+                "load_mode": "merge",
+                "select_dim_stmt": SQL_QUERIES.USER_TABLE_SELECT,
+                "primary_key": ["userid"],
+            },
+            {
+                "table_name": "songs",
+                "insert_dim_stmt": SQL_QUERIES.SONG_TABLE_INSERT,
+                "load_mode": "merge",
+                "select_dim_stmt": SQL_QUERIES.SONG_TABLE_SELECT,
+                "primary_key": ["songid"],
+            },
+            {
+                "table_name": "artists",
+                "insert_dim_stmt": SQL_QUERIES.ARTIST_TABLE_INSERT,
+                "load_mode": "merge",
+                "select_dim_stmt": SQL_QUERIES.ARTIST_TABLE_SELECT,
+                "primary_key": ["artistid"],
+            },
+            {
+                "table_name": "time",
+                "insert_dim_stmt": SQL_QUERIES.TIME_TABLE_INCREMENTAL_INSERT,
+                "load_mode": "incremental",
+            },
+        ],
     )
 
-    load_song_dimension_table = LoadDimensionOperator(
-        task_id="load_song_dim_table",
-        db_connection_id="redshift",
-        insert_dim_stmt=SQL_QUERIES.SONG_TABLE_INSERT,
-        connection_type="Redshift",
+    refresh_rollups = RefreshRollupsOperator(
+        task_id="refresh_rollups",
+        db_connection_id=CONFIG.DB_CONNECTION_ID,
+        connection_type=CONFIG.CONNECTION_TYPE,
+        rollups=[
+            {
+                "table_name": "user_daily_plays",
+                "grain": "day",
+                "bucket_column": "play_date",
+                "insert_stmt": SQL_QUERIES.USER_DAILY_PLAYS_INSERT,
+            },
+            {
+                "table_name": "song_hourly_plays",
+                "grain": "hour",
+                "bucket_column": "play_hour",
+                "insert_stmt": SQL_QUERIES.SONG_HOURLY_PLAYS_INSERT,
+            },
+            {
+                "table_name": "artist_hourly_plays",
+                "grain": "hour",
+                "bucket_column": "play_hour",
+                "insert_stmt": SQL_QUERIES.ARTIST_HOURLY_PLAYS_INSERT,
+            },
+        ],
     )
 
-    load_artist_dimension_table = LoadDimensionOperator(
-        task_id="load_artist_dim_table",
-        db_connection_id="redshift",
-        insert_dim_stmt=SQL_QUERIES.ARTIST_TABLE_INSERT,
-        connection_type="Redshift",
+    run_quality_checks = DataQualityOperator(
+        task_id="run_quality_checks",
+        db_connection_id=CONFIG.DB_CONNECTION_ID,
+        table_names=CONFIG.TABLE_NAMES,
+        connection_type=CONFIG.CONNECTION_TYPE,
+        batch_mode="union",
+        rules=CONFIG.DATA_QUALITY_RULES,
+        profiles=CONFIG.DATA_QUALITY_PROFILES,
+        on_drift="warn",
+        deferrable=CONFIG.DEFERRABLE,
     )
 
-    load_time_dimension_table = LoadDimensionOperator(
-        task_id="load_time_dim_table",
-        db_connection_id="redshift",
-        insert_dim_stmt=SQL_QUERIES.TIME_TABLE_INSERT,
-        connection_type="Redshift",
+    maintain_tables = TableMaintenanceOperator(
+        task_id="maintain_tables",
+        db_connection_id=CONFIG.DB_CONNECTION_ID,
+        table_names=CONFIG.TABLE_NAMES + CONFIG.ROLLUP_TABLE_NAMES,
+        connection_type=CONFIG.CONNECTION_TYPE,
     )
 
-    run_quality_checks = DataQualityOperator(
-        task_id="run_quality_checks",
-        db_connection_id="redshift",
-        table_names=CONFIG.TABLE_NAMES,
-        connection_type="Redshift",
-        data_quality_sql=SQL_QUERIES.DATA_QUALITY_CHECK
+    # Parquet exports for downstream readers, so their queries do not compete
+    # with the ETL for WLM slots: snapshots of the dimensions, and the plays
+    # and times of the run's hours into their own partitions.
+    export_star_schema = UnloadToS3Operator(
+        task_id="export_star_schema",
+        db_connection_id=CONFIG.DB_CONNECTION_ID,
+        bucket_name=s3_bucket_name,
+        iam_role=iam_role_arn,
+        s3_prefix=CONFIG.EXPORT_S3_KEY,
+        exports=[
+            {
+                "name": "songplays",
+                "query": SQL_QUERIES.SONGPLAY_EXPORT_SELECT,
+                "partition_by": ["year", "month", "day", "hour"],
+                "interval_column": "start_time",
+            },
+            {"name": "users", "table": "users"},
+            {"name": "songs", "table": "songs"},
+            {"name": "artists", "table": "artists"},
+            {
+                "name": "time",
+                "table": "time",
+                "partition_by": ["year", "month", "day", "hour"],
+                "interval_column": "start_time",
+            },
+        ],
+        max_file_size_mb=256,
+        manifest=True,
+        connection_type=CONFIG.CONNECTION_TYPE,
     )
 
     end_execution = DummyOperator(task_id="end_execution")
 
-    begin_execution >> create_tables
+    begin_execution >> check_new_data >> create_tables
 
-    create_tables >> [stage_events_to_redshift, stage_songs_to_redshift]
+    create_tables >> [log_data_days, compact_song_data]
+    compact_song_data >> stage_songs_to_redshift
     [stage_events_to_redshift, stage_songs_to_redshift] >> load_songplays_fact_table
 
-    load_songplays_fact_table >> load_user_dimension_table
-    load_songplays_fact_table >> load_song_dimension_table
-    load_songplays_fact_table >> load_artist_dimension_table
-    load_songplays_fact_table >> load_time_dimension_table
+    load_songplays_fact_table >> load_dimension_tables >> refresh_rollups
+    refresh_rollups >> run_quality_checks
 
-    [
-        load_user_dimension_table,
-        load_song_dimension_table,
-        load_artist_dimension_table,
-        load_time_dimension_table,
-    ] >> run_quality_checks
-
-    run_quality_checks >> end_execution
+    run_quality_checks >> [maintain_tables, export_star_schema] >> end_execution
 
 
 FINAL_PROJECT_DAG = final_project()
+
+if __name__ == "__main__":
+    FINAL_PROJECT_DAG.test()
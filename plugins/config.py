@@ -1,5 +1,14 @@
 """Configuration variables for ETL process"""
-from typing import List
+import os
+from typing import Any, Dict, List
+
+# "Redshift", or "DuckDB" to run the whole pipeline on the embedded backend
+# against local copies of the S3 data.
+CONNECTION_TYPE: str = os.environ.get("ETL_CONNECTION_TYPE", "Redshift")
+DB_CONNECTION_ID: str = "duckdb" if CONNECTION_TYPE == "DuckDB" else "redshift"
+# Run the long COPY, INSERT and check statements through the Redshift Data
+# API and free the worker while they run. Needs a running triggerer.
+DEFERRABLE: bool = os.environ.get("ETL_DEFERRABLE", "").lower() == "true"
 
 TABLE_NAMES: List[str] = [
     "staging_events",
@@ -10,3 +19,85 @@ TABLE_NAMES: List[str] = [
     "artists",
     "time",
 ]
+
+# Aggregates of songplays kept up to date by RefreshRollupsOperator.
+ROLLUP_TABLE_NAMES: List[str] = [
+    "user_daily_plays",
+    "song_hourly_plays",
+    "artist_hourly_plays",
+]
+
+SONG_DATA_S3_KEY: str = "song-data/"
+LOG_DATA_S3_KEY: str = "log-data/"
+# Where CompactS3FilesOperator writes the compacted song data, in the
+# project bucket.
+SONG_DATA_COMPACTED_S3_KEY: str = "song-data-compacted/"
+# Where UnloadToS3Operator writes the Parquet exports of the star schema.
+EXPORT_S3_KEY: str = "exports/"
+
+# Rendered once per day of a run's data interval, e.g.
+# ``log-data/2018/11/2018-11-01`` matches ``2018-11-01-events.json``.
+LOG_DATA_PARTITION_TEMPLATE: str = "log-data/{year}/{month:02d}/{ds}"
+
+# The pool capping how many staging shards COPY at once, created with e.g.
+# ``airflow pools set redshift_staging 4 "Staging COPY shards"``.
+STAGING_POOL: str = "redshift_staging"
+
+# Declarative data quality rules per table, checked with one scan per table.
+DATA_QUALITY_RULES: Dict[str, List[Dict[str, Any]]] = {
+    "songplays": [
+        {"rule": "unique", "column": "playid"},
+        {"rule": "null_rate", "column": "start_time"},
+        {"rule": "null_rate", "column": "userid"},
+    ],
+    "users": [
+        {"rule": "unique", "column": "userid"},
+        {"rule": "null_rate", "column": "userid"},
+    ],
+    "songs": [
+        {"rule": "unique", "column": "songid"},
+    ],
+    "artists": [
+        {"rule": "unique", "column": "artistid"},
+    ],
+    "time": [
+        {"rule": "unique", "column": "start_time"},
+        {"rule": "range", "column": "hour", "min": 0, "max": 23},
+    ],
+}
+
+# Approximate metrics profiled per table by DataQualityOperator, and checked
+# for drift against the trailing average of earlier runs. Every profile also
+# holds the row count. Null fractions are small, so they get a wider
+# tolerance.
+DATA_QUALITY_PROFILES: Dict[str, List[Dict[str, Any]]] = {
+    "staging_events": [
+        {"metric": "approx_distinct", "column": "userid"},
+        {"metric": "null_fraction", "column": "song", "tolerance": 1.0},
+        {"metric": "percentile", "column": "length", "fraction": 0.5},
+    ],
+    "staging_songs": [
+        {"metric": "approx_distinct", "column": "artist_id"},
+        {"metric": "percentile", "column": "duration", "fraction": 0.5},
+    ],
+    "songplays": [
+        {"metric": "approx_distinct", "column": "userid"},
+        {"metric": "approx_distinct", "column": "sessionid"},
+        {"metric": "null_fraction", "column": "songid", "tolerance": 1.0},
+        {"metric": "null_fraction", "column": "artistid", "tolerance": 1.0},
+    ],
+    "users": [
+        {"metric": "null_fraction", "column": "gender", "tolerance": 1.0},
+    ],
+    "songs": [
+        {"metric": "approx_distinct", "column": "artistid"},
+        {"metric": "percentile", "column": "duration", "fraction": 0.5},
+        {"metric": "percentile", "column": "duration", "fraction": 0.95},
+    ],
+    "artists": [
+        {"metric": "null_fraction", "column": "location", "tolerance": 1.0},
+    ],
+    "time": [
+        {"metric": "approx_distinct", "column": "weekday"},
+    ],
+}
@@ -0,0 +1,84 @@
+"""Rendering and validation of Redshift COPY tuning options"""
+
+from typing import Any, Dict, List
+
+COMPRESSIONS = ("GZIP", "ZSTD", "BZIP2", "LZOP")
+
+# The options accepted by render_copy_options, with the type of their value.
+COPY_OPTION_TYPES: Dict[str, type] = {
+    "compression": str,
+    "compupdate": bool,
+    "statupdate": bool,
+    "maxerror": int,
+    "truncatecolumns": bool,
+    "acceptinvchars": str,
+    "blanksasnull": bool,
+    "emptyasnull": bool,
+}
+
+
+def render_copy_options(options: Dict[str, Any]) -> str:
+    """Render COPY options into the clauses that follow the data format.
+
+    Parameters
+    ----------
+    options : Dict[str, Any]
+        Any of:
+
+        - ``compression``: one of COMPRESSIONS, for compressed input files.
+        - ``compupdate``: False turns off automatic compression analysis,
+          which only pays off on the first load into an empty table.
+        - ``statupdate``: False skips the statistics update after the load.
+        - ``maxerror``: the number of bad records tolerated.
+        - ``truncatecolumns``: truncate values longer than their column.
+        - ``acceptinvchars``: the single character invalid UTF-8 is replaced
+          with.
+        - ``blanksasnull``, ``emptyasnull``: load blank or empty strings as
+          NULL.
+
+    Returns
+    -------
+    str
+        The clauses, separated by newlines.
+    """
+    clauses: List[str] = []
+
+    for name, value in options.items():
+        if name not in COPY_OPTION_TYPES:
+            raise ValueError(
+                f"Unknown COPY option {name}, expected one of "
+                f"{tuple(COPY_OPTION_TYPES)}."
+            )
+
+        # bool is a subclass of int, so it must not pass for maxerror.
+        expected = COPY_OPTION_TYPES[name]
+
+        if not isinstance(value, expected) or (
+            expected is int and isinstance(value, bool)
+        ):
+            raise ValueError(
+                f"COPY option {name} must be a {expected.__name__}, got {value!r}."
+            )
+
+        if name == "compression":
+            if value.upper() not in COMPRESSIONS:
+                raise ValueError(
+                    f"Unknown compression {value}, expected one of {COMPRESSIONS}."
+                )
+            clauses.append(value.upper())
+        elif name in ("compupdate", "statupdate"):
+            clauses.append(f"{name.upper()} {'ON' if value else 'OFF'}")
+        elif name == "maxerror":
+            if value < 0:
+                raise ValueError(f"COPY option maxerror must be >= 0, got {value}.")
+            clauses.append(f"MAXERROR {value}")
+        elif name == "acceptinvchars":
+            if len(value) != 1 or value == "'":
+                raise ValueError(
+                    f"COPY option acceptinvchars must be one character, got {value!r}."
+                )
+            clauses.append(f"ACCEPTINVCHARS AS '{value}'")
+        elif value:
+            clauses.append(name.upper())
+
+    return "\n".join(clauses)
@@ -0,0 +1,466 @@
+"""Deferred statement execution through the Redshift Data API.
+
+A deferrable operator submits its statements with ``submit_statements``,
+which returns at once, and defers to ``RedshiftStatementTrigger``. The
+trigger polls ``describe_statement`` from the triggerer until every
+statement has finished, so no worker slot or database connection is held
+while Redshift runs them, and the task resumes in ``execute_complete``.
+
+Every statement list is submitted as one ``batch_execute_statement``, which
+Redshift runs in a single transaction, and which takes at most
+``MAX_BATCH_STATEMENTS`` statements. Several lists run concurrently.
+
+``data_api_client`` returns the boto3 ``redshift-data`` client, or for
+"DuckDB" connections the ``LocalDataAPI`` stand-in of ``local_backend``,
+which answers the same calls from the embedded backend.
+"""
+
+import asyncio
+import functools
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from airflow.exceptions import AirflowException
+from airflow.hooks.base import BaseHook
+from airflow.triggers.base import BaseTrigger, TriggerEvent
+
+from helpers.query_metrics import publish_metrics
+
+FAILED_STATUSES = ("FAILED", "ABORTED")
+NUMERIC_TYPES = ("numeric", "decimal")
+# The most statements batch_execute_statement accepts in one call.
+MAX_BATCH_STATEMENTS = 40
+
+
+class DataAPIStatementError(Exception):
+    """Raised when a statement submitted through the Data API fails"""
+
+
+def data_api_client(
+    db_connection_id: str,
+    connection_type: str = "Redshift",
+    aws_connection_id: str = "aws_default",
+) -> Any:
+    """Return the client to submit and poll statements with.
+
+    Parameters
+    ----------
+    db_connection_id : str
+        The ID of the database connection to use.
+    connection_type : str, optional
+        "DuckDB" returns the local stand-in; anything else the boto3
+        ``redshift-data`` client. Defaults to "Redshift".
+    aws_connection_id : str, optional
+        The ID of the AWS connection the boto3 client uses. Defaults to
+        "aws_default".
+
+    Returns
+    -------
+    Any
+        An object with the ``redshift-data`` client's methods.
+    """
+    # pylint: disable=import-outside-toplevel
+    if connection_type == "DuckDB":
+        from helpers.local_backend import LocalDataAPI
+
+        return LocalDataAPI(db_connection_id)
+
+    from airflow.providers.amazon.aws.hooks.redshift_data import RedshiftDataHook
+
+    return RedshiftDataHook(aws_conn_id=aws_connection_id).conn
+
+
+def statement_target(db_connection_id: str) -> Dict[str, str]:
+    """Read where to run statements from the database connection.
+
+    The cluster is the first label of the connection's host, the database its
+    schema and the user its login. The extras ``cluster_identifier``,
+    ``workgroup_name`` for Redshift Serverless, ``database``, ``db_user`` and
+    ``secret_arn`` take precedence.
+
+    Parameters
+    ----------
+    db_connection_id : str
+        The ID of the database connection to use.
+
+    Returns
+    -------
+    Dict[str, str]
+        The keyword arguments identifying the cluster, database and
+        credentials in Data API calls.
+    """
+    conn = BaseHook.get_connection(db_connection_id)
+    extra = conn.extra_dejson
+    target = {"Database": extra.get("database") or conn.schema}
+
+    if extra.get("workgroup_name"):
+        target["WorkgroupName"] = extra["workgroup_name"]
+    else:
+        target["ClusterIdentifier"] = extra.get("cluster_identifier") or (
+            conn.host or ""
+        ).split(".")[0]
+
+    if extra.get("secret_arn"):
+        target["SecretArn"] = extra["secret_arn"]
+    elif "ClusterIdentifier" in target:
+        target["DbUser"] = extra.get("db_user") or conn.login
+
+    return target
+
+
+def submit_statements(
+    client: Any, target: Dict[str, str], statements: List[str], name: str
+) -> str:
+    """Submit statements to run in one transaction, without waiting.
+
+    Parameters
+    ----------
+    client : Any
+        The client returned by ``data_api_client``.
+    target : Dict[str, str]
+        The cluster, database and credentials from ``statement_target``.
+    statements : List[str]
+        The statements, in order, at most ``MAX_BATCH_STATEMENTS``.
+    name : str
+        The statement name shown in the Redshift console.
+
+    Returns
+    -------
+    str
+        The statement ID to poll.
+    """
+    if len(statements) > MAX_BATCH_STATEMENTS:
+        raise ValueError(
+            f"{name} has {len(statements)} statements, but the Data API runs at "
+            f"most {MAX_BATCH_STATEMENTS} in one transaction."
+        )
+
+    if len(statements) == 1:
+        response = client.execute_statement(
+            Sql=statements[0], StatementName=name, **target
+        )
+    else:
+        response = client.batch_execute_statement(
+            Sqls=statements, StatementName=name, **target
+        )
+
+    return response["Id"]
+
+
+def _field_value(field: Dict[str, Any], column: Dict[str, Any]) -> Any:
+    """Convert one field of ``get_statement_result`` to a Python value."""
+    if field.get("isNull"):
+        return None
+
+    value = next(iter(field.values()))
+
+    if column.get("typeName", "").lower() in NUMERIC_TYPES:
+        return Decimal(value)
+
+    return value
+
+
+def statement_rows(client: Any, statement_id: str) -> List[Tuple[Any, ...]]:
+    """Fetch every result row of a finished statement.
+
+    Parameters
+    ----------
+    client : Any
+        The client returned by ``data_api_client``.
+    statement_id : str
+        The ID of a single statement, or of a statement within a batch,
+        such as the ``result_id`` of a trigger event.
+
+    Returns
+    -------
+    List[Tuple[Any, ...]]
+        The rows, as ``PostgresHook.get_records`` returns them.
+    """
+    rows = []
+    kwargs = {"Id": statement_id}
+
+    while True:
+        response = client.get_statement_result(**kwargs)
+        columns = response["ColumnMetadata"]
+
+        rows.extend(
+            tuple(
+                _field_value(field, column) for field, column in zip(record, columns)
+            )
+            for record in response["Records"]
+        )
+
+        if not response.get("NextToken"):
+            return rows
+
+        kwargs["NextToken"] = response["NextToken"]
+
+
+class RedshiftStatementTrigger(BaseTrigger):
+    """Trigger that waits for statements submitted through the Data API.
+
+    Polls ``describe_statement`` for every statement until all of them have
+    finished, failed or been aborted, then fires one event with the outcome
+    of each, in order: ``{"status": "success" | "error", "statements":
+    [{"id", "result_id", "sql", "status", "error", "duration", "rows",
+    "query_id"}, ...]}``.
+
+    Parameters
+    ----------
+    statement_ids : List[str]
+        The IDs returned by ``submit_statements``.
+    db_connection_id : str
+        The ID of the database connection the statements run on.
+    connection_type : str, optional
+        The type of database connection, passed to ``data_api_client``.
+        Defaults to "Redshift".
+    aws_connection_id : str, optional
+        The ID of the AWS connection to poll with. Defaults to
+        "aws_default".
+    poll_interval : float, optional
+        The seconds between two polls. Defaults to 15.
+    """
+
+    def __init__(
+        self,
+        statement_ids: List[str],
+        db_connection_id: str,
+        connection_type: str = "Redshift",
+        aws_connection_id: str = "aws_default",
+        poll_interval: float = 15.0,
+    ):
+        super().__init__()
+        self.statement_ids = statement_ids
+        self.db_connection_id = db_connection_id
+        self.connection_type = connection_type
+        self.aws_connection_id = aws_connection_id
+        self.poll_interval = poll_interval
+
+    def serialize(self) -> Tuple[str, Dict[str, Any]]:
+        return (
+            "helpers.data_api.RedshiftStatementTrigger",
+            {
+                "statement_ids": self.statement_ids,
+                "db_connection_id": self.db_connection_id,
+                "connection_type": self.connection_type,
+                "aws_connection_id": self.aws_connection_id,
+                "poll_interval": self.poll_interval,
+            },
+        )
+
+    async def run(self) -> AsyncIterator[TriggerEvent]:
+        client = data_api_client(
+            self.db_connection_id, self.connection_type, self.aws_connection_id
+        )
+        loop = asyncio.get_running_loop()
+        outcomes: Dict[str, Dict[str, Any]] = {}
+
+        while True:
+            for statement_id in self.statement_ids:
+                if statement_id in outcomes:
+                    continue
+
+                # boto3 blocks, so it runs off the triggerer's event loop.
+                response = await loop.run_in_executor(
+                    None, functools.partial(client.describe_statement, Id=statement_id)
+                )
+                status = response["Status"]
+
+                if status == "FINISHED" or status in FAILED_STATUSES:
+                    # A batch describes its statements in SubStatements.
+                    sub_statements = response.get("SubStatements", [])
+                    sql = response.get("QueryString") or "; ".join(
+                        sub.get("QueryString", "") for sub in sub_statements
+                    )
+                    outcomes[statement_id] = {
+                        "id": statement_id,
+                        # The rows of a batch are those of its last statement.
+                        "result_id": (
+                            sub_statements[-1]["Id"] if sub_statements else statement_id
+                        ),
+                        "sql": " ".join(sql.split())[:200],
+                        "status": status,
+                        "error": response.get("Error"),
+                        "duration": response.get("Duration", 0) / 1e9,
+                        "rows": response.get("ResultRows", -1),
+                        "query_id": response.get("RedshiftQueryId"),
+                    }
+
+            if len(outcomes) == len(self.statement_ids):
+                break
+
+            await asyncio.sleep(self.poll_interval)
+
+        statements = [outcomes[statement_id] for statement_id in self.statement_ids]
+        failed = any(outcome["status"] in FAILED_STATUSES for outcome in statements)
+
+        yield TriggerEvent(
+            {"status": "error" if failed else "success", "statements": statements}
+        )
+
+
+class DataAPIMixin:
+    """Runs an operator's statements through the Data API and defers.
+
+    Mixed into operators that set ``_db_connection_id``, ``_connection_type``,
+    ``_aws_connection_id``, ``_poll_interval`` and ``_session_stmts``.
+    ``defer_statements`` submits one transaction per statement list, led by
+    the session statements, and defers the task, which resumes in
+    ``execute_complete``.
+    """
+
+    def fits_in_batch(self, statements: List[str]) -> bool:
+        """Return whether the statements, with the session's, fit in a batch.
+
+        Parameters
+        ----------
+        statements : List[str]
+            The statements of one transaction.
+
+        Returns
+        -------
+        bool
+            True if ``defer_statements`` can submit them as one batch.
+        """
+        return len(self._session_stmts) + len(statements) <= MAX_BATCH_STATEMENTS
+
+    def defer_statements(
+        self, batches: List[List[str]], method_name: str = "execute_complete"
+    ) -> None:
+        """Submit every statement list and defer until all have finished.
+
+        Parameters
+        ----------
+        batches : List[List[str]]
+            The statement lists, each run in its own transaction.
+        method_name : str, optional
+            The method the task resumes in. Defaults to "execute_complete".
+        """
+        # Checked up front, so that no list is submitted if one cannot be.
+        for statements in batches:
+            if not self.fits_in_batch(statements):
+                raise ValueError(
+                    f"{self.task_id} would submit "
+                    f"{len(self._session_stmts) + len(statements)} statements, "
+                    "with the session's, but the Data API runs at most "
+                    f"{MAX_BATCH_STATEMENTS} in one transaction."
+                )
+
+        client = data_api_client(
+            self._db_connection_id, self._connection_type, self._aws_connection_id
+        )
+        target = statement_target(self._db_connection_id)
+        statement_ids = []
+
+        for index, statements in enumerate(batches):
+            for statement in statements:
+                self.log.info("Submitting SQL: %s", statement)
+
+            # Every Data API call runs in a session of its own.
+            statement_ids.append(
+                submit_statements(
+                    client,
+                    target,
+                    list(self._session_stmts) + list(statements),
+                    f"{self.task_id}-{index}",
+                )
+            )
+
+        self.log.info(
+            "Submitted %s statements to %s, deferring.",
+            len(statement_ids),
+            self._connection_type,
+        )
+
+        self.defer(
+            trigger=RedshiftStatementTrigger(
+                statement_ids,
+                self._db_connection_id,
+                self._connection_type,
+                self._aws_connection_id,
+                self._poll_interval,
+            ),
+            method_name=method_name,
+            timeout=self.execution_timeout,
+        )
+
+    def publish_event(
+        self, context: Dict[str, Any], event: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        """Push the trigger event's statement timings as query metrics.
+
+        Raises AirflowException when the task resumed without an event.
+
+        Parameters
+        ----------
+        context : Dict[str, Any]
+            The Airflow execution context containing information about the
+            current execution.
+        event : Dict[str, Any]
+            The event fired by ``RedshiftStatementTrigger``.
+
+        Returns
+        -------
+        List[Dict[str, Any]]
+            The outcome of each statement, in submission order.
+        """
+        if event is None:
+            raise AirflowException(
+                f"{self.task_id} resumed without an event from its trigger."
+            )
+
+        statements = event["statements"]
+
+        for outcome in statements:
+            self.log.info(
+                "Statement %s %s in %.2fs.",
+                outcome["id"],
+                outcome["status"],
+                outcome["duration"],
+            )
+
+        publish_metrics(
+            context,
+            [
+                {
+                    "sql": outcome["sql"],
+                    "wall_time": outcome["duration"],
+                    "rows": outcome["rows"],
+                    "query_id": outcome["query_id"],
+                    "queue_time": None,
+                    "exec_time": None,
+                }
+                for outcome in statements
+            ],
+        )
+
+        return statements
+
+    def execute_complete(
+        self, context: Dict[str, Any], event: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Resume after the trigger fired, failing if any statement failed.
+
+        Parameters
+        ----------
+        context : Dict[str, Any]
+            The Airflow execution context containing information about the
+            current execution.
+        event : Dict[str, Any], optional
+            The event fired by ``RedshiftStatementTrigger``.
+        """
+        statements = self.publish_event(context, event)
+        failed = [
+            outcome for outcome in statements if outcome["status"] in FAILED_STATUSES
+        ]
+
+        if failed:
+            raise DataAPIStatementError(
+                "Statements failed: "
+                + "; ".join(
+                    f"{outcome['id']}: {outcome['error']}" for outcome in failed
+                )
+                + "."
+            )
+
+        self.log.info("Statements completed in %s.", self._connection_type)
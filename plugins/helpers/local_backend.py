@@ -0,0 +1,636 @@
+"""Embedded DuckDB backend for running the pipeline without Redshift or S3.
+
+``DuckDBHook`` hands out DB-API style connections to a local DuckDB file and
+translates the Redshift SQL of ``sql_queries`` as it runs:
+
+- ``COPY ... FROM 's3://bucket/key' ... FORMAT AS JSON`` becomes an INSERT
+  from a scan of the local files under ``{s3_root}/bucket/key``, mapping the
+  fields with the jsonpaths file, or by column name for "auto", into the
+  COPY's column list or else all of the table's columns.
+- ``UNLOAD ('...') TO 's3://bucket/key' ... PARTITION BY (...)`` becomes a
+  COPY of the query to Parquet files under ``{s3_root}/bucket/key``.
+- Distribution and sort keys and informational constraints are left out of
+  CREATE TABLE, since DuckDB would enforce the constraints.
+- The handful of Redshift-only expressions in the star schema queries are
+  rewritten to their DuckDB equivalents.
+
+``LocalDataAPI`` answers the Redshift Data API calls of the deferrable
+operators from the same database, and ``LocalS3Hook`` lists the files under
+``s3_root`` the way S3 lists a bucket.
+
+The hook reads its settings from the extras of an Airflow connection, e.g.::
+
+    AIRFLOW_CONN_DUCKDB='{"conn_type": "generic", "extra":
+        {"database": "/tmp/etl.duckdb", "s3_root": "/data/s3"}}'
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from airflow.hooks.base import BaseHook
+
+COPY_PATTERN = re.compile(
+    r"^\s*COPY\s+(?P<table>\w+)(?:\s*\((?P<columns>[^)]*)\))?"
+    r"\s+FROM\s+'(?P<source>[^']+)'.*?"
+    r"FORMAT\s+AS\s+JSON\s+'(?P<json_format>[^']+)'(?P<options>.*?);?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+UNLOAD_PATTERN = re.compile(
+    r"^\s*UNLOAD\s*\(\s*'(?P<query>(?:[^']|'')*)'\s*\)\s*"
+    r"TO\s+'(?P<target>[^']+)'(?P<options>.*?);?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+PARTITION_PATTERN = re.compile(
+    r"PARTITION\s+BY\s*\((?P<columns>[^)]*)\)", re.IGNORECASE
+)
+EPOCH_PATTERN = re.compile(
+    r"TIMESTAMP\s+'epoch'\s*\+\s*(\w+)\s*/\s*1000\s*\*\s*interval\s+'1 second'",
+    re.IGNORECASE,
+)
+APPROX_DISTINCT_PATTERN = re.compile(
+    r"APPROXIMATE\s+COUNT\s*\(\s*DISTINCT\s+([^)]+)\)", re.IGNORECASE
+)
+APPROX_PERCENTILE_PATTERN = re.compile(
+    r"APPROXIMATE\s+PERCENTILE_DISC\s*\(\s*([\d.]+)\s*\)\s*"
+    r"WITHIN\s+GROUP\s*\(\s*ORDER\s+BY\s+([^)]+)\)",
+    re.IGNORECASE,
+)
+# Both are the start of the transaction, as Redshift's SYSDATE.
+SYSDATE_PATTERN = re.compile(r"\bSYSDATE\b", re.IGNORECASE)
+LIKE_PATTERN = re.compile(
+    r"CREATE\s+TEMP\s+TABLE\s+(\w+)\s+\(LIKE\s+(\w+)\)", re.IGNORECASE
+)
+LAYOUT_PATTERN = re.compile(
+    r"^\s*(DISTSTYLE|DISTKEY|SORTKEY|COMPOUND\s+SORTKEY|INTERLEAVED\s+SORTKEY)\b.*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+CONSTRAINT_PATTERN = re.compile(r",\s*\n\s*CONSTRAINT\s[^\n]*", re.IGNORECASE)
+JSONPATH_KEY_PATTERN = re.compile(r"^\$\[['\"](.+)['\"]\]$|^\$\.(.+)$")
+DML_PATTERN = re.compile(r"^\s*(INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+NAMED_PARAMETER_PATTERN = re.compile(r"%\((\w+)\)s")
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _local_path(url: str, s3_root: str) -> str:
+    """Map ``s3://bucket/key`` to ``{s3_root}/bucket/key``."""
+    if not url.startswith("s3://"):
+        return url
+
+    return os.path.join(s3_root, url[len("s3://") :])
+
+
+def _local_files(prefix: str) -> List[str]:
+    """List the files whose path starts with ``prefix``, like an S3 prefix."""
+    directory = prefix if prefix.endswith(os.sep) else os.path.dirname(prefix)
+    files = []
+
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+
+            if path.startswith(prefix):
+                files.append(path)
+
+    return sorted(files)
+
+
+def _json_field(jsonpath: str) -> str:
+    """Rewrite a Redshift jsonpath into one DuckDB's json functions accept."""
+    match = JSONPATH_KEY_PATTERN.match(jsonpath.strip())
+
+    if not match:
+        raise ValueError(f"Unsupported jsonpath {jsonpath}.")
+
+    key = match.group(1) or match.group(2)
+
+    return '$."' + key.replace('"', '\\"') + '"'
+
+
+def translate_copy(
+    match: "re.Match[str]", s3_root: str, table_columns: Callable[[str], List[str]]
+) -> str:
+    """Translate a matched COPY statement into an INSERT from local files.
+
+    Parameters
+    ----------
+    match : re.Match[str]
+        The COPY_PATTERN match.
+    s3_root : str
+        The local directory that stands in for S3.
+    table_columns : Callable[[str], List[str]]
+        Returns the columns of a table, in order.
+
+    Returns
+    -------
+    str
+        The INSERT statement.
+    """
+    table = match.group("table")
+    source = _local_path(match.group("source"), s3_root)
+
+    if re.search(r"\bMANIFEST\b", match.group("options"), re.IGNORECASE):
+        with open(source, encoding="utf-8") as manifest:
+            files = [
+                _local_path(entry["url"], s3_root)
+                for entry in json.load(manifest)["entries"]
+            ]
+    else:
+        files = _local_files(source)
+
+    if not files:
+        raise FileNotFoundError(f"No local files under {source} for {table}.")
+
+    columns = (
+        [column.strip() for column in match.group("columns").split(",")]
+        if match.group("columns")
+        else table_columns(table)
+    )
+    json_format = match.group("json_format")
+
+    if json_format.lower() == "auto":
+        names = [column.strip('"') for column in columns]
+        fields = [f'$."{name}"' for name in names]
+    else:
+        with open(_local_path(json_format, s3_root), encoding="utf-8") as paths:
+            fields = [_json_field(path) for path in json.load(paths)["jsonpaths"]]
+
+    # Redshift loads empty JSON strings into numeric columns as NULL.
+    selects = ",\n    ".join(
+        f"NULLIF(json_extract_string(json, {_literal(field)}), '')" for field in fields
+    )
+    file_list = ", ".join(_literal(path) for path in files)
+
+    return (
+        f"INSERT INTO {table} ({', '.join(columns[: len(fields)])})\n"
+        f"SELECT\n    {selects}\n"
+        f"FROM read_json_objects([{file_list}], format = 'unstructured');"
+    )
+
+
+def translate_unload(
+    match: "re.Match[str]", s3_root: str, table_columns: Callable[[str], List[str]]
+) -> str:
+    """Translate a matched UNLOAD statement into a COPY to local Parquet.
+
+    Partitioned exports are written as ``column=value/`` directories under
+    the target, like Redshift's, and unpartitioned ones as a single file.
+    With CLEANPATH, any existing files are removed first; without it, only
+    the partitions written are replaced, as with ALLOWOVERWRITE.
+
+    Parameters
+    ----------
+    match : re.Match[str]
+        The UNLOAD_PATTERN match.
+    s3_root : str
+        The local directory that stands in for S3.
+    table_columns : Callable[[str], List[str]]
+        Returns the columns of a table, in order.
+
+    Returns
+    -------
+    str
+        The COPY statement.
+    """
+    query = translate_sql(
+        match.group("query").replace("''", "'"), s3_root, table_columns
+    )
+    target = _local_path(match.group("target"), s3_root)
+    partition = PARTITION_PATTERN.search(match.group("options"))
+
+    if partition:
+        overwrite = (
+            "OVERWRITE"
+            if re.search(r"\bCLEANPATH\b", match.group("options"), re.IGNORECASE)
+            else "OVERWRITE_OR_IGNORE"
+        )
+        options = (
+            f"FORMAT PARQUET, PARTITION_BY ({partition.group('columns')}), "
+            f"{overwrite} true"
+        )
+    else:
+        if target.endswith("/"):
+            target += "0000_part_00.parquet"
+
+        options = "FORMAT PARQUET"
+
+    os.makedirs(os.path.dirname(target.rstrip("/")), exist_ok=True)
+
+    return f"COPY ({query.rstrip().rstrip(';')}) TO {_literal(target)} ({options});"
+
+
+def translate_sql(
+    sql: str, s3_root: str, table_columns: Callable[[str], List[str]]
+) -> str:
+    """Translate a Redshift statement into DuckDB SQL.
+
+    Parameters
+    ----------
+    sql : str
+        The Redshift statement.
+    s3_root : str
+        The local directory that stands in for S3.
+    table_columns : Callable[[str], List[str]]
+        Returns the columns of a table, in order.
+
+    Returns
+    -------
+    str
+        The DuckDB statement.
+    """
+    copy_match = COPY_PATTERN.match(sql)
+
+    if copy_match:
+        return translate_copy(copy_match, s3_root, table_columns)
+
+    unload_match = UNLOAD_PATTERN.match(sql)
+
+    if unload_match:
+        return translate_unload(unload_match, s3_root, table_columns)
+
+    sql = LAYOUT_PATTERN.sub("", sql)
+    sql = CONSTRAINT_PATTERN.sub("", sql)
+    # Integer division, so start times stay truncated to the second.
+    sql = EPOCH_PATTERN.sub(r"epoch_ms(\1 // 1000 * 1000)", sql)
+    sql = LIKE_PATTERN.sub(r"CREATE TEMP TABLE \1 AS SELECT * FROM \2 LIMIT 0", sql)
+    sql = APPROX_DISTINCT_PATTERN.sub(r"approx_count_distinct(\1)", sql)
+    sql = APPROX_PERCENTILE_PATTERN.sub(r"approx_quantile(\2, \1)", sql)
+    sql = SYSDATE_PATTERN.sub("CAST(current_timestamp AS timestamp)", sql)
+
+    return sql
+
+
+class DuckDBCursor:
+    """A DB-API style cursor that translates statements before running them."""
+
+    def __init__(self, connection: "DuckDBConnection"):
+        self._connection = connection
+        self.rowcount = -1
+
+    def __enter__(self) -> "DuckDBCursor":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+    def execute(self, sql: str, parameters: Optional[Any] = None) -> None:
+        """Translate and run a statement.
+
+        Parameters use the psycopg2 ``%s`` and ``%(name)s`` placeholders.
+        """
+        duckdb_conn = self._connection.duckdb_conn
+        self._connection.begin()
+
+        sql = translate_sql(sql, self._connection.s3_root, self._connection.columns)
+
+        if parameters is not None:
+            sql = NAMED_PARAMETER_PATTERN.sub(r"$\1", sql).replace("%s", "?")
+
+        duckdb_conn.execute(sql, parameters)
+        self.rowcount = -1
+
+        if DML_PATTERN.match(sql):
+            self.rowcount = duckdb_conn.fetchall()[0][0]
+
+    def fetchall(self) -> List[Any]:
+        """Return the remaining result rows."""
+        return self._connection.duckdb_conn.fetchall()
+
+    def fetchone(self) -> Any:
+        """Return the next result row."""
+        return self._connection.duckdb_conn.fetchone()
+
+
+class DuckDBConnection:
+    """A DB-API style connection to a DuckDB database file.
+
+    Parameters
+    ----------
+    database : str
+        The path of the DuckDB database file.
+    s3_root : str
+        The local directory that stands in for S3.
+    """
+
+    def __init__(self, database: str, s3_root: str):
+        # pylint: disable=import-outside-toplevel
+        import duckdb
+
+        self.duckdb_conn = duckdb.connect(database)
+        self.s3_root = s3_root
+        self.autocommit = False
+        self._in_transaction = False
+
+    def begin(self) -> None:
+        """Open a transaction unless in autocommit mode or already in one."""
+        if not self.autocommit and not self._in_transaction:
+            self.duckdb_conn.execute("BEGIN TRANSACTION;")
+            self._in_transaction = True
+
+    def columns(self, table_name: str) -> List[str]:
+        """Return the columns of a table, in order."""
+        return [
+            column
+            for (column,) in self.duckdb_conn.execute(
+                "SELECT column_name FROM information_schema.columns "
+                "WHERE table_name = ? ORDER BY ordinal_position;",
+                [table_name],
+            ).fetchall()
+        ]
+
+    def cursor(self) -> DuckDBCursor:
+        """Return a new cursor."""
+        return DuckDBCursor(self)
+
+    def commit(self) -> None:
+        """Commit the open transaction, if any."""
+        if self._in_transaction:
+            self.duckdb_conn.execute("COMMIT;")
+            self._in_transaction = False
+
+    def rollback(self) -> None:
+        """Roll back the open transaction, if any."""
+        if self._in_transaction:
+            self.duckdb_conn.execute("ROLLBACK;")
+            self._in_transaction = False
+
+    def close(self) -> None:
+        """Roll back anything uncommitted and close the connection."""
+        self.rollback()
+        self.duckdb_conn.close()
+
+
+class DuckDBHook:
+    """Hook that connects to the embedded DuckDB database of a connection.
+
+    Parameters
+    ----------
+    duckdb_conn_id : str
+        The ID of the Airflow connection whose extras hold ``database``, the
+        DuckDB file, and ``s3_root``, the local directory that stands in for
+        S3.
+    """
+
+    def __init__(self, duckdb_conn_id: str):
+        extra = BaseHook.get_connection(duckdb_conn_id).extra_dejson
+        self._database = extra["database"]
+        self._s3_root = extra.get("s3_root", "")
+
+    def get_conn(self) -> DuckDBConnection:
+        """Return a new connection to the database."""
+        return DuckDBConnection(self._database, self._s3_root)
+
+
+def _data_api_field(value: Any) -> Dict[str, Any]:
+    """Encode a value as a field of ``get_statement_result``."""
+    if value is None:
+        return {"isNull": True}
+
+    if isinstance(value, bool):
+        return {"booleanValue": value}
+
+    if isinstance(value, int):
+        return {"longValue": value}
+
+    if isinstance(value, float):
+        return {"doubleValue": value}
+
+    return {"stringValue": str(value)}
+
+
+class LocalDataAPI:
+    """A stand-in for the boto3 ``redshift-data`` client on the DuckDB backend.
+
+    Implements ``execute_statement``, ``batch_execute_statement``,
+    ``describe_statement`` and ``get_statement_result`` with the request and
+    response shapes of the Data API. Submitted statements are recorded as
+    JSON files in ``{database}.statements/`` and run on their first
+    ``describe_statement``, from whichever process polls, the way the
+    cluster runs them apart from the worker that submitted them.
+
+    Parameters
+    ----------
+    duckdb_conn_id : str
+        The ID of the Airflow connection of the DuckDB database, as for
+        ``DuckDBHook``.
+    page_size : int, optional
+        The number of rows per page of ``get_statement_result``, with a
+        ``NextToken`` to the next page. Defaults to all rows in one page.
+    """
+
+    def __init__(self, duckdb_conn_id: str, page_size: Optional[int] = None):
+        self._hook = DuckDBHook(duckdb_conn_id)
+        self._page_size = page_size
+        # pylint: disable-next=protected-access
+        self._directory = f"{self._hook._database}.statements"
+
+    def _path(self, statement_id: str) -> str:
+        return os.path.join(self._directory, f"{statement_id}.json")
+
+    def _load(self, statement_id: str) -> Dict[str, Any]:
+        with open(self._path(statement_id), encoding="utf-8") as source:
+            return json.load(source)
+
+    def _save(self, state: Dict[str, Any]) -> None:
+        with open(self._path(state["Id"]), "w", encoding="utf-8") as target:
+            json.dump(state, target)
+
+    def _submit(self, sqls: List[str], name: Optional[str]) -> Dict[str, Any]:
+        os.makedirs(self._directory, exist_ok=True)
+        state = {
+            "Id": str(uuid.uuid4()),
+            "StatementName": name,
+            "Sqls": sqls,
+            "Status": "SUBMITTED",
+        }
+        self._save(state)
+
+        return {"Id": state["Id"]}
+
+    # pylint: disable-next=invalid-name
+    def execute_statement(
+        self, Sql: str, StatementName: Optional[str] = None, **_: Any
+    ) -> Dict[str, Any]:
+        """Submit one statement, run in autocommit mode."""
+        return self._submit([Sql], StatementName)
+
+    # pylint: disable-next=invalid-name
+    def batch_execute_statement(
+        self, Sqls: List[str], StatementName: Optional[str] = None, **_: Any
+    ) -> Dict[str, Any]:
+        """Submit statements run in order in one transaction."""
+        return self._submit(Sqls, StatementName)
+
+    def _run(self, state: Dict[str, Any]) -> None:
+        """Run a submitted statement and record its outcome in ``state``."""
+        conn = self._hook.get_conn()
+        conn.autocommit = len(state["Sqls"]) == 1
+        started = time.perf_counter()
+        rows = None
+        columns: List[str] = []
+
+        try:
+            cursor = conn.cursor()
+
+            for sql in state["Sqls"]:
+                cursor.execute(sql)
+                rows = None
+
+                if cursor.rowcount >= 0:
+                    state["ResultRows"] = cursor.rowcount
+                elif conn.duckdb_conn.description:
+                    columns = [column[0] for column in conn.duckdb_conn.description]
+                    rows = cursor.fetchall()
+
+            conn.commit()
+            state["Status"] = "FINISHED"
+        except Exception as error:  # pylint: disable=broad-except
+            state.update(Status="FAILED", Error=str(error))
+        finally:
+            conn.close()
+
+        state["Duration"] = int((time.perf_counter() - started) * 1e9)
+        state["HasResultSet"] = rows is not None
+
+        if rows is not None:
+            state["ResultRows"] = len(rows)
+            state["Records"] = [
+                [_data_api_field(value) for value in row] for row in rows
+            ]
+            # Redshift returns DECIMAL as strings, typed in the metadata.
+            state["ColumnMetadata"] = [
+                {
+                    "name": name,
+                    "typeName": "numeric"
+                    if any(isinstance(row[index], Decimal) for row in rows)
+                    else "",
+                }
+                for index, name in enumerate(columns)
+            ]
+
+    # pylint: disable-next=invalid-name
+    def describe_statement(self, Id: str) -> Dict[str, Any]:
+        """Run the statement if it has not run yet and describe it."""
+        state = self._load(Id)
+
+        if state["Status"] == "SUBMITTED":
+            self._run(state)
+            self._save(state)
+
+        description = {
+            key: value
+            for key, value in state.items()
+            if key not in ("Sqls", "Records", "ColumnMetadata")
+        }
+
+        if len(state["Sqls"]) == 1:
+            description["QueryString"] = state["Sqls"][0]
+        else:
+            description["SubStatements"] = [
+                {"Id": f"{Id}:{index}", "QueryString": sql}
+                for index, sql in enumerate(state["Sqls"], start=1)
+            ]
+
+        return description
+
+    # pylint: disable-next=invalid-name
+    def get_statement_result(
+        self, Id: str, NextToken: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Return a page of the result rows of a finished statement.
+
+        Within a batch, only the last statement, ``{Id}:{count}``, has rows.
+        """
+        statement_id, _, index = Id.partition(":")
+        state = self._load(statement_id)
+
+        if (
+            state["Status"] != "FINISHED"
+            or not state["HasResultSet"]
+            or (index and int(index) != len(state["Sqls"]))
+        ):
+            raise ValueError(f"Statement {Id} has no result set.")
+
+        start = int(NextToken or 0)
+        end = start + self._page_size if self._page_size else len(state["Records"])
+        page = {
+            "Records": state["Records"][start:end],
+            "ColumnMetadata": state["ColumnMetadata"],
+            "TotalNumRows": state["ResultRows"],
+        }
+
+        if end < len(state["Records"]):
+            page["NextToken"] = str(end)
+
+        return page
+
+
+class LocalS3Hook:
+    """A stand-in for ``S3Hook`` listing the local files under ``s3_root``.
+
+    ``get_conn()`` returns an object with the ``get_paginator`` of the boto3
+    S3 client, whose ``list_objects_v2`` pages hold the ``Key``, ``ETag``,
+    ``Size`` and ``LastModified`` of each file under
+    ``{s3_root}/{Bucket}/{Prefix}``. The ETag is the MD5 of the file, as S3
+    computes it for objects uploaded in one part.
+
+    Parameters
+    ----------
+    duckdb_conn_id : str
+        The ID of the Airflow connection of the DuckDB database, as for
+        ``DuckDBHook``.
+    page_size : int, optional
+        The number of objects per page. Defaults to 1000, as in S3.
+    """
+
+    def __init__(self, duckdb_conn_id: str, page_size: int = 1000):
+        # pylint: disable-next=protected-access
+        self._s3_root = DuckDBHook(duckdb_conn_id)._s3_root
+        self._page_size = page_size
+
+    def get_conn(self) -> "LocalS3Hook":
+        """Return the hook itself, which answers the client calls."""
+        return self
+
+    def get_paginator(self, operation_name: str) -> "LocalS3Hook":
+        """Return the hook itself, which paginates ``list_objects_v2``."""
+        if operation_name != "list_objects_v2":
+            raise ValueError(
+                f"Only list_objects_v2 is supported, got {operation_name}."
+            )
+
+        return self
+
+    # pylint: disable-next=invalid-name
+    def paginate(self, Bucket: str, Prefix: str = "") -> Iterator[Dict[str, Any]]:
+        """Yield the pages of objects whose key starts with ``Prefix``."""
+        root = os.path.join(self._s3_root, Bucket)
+        contents = []
+
+        for path in _local_files(os.path.join(root, Prefix)):
+            with open(path, "rb") as source:
+                etag = hashlib.md5(source.read()).hexdigest()
+
+            stat = os.stat(path)
+            contents.append(
+                {
+                    "Key": os.path.relpath(path, root).replace(os.sep, "/"),
+                    "ETag": f'"{etag}"',
+                    "Size": stat.st_size,
+                    "LastModified": datetime.fromtimestamp(
+                        stat.st_mtime, tz=timezone.utc
+                    ),
+                }
+            )
+
+        for start in range(0, len(contents), self._page_size):
+            yield {"Contents": contents[start : start + self._page_size]}
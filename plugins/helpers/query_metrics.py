@@ -0,0 +1,278 @@
+"""Per-statement query instrumentation for the Redshift operators"""
+
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from airflow.hooks.postgres_hook import PostgresHook
+from airflow.stats import Stats
+
+import helpers.sql_queries as SQL_QUERIES
+
+METRICS_XCOM_KEY = "query_metrics"
+METRICS_PREFIX = "redshift_etl"
+
+
+class InstrumentedHook:
+    """Wraps a PostgresHook and records metrics for every statement it runs.
+
+    ``run``, ``get_first`` and ``get_records`` behave like the PostgresHook
+    methods of the same name. Every connection handed out first runs the
+    ``session_stmts``, such as the WLM settings of
+    ``helpers.session_settings``. Statements run on a connection of the caller's
+    own are recorded by wrapping them in ``measure``. For each statement the
+    wall time and rows affected are recorded, and on Redshift also the query
+    ID, whose WLM queue and execution times are looked up by ``publish``.
+
+    Parameters
+    ----------
+    db_hook : Any
+        The hook to run statements with, a PostgresHook or DuckDBHook.
+    connection_type : str, optional
+        The type of database connection. Query IDs and WLM times are only
+        collected for "Redshift". Defaults to "Redshift".
+    session_stmts : List[str], optional
+        Statements run on every new connection, in autocommit mode, before
+        anything else. They are not recorded in the metrics.
+    """
+
+    def __init__(
+        self,
+        db_hook: Any,
+        connection_type: str = "Redshift",
+        session_stmts: Optional[List[str]] = None,
+    ):
+        self._db_hook = db_hook
+        self._redshift = connection_type == "Redshift"
+        self._session_stmts = session_stmts or []
+        self.metrics: List[Dict[str, Any]] = []
+
+    def get_conn(self) -> Any:
+        """Return a new connection from the wrapped hook.
+
+        The session statements have already run on it.
+        """
+        conn = self._db_hook.get_conn()
+
+        if self._session_stmts:
+            # SET in autocommit mode lasts for the session, not a transaction.
+            conn.autocommit = True
+
+            with conn.cursor() as cursor:
+                for statement in self._session_stmts:
+                    cursor.execute(statement)
+
+            conn.autocommit = False
+
+        return conn
+
+    @contextmanager
+    def measure(self, cursor: Any, sql: str) -> Iterator[None]:
+        """Record the statement run on ``cursor`` inside the block.
+
+        Any result rows must be fetched inside the block, because the query
+        ID is read on the same cursor afterwards.
+
+        Parameters
+        ----------
+        cursor : Any
+            The cursor the statement runs on.
+        sql : str
+            The statement, as recorded in the metrics.
+        """
+        started = time.perf_counter()
+        yield
+        wall_time = time.perf_counter() - started
+        # Read before the query ID lookup below replaces the cursor's result.
+        rows = cursor.rowcount
+        query_id = None
+
+        if self._redshift:
+            cursor.execute(SQL_QUERIES.SELECT_LAST_QUERY_ID)
+            query_id = cursor.fetchone()[0]
+
+        self.metrics.append(
+            {
+                "sql": " ".join(sql.split())[:200],
+                "wall_time": wall_time,
+                "rows": rows,
+                "query_id": query_id if query_id and query_id > 0 else None,
+                "queue_time": None,
+                "exec_time": None,
+            }
+        )
+
+    def _execute(
+        self,
+        sql: Union[str, List[str]],
+        autocommit: bool,
+        parameters: Optional[Any],
+        fetch: bool,
+        conn: Optional[Any] = None,
+    ) -> Optional[List[Any]]:
+        """Run one or more statements over a single connection.
+
+        Returns the rows of the last statement when ``fetch`` is set. A
+        connection passed in is left open, and rolled back on failure so that
+        it can be reused.
+        """
+        statements = [sql] if isinstance(sql, str) else list(sql)
+        own_conn = conn is None
+        conn = self.get_conn() if own_conn else conn
+        conn.autocommit = autocommit
+        rows = None
+
+        try:
+            with conn.cursor() as cursor:
+                for statement in statements:
+                    with self.measure(cursor, statement):
+                        cursor.execute(statement, parameters)
+
+                        if fetch:
+                            rows = cursor.fetchall()
+
+            if not autocommit:
+                conn.commit()
+        except Exception:
+            if not own_conn and not autocommit:
+                conn.rollback()
+            raise
+        finally:
+            if own_conn:
+                conn.close()
+
+        return rows
+
+    def run(
+        self,
+        sql: Union[str, List[str]],
+        autocommit: bool = False,
+        parameters: Optional[Any] = None,
+        conn: Optional[Any] = None,
+    ) -> None:
+        """Run one or more statements, like ``PostgresHook.run``.
+
+        Runs on ``conn`` when given, instead of a new connection.
+        """
+        self._execute(sql, autocommit, parameters, fetch=False, conn=conn)
+
+    def get_records(self, sql: str, parameters: Optional[Any] = None) -> List[Any]:
+        """Return all result rows, like ``PostgresHook.get_records``."""
+        return self._execute(sql, True, parameters, fetch=True)
+
+    def get_first(self, sql: str, parameters: Optional[Any] = None) -> Any:
+        """Return the first result row, like ``PostgresHook.get_first``."""
+        rows = self._execute(sql, True, parameters, fetch=True)
+
+        return rows[0] if rows else None
+
+    def _fetch_wlm_times(self) -> None:
+        """Fill in the WLM queue and execution times of recorded queries."""
+        query_ids = tuple(
+            metric["query_id"] for metric in self.metrics if metric["query_id"]
+        )
+
+        if not query_ids:
+            return
+
+        # Microseconds in stl_wlm_query; rows can lag behind a few seconds.
+        times = {
+            query_id: (queue_time / 1e6, exec_time / 1e6)
+            for query_id, queue_time, exec_time in self._db_hook.get_records(
+                SQL_QUERIES.SELECT_WLM_TIMES, parameters=(query_ids,)
+            )
+        }
+
+        for metric in self.metrics:
+            if metric["query_id"] in times:
+                metric["queue_time"], metric["exec_time"] = times[metric["query_id"]]
+
+    def publish(self, context: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Push the recorded metrics to XCom and the Airflow metrics sink.
+
+        Parameters
+        ----------
+        context : Dict[str, Any]
+            The Airflow execution context containing information about the
+            current execution.
+
+        Returns
+        -------
+        List[Dict[str, Any]]
+            The recorded metrics.
+        """
+        if self._redshift:
+            self._fetch_wlm_times()
+
+        return publish_metrics(context, self.metrics)
+
+
+def publish_metrics(
+    context: Dict[str, Any], metrics: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """Push statement metrics to XCom and the Airflow metrics sink.
+
+    Parameters
+    ----------
+    context : Dict[str, Any]
+        The Airflow execution context containing information about the
+        current execution.
+    metrics : List[Dict[str, Any]]
+        One entry per statement, as recorded by ``InstrumentedHook``.
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        The metrics.
+    """
+    task_instance = context["ti"]
+    prefix = f"{METRICS_PREFIX}.{task_instance.dag_id}.{task_instance.task_id}"
+
+    for metric in metrics:
+        Stats.timing(f"{prefix}.wall_time", metric["wall_time"] * 1000)
+
+        if metric["rows"] is not None and metric["rows"] >= 0:
+            Stats.gauge(f"{prefix}.rows", metric["rows"])
+
+        if metric["queue_time"] is not None:
+            Stats.timing(f"{prefix}.queue_time", metric["queue_time"] * 1000)
+            Stats.timing(f"{prefix}.exec_time", metric["exec_time"] * 1000)
+
+    task_instance.xcom_push(key=METRICS_XCOM_KEY, value=metrics)
+
+    return metrics
+
+
+def get_db_hook(
+    db_connection_id: str,
+    connection_type: str = "Redshift",
+    session_stmts: Optional[List[str]] = None,
+) -> InstrumentedHook:
+    """Return the instrumented hook for a connection.
+
+    Parameters
+    ----------
+    db_connection_id : str
+        The ID of the database connection to use.
+    connection_type : str, optional
+        "DuckDB" runs against the embedded backend of ``local_backend``;
+        anything else connects through PostgresHook. Defaults to "Redshift".
+    session_stmts : List[str], optional
+        Statements run on every new connection before anything else.
+
+    Returns
+    -------
+    InstrumentedHook
+        The hook to run statements with.
+    """
+    if connection_type == "DuckDB":
+        # pylint: disable=import-outside-toplevel
+        from helpers.local_backend import DuckDBHook
+
+        return InstrumentedHook(
+            DuckDBHook(db_connection_id), connection_type, session_stmts
+        )
+
+    return InstrumentedHook(
+        PostgresHook(postgres_conn_id=db_connection_id), connection_type, session_stmts
+    )
@@ -0,0 +1,124 @@
+"""Helpers for listing the S3 objects the pipeline reads"""
+
+import hashlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+from airflow.providers.amazon.aws.hooks.s3 import S3Hook
+
+
+def list_objects(
+    s3_hook: S3Hook, bucket_name: str, prefixes: List[str]
+) -> List[Tuple[str, str, int]]:
+    """List the objects under each key prefix.
+
+    Parameters
+    ----------
+    s3_hook : S3Hook
+        The hook used to list the bucket.
+    bucket_name : str
+        The bucket to list.
+    prefixes : List[str]
+        The key prefixes to list.
+
+    Returns
+    -------
+    List[Tuple[str, str, int]]
+        The key, ETag and size of every non-empty object found.
+    """
+    paginator = s3_hook.get_conn().get_paginator("list_objects_v2")
+    objects = []
+
+    for prefix in prefixes:
+        pages = paginator.paginate(Bucket=bucket_name, Prefix=prefix)
+
+        for page in pages:
+            for obj in page.get("Contents", []):
+                if obj["Size"] == 0 or obj["Key"].endswith("/"):
+                    continue
+
+                objects.append((obj["Key"], obj["ETag"].strip('"'), obj["Size"]))
+
+    return objects
+
+
+def prefix_fingerprint(s3_hook: Any, bucket_name: str, prefix: str) -> Dict[str, Any]:
+    """Summarize the objects under a key prefix, to tell whether any changed.
+
+    Parameters
+    ----------
+    s3_hook : Any
+        The hook used to list the bucket, an ``S3Hook`` or the
+        ``LocalS3Hook`` of ``local_backend``.
+    bucket_name : str
+        The bucket to list.
+    prefix : str
+        The key prefix to list.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The number of keys, the latest ``LastModified`` as an ISO 8601
+        string, or None for an empty prefix, and a SHA-256 digest of every
+        key and ETag, which changes when an object is added, replaced or
+        deleted.
+    """
+    paginator = s3_hook.get_conn().get_paginator("list_objects_v2")
+    digest = hashlib.sha256()
+    keys = 0
+    last_modified = None
+
+    # S3 lists keys in order, so the digest is stable between listings.
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            etag = obj["ETag"].strip('"')
+            digest.update(f"{obj['Key']}\0{etag}\n".encode("utf-8"))
+            keys += 1
+
+            if last_modified is None or obj["LastModified"] > last_modified:
+                last_modified = obj["LastModified"]
+
+    return {
+        "keys": keys,
+        "last_modified": last_modified.isoformat() if last_modified else None,
+        "etag_digest": digest.hexdigest(),
+    }
+
+
+def partition_prefixes(template: str, start: datetime, end: datetime) -> List[str]:
+    """Render a partition template for each day in a data interval.
+
+    Parameters
+    ----------
+    template : str
+        A ``str.format`` template for the key prefix, with the fields
+        ``year``, ``month``, ``day``, ``ds`` and ``ds_nodash``.
+    start : datetime
+        The inclusive start of the interval.
+    end : datetime
+        The exclusive end of the interval. An empty interval covers the day
+        of ``start``.
+
+    Returns
+    -------
+    List[str]
+        The distinct key prefixes covering the data interval, in order.
+    """
+    day = start.date()
+    last_day = (end - timedelta(microseconds=1)).date() if end > start else day
+
+    keys = []
+
+    while day <= last_day:
+        keys.append(
+            template.format(
+                year=day.year,
+                month=day.month,
+                day=day.day,
+                ds=day.isoformat(),
+                ds_nodash=day.strftime("%Y%m%d"),
+            )
+        )
+        day += timedelta(days=1)
+
+    return list(dict.fromkeys(keys))
@@ -0,0 +1,113 @@
+"""Rendering and validation of per-session WLM settings.
+
+Every operator declares its defaults in a ``session_defaults`` class
+attribute and takes ``session_settings``, a dict of the settings in
+``SESSION_SETTING_TYPES`` that overrides them key by key. The merged settings
+are rendered and validated by ``render_session_settings`` when the operator
+is created, and the resulting SET statements run on every session the
+operator opens, before its own statements.
+"""
+
+import re
+from typing import Any, Dict, List
+
+import helpers.sql_queries as SQL_QUERIES
+
+# The settings accepted by render_session_settings, with the type of their
+# value. None leaves a setting at the cluster default.
+SESSION_SETTING_TYPES: Dict[str, type] = {
+    "query_group": str,
+    "label": str,
+    "statement_timeout": int,
+    "wlm_query_slot_count": int,
+}
+QUERY_GROUP_PATTERN = re.compile(r"^[\w.\-]+$")
+
+
+def render_session_settings(
+    settings: Dict[str, Any], connection_type: str = "Redshift"
+) -> List[str]:
+    """Render session settings into the statements that apply them.
+
+    Parameters
+    ----------
+    settings : Dict[str, Any]
+        Any of:
+
+        - ``query_group``: the WLM query group, which routes the queries to
+          the queue listing it and labels them in ``stl_query``.
+        - ``label``: appended to the query group as ``{query_group}.{label}``
+          to tell tasks apart in ``stl_query``. The queue must then match
+          query groups with a wildcard, e.g. ``etl_load.*``.
+        - ``statement_timeout``: the seconds after which a statement is
+          cancelled.
+        - ``wlm_query_slot_count``: the number of queue slots, and so the
+          share of the queue's memory, each query takes. Ignored by
+          automatic WLM.
+    connection_type : str, optional
+        Only "Redshift" has WLM; other PostgreSQL connections only get the
+        statement timeout, and "DuckDB" gets nothing. Defaults to "Redshift".
+
+    Returns
+    -------
+    List[str]
+        The SET statements, in order.
+    """
+    for name, value in settings.items():
+        if name not in SESSION_SETTING_TYPES:
+            raise ValueError(
+                f"Unknown session setting {name}, expected one of "
+                f"{tuple(SESSION_SETTING_TYPES)}."
+            )
+
+        # bool is a subclass of int, so it must not pass for the counts.
+        expected = SESSION_SETTING_TYPES[name]
+
+        if value is not None and (
+            not isinstance(value, expected)
+            or (expected is int and isinstance(value, bool))
+        ):
+            raise ValueError(
+                f"Session setting {name} must be a {expected.__name__}, got {value!r}."
+            )
+
+        if expected is str and value is not None and not QUERY_GROUP_PATTERN.match(
+            value
+        ):
+            raise ValueError(
+                f"Session setting {name} may only hold letters, digits, '_', '.' "
+                f"and '-', got {value!r}."
+            )
+
+        if expected is int and value is not None and value < 1:
+            raise ValueError(f"Session setting {name} must be >= 1, got {value}.")
+
+    if settings.get("label") and not settings.get("query_group"):
+        raise ValueError("Session setting label requires query_group.")
+
+    if connection_type == "DuckDB":
+        return []
+
+    statements = []
+
+    if connection_type == "Redshift" and settings.get("query_group"):
+        query_group = ".".join(
+            filter(None, [settings["query_group"], settings.get("label")])
+        )
+        statements.append(SQL_QUERIES.SET_QUERY_GROUP.format(query_group=query_group))
+
+    if settings.get("statement_timeout"):
+        statements.append(
+            SQL_QUERIES.SET_STATEMENT_TIMEOUT.format(
+                milliseconds=settings["statement_timeout"] * 1000
+            )
+        )
+
+    if connection_type == "Redshift" and settings.get("wlm_query_slot_count"):
+        statements.append(
+            SQL_QUERIES.SET_WLM_QUERY_SLOT_COUNT.format(
+                slots=settings["wlm_query_slot_count"]
+            )
+        )
+
+    return statements
@@ -1,5 +1,7 @@
 """SQL queries for ETL project"""
 
+from helpers.table_specs import TABLE_SPECS, render_create_table
+
 DROP_SONGPLAYS_TABLE = "DROP TABLE IF EXISTS songplays;"
 DROP_USERS_TABLE = "DROP TABLE IF EXISTS users;"
 DROP_SONGS_TABLE = "DROP TABLE IF EXISTS songs;"
@@ -7,10 +9,70 @@ DROP_ARTISTS_TABLE = "DROP TABLE IF EXISTS artists;"
 DROP_TIME_TABLE = "DROP TABLE IF EXISTS time;"
 DROP_STAGING_SONGS_TABLE = "DROP TABLE IF EXISTS staging_songs;"
 DROP_STAGING_EVENTS_TABLE = "DROP TABLE IF EXISTS staging_events;"
+DROP_LOAD_LEDGER_TABLE = "DROP TABLE IF EXISTS staging_load_ledger;"
+DROP_MAINTENANCE_LOG_TABLE = "DROP TABLE IF EXISTS table_maintenance_log;"
+DROP_PROFILES_TABLE = "DROP TABLE IF EXISTS data_quality_profiles;"
+DROP_USER_DAILY_PLAYS_TABLE = "DROP TABLE IF EXISTS user_daily_plays;"
+DROP_SONG_HOURLY_PLAYS_TABLE = "DROP TABLE IF EXISTS song_hourly_plays;"
+DROP_ARTIST_HOURLY_PLAYS_TABLE = "DROP TABLE IF EXISTS artist_hourly_plays;"
 
 SELECT_ERRORS = "SELECT * FROM sys_load_error_detail;"
 DATA_QUALITY_CHECK = "SELECT COUNT(*) FROM {};"
 
+# Row counts for the batched data quality modes, one row per table.
+DATA_QUALITY_UNION_COUNT = "SELECT '{table}' AS table_name, COUNT(*) AS row_count FROM {table}"
+DATA_QUALITY_CATALOG_COUNT = """
+SELECT "table", tbl_rows
+FROM svv_table_info
+WHERE "schema" = %s
+  AND "table" IN %s;
+"""
+
+# Aggregate expressions for the declarative data quality rules. All the rules
+# of a table are selected together, so the table is scanned once.
+DATA_QUALITY_RULE_QUERY = "SELECT {expressions} FROM {table};"
+DATA_QUALITY_ROW_COUNT = "COUNT(*)"
+DATA_QUALITY_NULL_RATE = (
+    "SUM(CASE WHEN {column} IS NULL THEN 1 ELSE 0 END)::float8"
+    " / NULLIF(COUNT(*), 0)"
+)
+DATA_QUALITY_DUPLICATES = "COUNT({column}) - COUNT(DISTINCT {column})"
+DATA_QUALITY_OUT_OF_RANGE = "SUM(CASE WHEN {condition} THEN 1 ELSE 0 END)"
+
+# Approximate table profiles, computed in one pass per table and compared
+# with the trailing average of data_quality_profiles.
+PROFILE_APPROX_DISTINCT = "APPROXIMATE COUNT(DISTINCT {column})"
+PROFILE_PERCENTILE = (
+    "APPROXIMATE PERCENTILE_DISC({fraction}) WITHIN GROUP (ORDER BY {column})"
+)
+PROFILE_TRAILING_AVERAGES = """
+SELECT metric, AVG(value), COUNT(*)
+FROM (
+    SELECT
+        metric,
+        value,
+        ROW_NUMBER() OVER (PARTITION BY metric ORDER BY profiled_at DESC) AS recency
+    FROM data_quality_profiles
+    WHERE table_name = %s
+      AND run_id <> %s
+) AS recent
+WHERE recency <= %s
+GROUP BY metric;
+"""
+PROFILE_HISTORY_DELETE = """
+DELETE FROM data_quality_profiles
+WHERE table_name = %s
+  AND run_id = %s;
+"""
+PROFILE_HISTORY_INSERT = """
+INSERT INTO data_quality_profiles (table_name, metric, value, run_id, profiled_at)
+VALUES {rows};
+"""
+PROFILE_HISTORY_ROW = "(%s, %s, %s, %s, %s)"
+
+# The histories table_maintenance_log and data_quality_profiles keep are never
+# dropped with the tables they describe; they are only ever created if they do
+# not exist.
 DROP_TABLE_STATEMENTS = [
     DROP_SONGPLAYS_TABLE,
     DROP_USERS_TABLE,
@@ -19,8 +81,58 @@ DROP_TABLE_STATEMENTS = [
     DROP_TIME_TABLE,
     DROP_STAGING_SONGS_TABLE,
     DROP_STAGING_EVENTS_TABLE,
+    DROP_LOAD_LEDGER_TABLE,
+    DROP_USER_DAILY_PLAYS_TABLE,
+    DROP_SONG_HOURLY_PLAYS_TABLE,
+    DROP_ARTIST_HOURLY_PLAYS_TABLE,
 ]
 
+# Events are matched to songs on one fixed-width key: the md5 of the
+# normalized title and artist and the duration rounded to milliseconds, a
+# fixed scale both float8 columns render the same way. The key is computed once
+# per row right after staging, instead of comparing two varchar(512) columns
+# and a float for every event in each fact load. A NULL part leaves the key
+# NULL, which matches nothing, like the column-wise comparison it replaces.
+SONG_KEY_EXPRESSION = (
+    "md5(lower(trim({title})) || '|' || lower(trim({artist})) || '|' "
+    "|| {duration}::numeric(18,3)::varchar)"
+)
+
+# staging_events is distributed on song_key, so every event needs one: the
+# events that are not NextSong plays, or whose song key is NULL, get the md5 of
+# the event itself instead, which spreads them evenly and matches no song.
+EVENT_KEY_EXPRESSION = (
+    "md5('event|' || COALESCE(sessionid::varchar, '') || '|' "
+    "|| COALESCE(iteminsession::varchar, '') || '|' "
+    "|| COALESCE(ts::varchar, '') || '|' || COALESCE(userid::varchar, ''))"
+)
+
+# Run after the COPY in the same transaction, where SYSDATE is the staged_at
+# of exactly the rows it copied, so each row is keyed once.
+STAGING_EVENTS_SONG_KEY_UPDATE = """
+UPDATE staging_events
+SET song_key = COALESCE(
+    CASE WHEN page = 'NextSong' THEN {song_key} END,
+    {event_key}
+)
+WHERE staged_at = SYSDATE;
+""".format(
+    song_key=SONG_KEY_EXPRESSION.format(
+        title="song", artist="artist", duration="length"
+    ),
+    event_key=EVENT_KEY_EXPRESSION,
+)
+
+STAGING_SONGS_SONG_KEY_UPDATE = """
+UPDATE staging_songs
+SET song_key = {song_key}
+WHERE staged_at = SYSDATE;
+""".format(
+    song_key=SONG_KEY_EXPRESSION.format(
+        title="title", artist="artist_name", duration="duration"
+    )
+)
+
 SONGPLAY_TABLE_INSERT = """
 INSERT INTO songplays (
     playid,
@@ -34,7 +146,7 @@ INSERT INTO songplays (
     user_agent
 )
 SELECT
-    md5(events.sessionid || events.start_time) AS playid,
+    md5(events.sessionid::varchar || events.start_time::varchar) AS playid,
     events.start_time, 
     events.userid, 
     events.level, 
@@ -49,9 +161,61 @@ FROM (
     WHERE page = 'NextSong'
 ) events
 LEFT JOIN staging_songs songs
-ON events.song = songs.title
-   AND events.artist = songs.artist_name
-   AND events.length = songs.duration
+ON events.song_key = songs.song_key
+"""
+
+# Incremental variant of SONGPLAY_TABLE_INSERT. ``{interval_filter}`` bounds
+# the raw ``ts`` column, so the epoch conversion is only paid for the rows in
+# the run's data interval, and plays already in ``songplays`` are skipped.
+SONGPLAY_TABLE_INCREMENTAL_INSERT = """
+INSERT INTO songplays (
+    playid,
+    start_time,
+    userid,
+    level,
+    songid,
+    artistid,
+    sessionid,
+    location,
+    user_agent
+)
+SELECT
+    events.playid,
+    events.start_time,
+    events.userid,
+    events.level,
+    songs.song_id AS songid,
+    songs.artist_id AS artistid,
+    events.sessionid,
+    events.location,
+    events.useragent AS user_agent
+FROM (
+    SELECT md5(sessionid::varchar || start_time::varchar) AS playid, *
+    FROM (
+        SELECT TIMESTAMP 'epoch' + ts/1000 * interval '1 second' AS start_time, *
+        FROM staging_events
+        WHERE page = 'NextSong'
+        {interval_filter}
+    ) bounded
+) events
+LEFT JOIN staging_songs songs
+ON events.song_key = songs.song_key
+WHERE NOT EXISTS (
+    SELECT 1
+    FROM songplays existing
+    WHERE existing.playid = events.playid
+)
+"""
+
+SONGPLAY_INTERVAL_FILTER = "AND ts >= {start_ms} AND ts < {end_ms}"
+
+# Staged events inside a run's data interval. A run whose sources have not
+# changed is only skipped when there are none, as they still need loading.
+STAGING_EVENTS_INTERVAL_COUNT = """
+SELECT COUNT(*)
+FROM staging_events
+WHERE page = 'NextSong'
+{interval_filter};
 """
 
 USER_TABLE_INSERT = """
@@ -127,112 +291,215 @@ SELECT
 FROM songplays
 """
 
-
-CREATE_STAGING_SONGS_TABLE = """
-CREATE TABLE IF NOT EXISTS staging_songs (
-    num_songs int4,
-    artist_id varchar(512),
-    artist_name varchar(512),
-    artist_latitude numeric(18,0),
-    artist_longitude numeric(18,0),
-    artist_location varchar(512),
-    song_id varchar(512),
-    title varchar(512),
-    duration numeric(18,0),
-    "year" int4
+# Only the start times of plays new to the time table, optionally bounded to a
+# run's data interval with START_TIME_INTERVAL_FILTER. songplays and time are
+# both sorted on start_time, so the bounded scan skips the older blocks.
+TIME_TABLE_INCREMENTAL_INSERT = """
+INSERT INTO time (
+    start_time,
+    hour,
+    day,
+    week,
+    month,
+    year,
+    weekday
 )
-DISTSTYLE EVEN;
+SELECT
+    start_time,
+    EXTRACT(hour FROM start_time) AS hour,
+    EXTRACT(day FROM start_time) AS day,
+    EXTRACT(week FROM start_time) AS week,
+    EXTRACT(month FROM start_time)::varchar AS month,
+    EXTRACT(year FROM start_time) AS year,
+    EXTRACT(dow FROM start_time)::varchar AS weekday
+FROM (
+    SELECT DISTINCT plays.start_time
+    FROM songplays plays
+    WHERE NOT EXISTS (
+        SELECT 1
+        FROM time
+        WHERE time.start_time = plays.start_time
+    )
+    {interval_filter}
+) new_times
 """
 
-CREATE_STAGING_EVENTS_TABLE = """
-CREATE TABLE IF NOT EXISTS staging_events (
-    artist varchar(512),
-    auth varchar(512),
-    firstname varchar(512),
-    gender varchar(512),
-    iteminsession int4,
-    lastname varchar(512),
-    length numeric(18,0),
-    "level" varchar(512),
-    location varchar(512),
-    "method" varchar(512),
-    page varchar(512),
-    registration numeric(18,0),
-    sessionid int4,
-    song varchar(512),
-    status int4,
-    ts int8,
-    useragent varchar(512),
-    userid int4
+START_TIME_INTERVAL_FILTER = (
+    "AND plays.start_time >= '{start}' AND plays.start_time < '{end}'"
 )
-DISTSTYLE EVEN;
+
+# Dimension rows keyed on the table's primary key, one row per key, for the
+# merge load mode, from the rows staged by the current run: the events of the
+# run's data interval, through the {interval_filter} the merge mode fills in
+# with SONGPLAY_INTERVAL_FILTER on the ts sort key, and the latest batch of
+# songs by their staged_at sort key. Columns are listed in table order.
+USER_TABLE_SELECT = """
+SELECT
+    userid,
+    first_name,
+    last_name,
+    gender,
+    level
+FROM (
+    SELECT
+        userid,
+        firstname AS first_name,
+        lastname AS last_name,
+        gender,
+        level,
+        ROW_NUMBER() OVER (PARTITION BY userid ORDER BY ts DESC) AS row_num
+    FROM staging_events
+    WHERE page = 'NextSong'
+      AND userid IS NOT NULL
+      {interval_filter}
+) latest
+WHERE row_num = 1
 """
 
-CREATE_SONGPLAYS_TABLE = """
-CREATE TABLE IF NOT EXISTS songplays (
-    playid varchar(32) NOT NULL,
-    start_time timestamp NOT NULL,
-    userid int4 NOT NULL,
-    "level" varchar(512),
-    songid varchar(512),
-    artistid varchar(512),
-    sessionid int4,
-    location varchar(512),
-    user_agent varchar(512),
-    CONSTRAINT songplays_pkey PRIMARY KEY (playid)
-)
-DISTSTYLE EVEN;
+SONG_TABLE_SELECT = """
+SELECT
+    songid,
+    title,
+    artistid,
+    year,
+    duration
+FROM (
+    SELECT
+        song_id AS songid,
+        title,
+        artist_id AS artistid,
+        year,
+        duration,
+        ROW_NUMBER() OVER (PARTITION BY song_id ORDER BY year DESC) AS row_num
+    FROM staging_songs
+    WHERE song_id IS NOT NULL
+      AND staged_at = (SELECT MAX(staged_at) FROM staging_songs)
+) latest
+WHERE row_num = 1
 """
 
-CREATE_USERS_TABLE = """
-CREATE TABLE IF NOT EXISTS users (
-    userid int4 NOT NULL,
-    first_name varchar(512),
-    last_name varchar(512),
-    gender varchar(512),
-    "level" varchar(512),
-    CONSTRAINT users_pkey PRIMARY KEY (userid)
-)
-DISTSTYLE ALL;
+ARTIST_TABLE_SELECT = """
+SELECT
+    artistid,
+    name,
+    location,
+    lattitude,
+    longitude
+FROM (
+    SELECT
+        artist_id AS artistid,
+        artist_name AS name,
+        artist_location AS location,
+        artist_latitude AS lattitude,
+        artist_longitude AS longitude,
+        ROW_NUMBER() OVER (PARTITION BY artist_id ORDER BY artist_name) AS row_num
+    FROM staging_songs
+    WHERE artist_id IS NOT NULL
+      AND staged_at = (SELECT MAX(staged_at) FROM staging_songs)
+) latest
+WHERE row_num = 1
 """
 
-CREATE_SONGS_TABLE = """
-CREATE TABLE IF NOT EXISTS songs (
-    songid varchar(512) NOT NULL,
-    title varchar(512),
-    artistid varchar(512),
-    "year" int4,
-    duration numeric(18,0),
-    CONSTRAINT songs_pkey PRIMARY KEY (songid)
-)
-DISTSTYLE ALL;
+TIME_TABLE_SELECT = """
+SELECT
+    start_time,
+    EXTRACT(hour FROM start_time) AS hour,
+    EXTRACT(day FROM start_time) AS day,
+    EXTRACT(week FROM start_time) AS week,
+    EXTRACT(month FROM start_time)::varchar AS month,
+    EXTRACT(year FROM start_time) AS year,
+    EXTRACT(dow FROM start_time)::varchar AS weekday
+FROM (
+    SELECT DISTINCT start_time
+    FROM songplays
+) plays
 """
 
-CREATE_ARTISTS_TABLE = """
-CREATE TABLE IF NOT EXISTS artists (
-    artistid varchar(512) NOT NULL,
-    name varchar(512),
-    location varchar(512),
-    lattitude numeric(18,0),
-    longitude numeric(18,0)
-)
-DISTSTYLE ALL;
+TRUNCATE_TABLE = "TRUNCATE {table};"
+
+MERGE_CREATE_STAGE = "CREATE TEMP TABLE {stage_table} (LIKE {table});"
+MERGE_INSERT_STAGE = "INSERT INTO {stage_table}\n{select_stmt};"
+MERGE_DELETE_MATCHED = "DELETE FROM {table} USING {stage_table} WHERE {key_match};"
+MERGE_INSERT_TARGET = "INSERT INTO {table} SELECT * FROM {stage_table};"
+MERGE_DROP_STAGE = "DROP TABLE {stage_table};"
+
+# Rollups of songplays. Each insert aggregates the plays matching
+# ``{source_filter}``, a ROLLUP_BUCKET_FILTER on start_time, after
+# ROLLUP_DELETE has removed the same buckets, so a refresh only rescans the
+# plays of the buckets a run touched.
+USER_DAILY_PLAYS_INSERT = """
+INSERT INTO user_daily_plays (play_date, userid, plays, sessions)
+SELECT
+    start_time::date AS play_date,
+    userid,
+    COUNT(*) AS plays,
+    COUNT(DISTINCT sessionid) AS sessions
+FROM songplays
+WHERE 1 = 1
+{source_filter}
+GROUP BY 1, 2
 """
 
-CREATE_TIME_TABLE = """
-CREATE TABLE IF NOT EXISTS time (
-    start_time timestamp NOT NULL,
-    "hour" int4,
-    "day" int4,
-    week int4,
-    "month" varchar(512),
-    "year" int4,
-    weekday varchar(512),
-    CONSTRAINT time_pkey PRIMARY KEY (start_time)
-)
-DISTSTYLE ALL;
+SONG_HOURLY_PLAYS_INSERT = """
+INSERT INTO song_hourly_plays (play_hour, songid, artistid, plays, listeners)
+SELECT
+    date_trunc('hour', start_time) AS play_hour,
+    songid,
+    artistid,
+    COUNT(*) AS plays,
+    COUNT(DISTINCT userid) AS listeners
+FROM songplays
+WHERE songid IS NOT NULL
+{source_filter}
+GROUP BY 1, 2, 3
 """
 
+ARTIST_HOURLY_PLAYS_INSERT = """
+INSERT INTO artist_hourly_plays (play_hour, artistid, plays, listeners)
+SELECT
+    date_trunc('hour', start_time) AS play_hour,
+    artistid,
+    COUNT(*) AS plays,
+    COUNT(DISTINCT userid) AS listeners
+FROM songplays
+WHERE artistid IS NOT NULL
+{source_filter}
+GROUP BY 1, 2
+"""
+
+ROLLUP_DELETE = "DELETE FROM {table} WHERE 1 = 1 {bucket_filter};"
+ROLLUP_BUCKET_FILTER = "AND {column} >= '{start}' AND {column} < '{end}'"
+
+CREATE_STAGING_SONGS_TABLE = render_create_table(
+    "staging_songs", TABLE_SPECS["staging_songs"]
+)
+CREATE_STAGING_EVENTS_TABLE = render_create_table(
+    "staging_events", TABLE_SPECS["staging_events"]
+)
+CREATE_SONGPLAYS_TABLE = render_create_table("songplays", TABLE_SPECS["songplays"])
+CREATE_USERS_TABLE = render_create_table("users", TABLE_SPECS["users"])
+CREATE_SONGS_TABLE = render_create_table("songs", TABLE_SPECS["songs"])
+CREATE_ARTISTS_TABLE = render_create_table("artists", TABLE_SPECS["artists"])
+CREATE_TIME_TABLE = render_create_table("time", TABLE_SPECS["time"])
+CREATE_LOAD_LEDGER_TABLE = render_create_table(
+    "staging_load_ledger", TABLE_SPECS["staging_load_ledger"]
+)
+CREATE_MAINTENANCE_LOG_TABLE = render_create_table(
+    "table_maintenance_log", TABLE_SPECS["table_maintenance_log"]
+)
+CREATE_PROFILES_TABLE = render_create_table(
+    "data_quality_profiles", TABLE_SPECS["data_quality_profiles"]
+)
+CREATE_USER_DAILY_PLAYS_TABLE = render_create_table(
+    "user_daily_plays", TABLE_SPECS["user_daily_plays"]
+)
+CREATE_SONG_HOURLY_PLAYS_TABLE = render_create_table(
+    "song_hourly_plays", TABLE_SPECS["song_hourly_plays"]
+)
+CREATE_ARTIST_HOURLY_PLAYS_TABLE = render_create_table(
+    "artist_hourly_plays", TABLE_SPECS["artist_hourly_plays"]
+)
+
 CREATE_TABLE_STATEMENTS = [
     CREATE_STAGING_EVENTS_TABLE,
     CREATE_STAGING_SONGS_TABLE,
@@ -241,20 +508,129 @@ CREATE_TABLE_STATEMENTS = [
     CREATE_SONGS_TABLE,
     CREATE_TIME_TABLE,
     CREATE_USERS_TABLE,
+    CREATE_LOAD_LEDGER_TABLE,
+    CREATE_MAINTENANCE_LOG_TABLE,
+    CREATE_PROFILES_TABLE,
+    CREATE_USER_DAILY_PLAYS_TABLE,
+    CREATE_SONG_HOURLY_PLAYS_TABLE,
+    CREATE_ARTIST_HOURLY_PLAYS_TABLE,
 ]
 
+# Live column layout and recorded fingerprint of the managed tables, for the
+# reconcile mode of CreateTablesOperator.
+SELECT_SCHEMA_CATALOG = """
+SELECT c.relname, a.attname, d.description
+FROM pg_catalog.pg_class c
+JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+JOIN pg_catalog.pg_attribute a ON a.attrelid = c.oid
+LEFT JOIN pg_catalog.pg_description d ON d.objoid = c.oid AND d.objsubid = 0
+WHERE n.nspname = %s
+  AND c.relkind = 'r'
+  AND c.relname IN %s
+  AND a.attnum > 0
+  AND NOT a.attisdropped
+ORDER BY c.relname, a.attnum;
+"""
+
+DROP_TABLE = "DROP TABLE IF EXISTS {table};"
+COMMENT_SCHEMA_FINGERPRINT = "COMMENT ON TABLE {table} IS '{fingerprint}';"
+DELETE_LOAD_LEDGER_ENTRIES = "DELETE FROM staging_load_ledger WHERE table_name = '{table}';"
+# DELETE rather than TRUNCATE, which would commit the reconcile transaction.
+DELETE_ALL_ROWS = "DELETE FROM {table};"
+
+# The column lists leave out song_key and staged_at, which have no field in
+# the JSON.
 COPY_STAGING_SONGS = """
-COPY staging_songs
-FROM 's3://{bucket}/song-data/'
+COPY staging_songs (
+    num_songs, artist_id, artist_name, artist_latitude, artist_longitude,
+    artist_location, song_id, title, duration, "year"
+)
+FROM 's3://{bucket}/{s3_key}'
 IAM_ROLE '{iam_role}'
 FORMAT AS JSON '{json_format}'
-REGION '{region}';
+REGION '{region}'
+{copy_options};
 """
 
 COPY_STAGING_EVENTS = """
-COPY staging_events
-FROM 's3://{bucket}/log-data/'
+COPY staging_events (
+    artist, auth, firstname, gender, iteminsession, lastname, length, "level",
+    location, "method", page, registration, sessionid, song, status, ts,
+    useragent, userid
+)
+FROM 's3://{bucket}/{s3_key}'
 IAM_ROLE '{iam_role}'
 FORMAT AS JSON '{json_format}'
-REGION '{region}';
+REGION '{region}'
+{copy_options};
+"""
+
+SELECT_LOAD_LEDGER = """
+SELECT s3_key, etag, size
+FROM staging_load_ledger
+WHERE table_name = %s;
 """
+
+INSERT_LOAD_LEDGER = """
+INSERT INTO staging_load_ledger (table_name, s3_key, etag, size, loaded_at)
+VALUES %s
+"""
+
+SELECT_SLICE_COUNT = "SELECT COUNT(*) FROM stv_slices;"
+
+SELECT_TABLE_HEALTH = """
+SELECT "table", unsorted, stats_off, tbl_rows
+FROM svv_table_info
+WHERE "schema" = %s
+  AND "table" IN %s;
+"""
+
+VACUUM_TABLE = "VACUUM {mode} {table} TO {percent} PERCENT;"
+ANALYZE_TABLE = "ANALYZE {table};"
+
+INSERT_MAINTENANCE_LOG = """
+INSERT INTO table_maintenance_log (
+    table_name, action, unsorted, stats_off, tbl_rows, duration_seconds, run_at
+)
+VALUES %s
+"""
+
+UNLOAD_TO_S3 = """
+UNLOAD ('{query}')
+TO 's3://{bucket}/{s3_key}'
+IAM_ROLE '{iam_role}'
+FORMAT AS PARQUET
+{unload_options};
+"""
+
+EXPORT_TABLE_SELECT = "SELECT * FROM {table}"
+
+# The rows of an export inside a run's data interval, on a UTC timestamp.
+EXPORT_INTERVAL_SELECT = """
+SELECT *
+FROM ({query}) AS export
+WHERE {column} >= '{start}' AND {column} < '{end}'
+"""
+
+# Plays with the year, month, day and hour of their start time to partition
+# the export by; all are dropped from the Parquet files and kept in the key.
+SONGPLAY_EXPORT_SELECT = """
+SELECT songplays.*, time.year, time.month, time.day, time.hour
+FROM songplays
+JOIN time
+ON time.start_time = songplays.start_time
+"""
+
+SELECT_LAST_QUERY_ID = "SELECT pg_last_query_id();"
+
+SELECT_WLM_TIMES = """
+SELECT query, total_queue_time, total_exec_time
+FROM stl_wlm_query
+WHERE query IN %s;
+"""
+
+# Session settings applied before an operator's statements; see
+# helpers.session_settings.
+SET_QUERY_GROUP = "SET query_group TO '{query_group}';"
+SET_STATEMENT_TIMEOUT = "SET statement_timeout TO {milliseconds};"
+SET_WLM_QUERY_SLOT_COUNT = "SET wlm_query_slot_count TO {slots};"
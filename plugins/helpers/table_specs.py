@@ -0,0 +1,288 @@
+"""Declarative table definitions for the Redshift schema"""
+
+from typing import Any, Dict, List
+
+DISTSTYLES = ("AUTO", "EVEN", "ALL", "KEY")
+SORTKEY_STYLES = ("COMPOUND", "INTERLEAVED")
+
+# Each spec lists the table's columns as (name, type) pairs in table order, its
+# constraints, and its physical layout:
+#
+# - ``diststyle``: one of DISTSTYLES. Implied "KEY" when ``distkey`` is set.
+# - ``distkey``: the column rows are distributed on.
+# - ``sortkey``: the sort key columns, or "AUTO".
+# - ``sortkey_style``: one of SORTKEY_STYLES. Defaults to "COMPOUND".
+TABLE_SPECS: Dict[str, Dict[str, Any]] = {
+    # song_key, the one column the song match in SONGPLAY_TABLE_INSERT joins
+    # on, is filled in after COPY by the *_SONG_KEY_UPDATE statements. Both
+    # staging tables are distributed on it, so the join runs without moving
+    # rows. Events that are not NextSong plays are keyed on the event itself,
+    # so none has a NULL key that would pile onto one slice. staged_at is left
+    # out of the COPY column lists, so every copied row gets the start of the
+    # COPY's transaction. Neither is part of the JSON.
+    "staging_events": {
+        "columns": [
+            ("artist", "varchar(512)"),
+            ("auth", "varchar(512)"),
+            ("firstname", "varchar(512)"),
+            ("gender", "varchar(512)"),
+            ("iteminsession", "int4"),
+            ("lastname", "varchar(512)"),
+            ("length", "float8"),
+            ('"level"', "varchar(512)"),
+            ("location", "varchar(512)"),
+            ('"method"', "varchar(512)"),
+            ("page", "varchar(512)"),
+            ("registration", "numeric(18,0)"),
+            ("sessionid", "int4"),
+            ("song", "varchar(512)"),
+            ("status", "int4"),
+            ("ts", "int8"),
+            ("useragent", "varchar(512)"),
+            ("userid", "int4"),
+            ("song_key", "char(32)"),
+            ("staged_at", "timestamp DEFAULT SYSDATE"),
+        ],
+        "distkey": "song_key",
+        "sortkey": ["ts"],
+    },
+    "staging_songs": {
+        "columns": [
+            ("num_songs", "int4"),
+            ("artist_id", "varchar(512)"),
+            ("artist_name", "varchar(512)"),
+            ("artist_latitude", "numeric(18,0)"),
+            ("artist_longitude", "numeric(18,0)"),
+            ("artist_location", "varchar(512)"),
+            ("song_id", "varchar(512)"),
+            ("title", "varchar(512)"),
+            ("duration", "float8"),
+            ('"year"', "int4"),
+            ("song_key", "char(32)"),
+            ("staged_at", "timestamp DEFAULT SYSDATE"),
+        ],
+        "distkey": "song_key",
+        # Each run appends its songs with a later staged_at, so the merge
+        # selects of the latest batch skip every older block.
+        "sortkey": ["staged_at"],
+    },
+    # Most plays match no song, so songid is largely null and would skew a
+    # KEY distribution; Redshift picks the distribution instead. Sorting on
+    # start_time lets time-range queries skip blocks.
+    "songplays": {
+        "columns": [
+            ("playid", "varchar(32) NOT NULL"),
+            ("start_time", "timestamp NOT NULL"),
+            ("userid", "int4 NOT NULL"),
+            ('"level"', "varchar(512)"),
+            ("songid", "varchar(512)"),
+            ("artistid", "varchar(512)"),
+            ("sessionid", "int4"),
+            ("location", "varchar(512)"),
+            ("user_agent", "varchar(512)"),
+        ],
+        "constraints": ["CONSTRAINT songplays_pkey PRIMARY KEY (playid)"],
+        "diststyle": "AUTO",
+        "sortkey": ["start_time"],
+    },
+    "users": {
+        "columns": [
+            ("userid", "int4 NOT NULL"),
+            ("first_name", "varchar(512)"),
+            ("last_name", "varchar(512)"),
+            ("gender", "varchar(512)"),
+            ('"level"', "varchar(512)"),
+        ],
+        "constraints": ["CONSTRAINT users_pkey PRIMARY KEY (userid)"],
+        "diststyle": "ALL",
+        "sortkey": ["userid"],
+    },
+    "songs": {
+        "columns": [
+            ("songid", "varchar(512) NOT NULL"),
+            ("title", "varchar(512)"),
+            ("artistid", "varchar(512)"),
+            ('"year"', "int4"),
+            ("duration", "float8"),
+        ],
+        "constraints": ["CONSTRAINT songs_pkey PRIMARY KEY (songid)"],
+        "diststyle": "ALL",
+        "sortkey": ["songid"],
+    },
+    "artists": {
+        "columns": [
+            ("artistid", "varchar(512) NOT NULL"),
+            ("name", "varchar(512)"),
+            ("location", "varchar(512)"),
+            ("lattitude", "numeric(18,0)"),
+            ("longitude", "numeric(18,0)"),
+        ],
+        "diststyle": "ALL",
+        "sortkey": ["artistid"],
+    },
+    "time": {
+        "columns": [
+            ("start_time", "timestamp NOT NULL"),
+            ('"hour"', "int4"),
+            ('"day"', "int4"),
+            ("week", "int4"),
+            ('"month"', "varchar(512)"),
+            ('"year"', "int4"),
+            ("weekday", "varchar(512)"),
+        ],
+        "constraints": ["CONSTRAINT time_pkey PRIMARY KEY (start_time)"],
+        "diststyle": "ALL",
+        "sortkey": ["start_time"],
+    },
+    # Aggregates of songplays refreshed by RefreshRollupsOperator, one row
+    # per time bucket and key. Sorted on the bucket so that a refresh only
+    # rewrites the blocks of the buckets it touches.
+    "user_daily_plays": {
+        "columns": [
+            ("play_date", "date NOT NULL"),
+            ("userid", "int4 NOT NULL"),
+            ("plays", "int8 NOT NULL"),
+            ("sessions", "int8 NOT NULL"),
+        ],
+        "diststyle": "AUTO",
+        "sortkey": ["play_date", "userid"],
+    },
+    "song_hourly_plays": {
+        "columns": [
+            ("play_hour", "timestamp NOT NULL"),
+            ("songid", "varchar(512) NOT NULL"),
+            ("artistid", "varchar(512)"),
+            ("plays", "int8 NOT NULL"),
+            ("listeners", "int8 NOT NULL"),
+        ],
+        "diststyle": "AUTO",
+        "sortkey": ["play_hour"],
+    },
+    "artist_hourly_plays": {
+        "columns": [
+            ("play_hour", "timestamp NOT NULL"),
+            ("artistid", "varchar(512) NOT NULL"),
+            ("plays", "int8 NOT NULL"),
+            ("listeners", "int8 NOT NULL"),
+        ],
+        "diststyle": "AUTO",
+        "sortkey": ["play_hour"],
+    },
+    # Records the S3 objects already copied into each staging table. It is
+    # dropped and recreated together with the staging tables, and a staging
+    # table that is recreated on its own has its entries deleted, so that it
+    # always describes what they currently hold.
+    "staging_load_ledger": {
+        "columns": [
+            ("table_name", "varchar(128) NOT NULL"),
+            ("s3_key", "varchar(1024) NOT NULL"),
+            ("etag", "varchar(64) NOT NULL"),
+            ("size", "int8 NOT NULL"),
+            ("loaded_at", "timestamp NOT NULL"),
+        ],
+        "constraints": [
+            "CONSTRAINT staging_load_ledger_pkey PRIMARY KEY (table_name, s3_key, etag)"
+        ],
+        "diststyle": "ALL",
+        "sortkey": ["table_name", "s3_key"],
+    },
+    # One row per VACUUM or ANALYZE run by TableMaintenanceOperator.
+    "table_maintenance_log": {
+        "columns": [
+            ("table_name", "varchar(128) NOT NULL"),
+            ("action", "varchar(64) NOT NULL"),
+            ("unsorted", "float8"),
+            ("stats_off", "float8"),
+            ("tbl_rows", "int8"),
+            ("duration_seconds", "float8 NOT NULL"),
+            ("run_at", "timestamp NOT NULL"),
+        ],
+        "diststyle": "ALL",
+        "sortkey": ["run_at"],
+    },
+    # One row per metric of each table profile taken by DataQualityOperator,
+    # the history profile drift is measured against.
+    "data_quality_profiles": {
+        "columns": [
+            ("table_name", "varchar(128) NOT NULL"),
+            ("metric", "varchar(256) NOT NULL"),
+            ("value", "float8"),
+            ("run_id", "varchar(256) NOT NULL"),
+            ("profiled_at", "timestamp NOT NULL"),
+        ],
+        "diststyle": "ALL",
+        "sortkey": ["table_name", "profiled_at"],
+    },
+}
+
+
+def render_create_table(
+    table_name: str, spec: Dict[str, Any], portable: bool = False
+) -> str:
+    """Render the CREATE TABLE statement for a table spec.
+
+    Columns and constraints are rendered one per line.
+
+    Parameters
+    ----------
+    table_name : str
+        The name of the table.
+    spec : Dict[str, Any]
+        The table spec, as described for ``TABLE_SPECS``.
+    portable : bool, optional
+        Leave out the constraints and the distribution and sort keys, for
+        local stand-ins that do not understand the keys or would enforce
+        the constraints, which Redshift does not. Defaults to False.
+
+    Returns
+    -------
+    str
+        The CREATE TABLE IF NOT EXISTS statement.
+    """
+    distkey = spec.get("distkey")
+    diststyle = spec.get("diststyle", "KEY" if distkey else "EVEN").upper()
+    sortkey = spec.get("sortkey")
+    sortkey_style = spec.get("sortkey_style", "COMPOUND").upper()
+
+    if diststyle not in DISTSTYLES:
+        raise ValueError(
+            f"Unknown diststyle {diststyle} for {table_name}, "
+            f"expected one of {DISTSTYLES}."
+        )
+
+    if (diststyle == "KEY") != bool(distkey):
+        raise ValueError(
+            f"Table {table_name} needs a distkey exactly when diststyle is KEY."
+        )
+
+    if sortkey_style not in SORTKEY_STYLES:
+        raise ValueError(
+            f"Unknown sortkey style {sortkey_style} for {table_name}, "
+            f"expected one of {SORTKEY_STYLES}."
+        )
+
+    lines: List[str] = [f"{name} {kind}" for name, kind in spec["columns"]]
+
+    if portable:
+        body = ",\n    ".join(lines)
+        return f"\nCREATE TABLE IF NOT EXISTS {table_name} (\n    {body}\n);\n"
+
+    lines.extend(spec.get("constraints", []))
+
+    layout = [f"DISTSTYLE {diststyle}"]
+
+    if distkey:
+        layout.append(f"DISTKEY ({distkey})")
+
+    if sortkey == "AUTO":
+        layout.append("SORTKEY AUTO")
+    elif sortkey:
+        layout.append(f"{sortkey_style} SORTKEY ({', '.join(sortkey)})")
+
+    body = ",\n    ".join(lines)
+
+    return (
+        f"\nCREATE TABLE IF NOT EXISTS {table_name} (\n    {body}\n)\n"
+        + "\n".join(layout)
+        + ";\n"
+    )
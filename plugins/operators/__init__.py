@@ -3,5 +3,11 @@
 from stage_redshift import StageToRedshiftOperator
 from load_fact import LoadFactOperator
 from load_dimension import LoadDimensionOperator
+from load_dimensions import LoadDimensionsOperator
 from data_quality import DataQualityOperator
 from create_tables import CreateTablesOperator
+from table_maintenance import TableMaintenanceOperator
+from compact_s3 import CompactS3FilesOperator
+from unload_s3 import UnloadToS3Operator
+from refresh_rollups import RefreshRollupsOperator
+from source_fingerprint import SourceFingerprintOperator
@@ -0,0 +1,285 @@
+"""Operator to compact many small S3 JSON objects into a few large files."""
+
+import gzip
+import heapq
+import json
+import os
+import tempfile
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterator, List, Tuple
+
+from psycopg2.extras import execute_values
+
+from airflow.models import BaseOperator
+from airflow.providers.amazon.aws.hooks.s3 import S3Hook
+
+import helpers.sql_queries as SQL_QUERIES
+from helpers.query_metrics import InstrumentedHook, get_db_hook
+from helpers.s3_objects import list_objects
+from helpers.session_settings import render_session_settings
+
+COMPRESSIONS = {"gzip": ".json.gz", "zstd": ".json.zst"}
+
+
+def _json_records(body: str) -> Iterator[Any]:
+    """Yield every JSON value in ``body``, whether one per line or not."""
+    decoder = json.JSONDecoder()
+    position = 0
+
+    while True:
+        while position < len(body) and body[position].isspace():
+            position += 1
+
+        if position == len(body):
+            return
+
+        record, position = decoder.raw_decode(body, position)
+        yield record
+
+
+def _balance(
+    objects: List[Tuple[str, str, int]], num_parts: int
+) -> List[List[Tuple[str, str, int]]]:
+    """Split objects into parts of about equal total size, largest first."""
+    parts: List[List[Tuple[str, str, int]]] = [[] for _ in range(num_parts)]
+    heap = [(0, index) for index in range(num_parts)]
+
+    for obj in sorted(objects, key=lambda obj: obj[2], reverse=True):
+        size, index = heapq.heappop(heap)
+        parts[index].append(obj)
+        heapq.heappush(heap, (size + obj[2], index))
+
+    # Keep the source order within a part, which keeps the output stable.
+    return [sorted(part) for part in parts]
+
+
+class CompactS3FilesOperator(BaseOperator):
+    """Operator to compact many small S3 JSON objects into a few large files.
+
+    COPY spends most of its time opening files when a prefix holds one small
+    object per record, as ``song-data/`` does. This operator streams the
+    objects one at a time into ``num_files`` compressed newline-delimited
+    JSON files under ``{target_prefix}{ts_nodash}/``, so memory use is bounded
+    by the largest object. The compacted objects are recorded in the
+    ``staging_load_ledger`` table, so later runs only compact new objects,
+    and the staging operator's manifest picks up only the new parts.
+
+    Parameters
+    ----------
+    db_connection_id : str
+        The ID of the database connection to use.
+    source_bucket : str
+        The bucket holding the small objects.
+    source_prefix : str
+        The key prefix of the small objects, e.g. "song-data/".
+    target_bucket : str
+        The bucket the compacted files are written to.
+    target_prefix : str
+        The key prefix the compacted files are written under, e.g.
+        "song-data-compacted/".
+    num_files : int, optional
+        The number of files to write. Defaults to the number of slices in
+        the cluster, so that COPY loads every slice in parallel.
+    compression : str, optional
+        "gzip" or "zstd". zstd needs the ``zstandard`` package. Defaults to
+        "gzip".
+    aws_connection_id : str, optional
+        The ID of the AWS connection to use. Defaults to "aws_default".
+    connection_type : str, optional
+        The type of database connection to use. Nothing is compacted outside
+        Redshift. Defaults to "Redshift".
+    session_settings : Dict[str, Any], optional
+        WLM settings over ``session_defaults``, as in
+        ``helpers.session_settings``. The ledger queries run in the "etl_copy"
+        query group.
+
+    Methods
+    -------
+    execute(self, context: Dict[str, Any]) -> List[str]
+        Execute the compaction.
+    """
+
+    ui_color = "#9FD5A0"
+    template_fields = (
+        "_source_bucket",
+        "_source_prefix",
+        "_target_bucket",
+        "_target_prefix",
+    )
+    session_defaults = {"query_group": "etl_copy"}
+
+    def __init__(self, **kwargs: Dict[str, Any]):
+        self._db_connection_id = kwargs.pop("db_connection_id", None)
+        self._source_bucket = kwargs.pop("source_bucket", None)
+        self._source_prefix = kwargs.pop("source_prefix", "")
+        self._target_bucket = kwargs.pop("target_bucket", None)
+        self._target_prefix = kwargs.pop("target_prefix", None)
+        self._num_files = kwargs.pop("num_files", None)
+        self._compression = kwargs.pop("compression", "gzip")
+        self._aws_connection_id = kwargs.pop("aws_connection_id", "aws_default")
+        self._connection_type = kwargs.pop("connection_type", "Redshift")
+        self._session_stmts = render_session_settings(
+            {**self.session_defaults, **(kwargs.pop("session_settings", None) or {})},
+            self._connection_type,
+        )
+
+        if self._compression not in COMPRESSIONS:
+            raise ValueError(
+                f"Unknown compression {self._compression}, "
+                f"expected one of {tuple(COMPRESSIONS)}."
+            )
+
+        if not self._target_prefix or self._target_prefix.startswith(
+            self._source_prefix
+        ):
+            raise ValueError("target_prefix must be set and outside source_prefix.")
+
+        if self._num_files is not None and self._num_files < 1:
+            raise ValueError(f"num_files must be >= 1, got {self._num_files}.")
+
+        super().__init__(**kwargs)
+
+    @property
+    def _ledger_name(self) -> str:
+        return f"compact:{self._target_prefix}"
+
+    def _open_part(self, path: str) -> BinaryIO:
+        """Open a local part file for compressed writing."""
+        if self._compression == "zstd":
+            # pylint: disable=import-outside-toplevel
+            import zstandard
+
+            return zstandard.ZstdCompressor().stream_writer(open(path, "wb"))
+
+        return gzip.open(path, "wb")
+
+    def _write_part(
+        self, s3_hook: S3Hook, objects: List[Tuple[str, str, int]], path: str
+    ) -> int:
+        """Stream objects into one compressed part file.
+
+        Returns
+        -------
+        int
+            The number of records written.
+        """
+        records = 0
+
+        with self._open_part(path) as part:
+            for key, _, _ in objects:
+                body = (
+                    s3_hook.get_key(key, bucket_name=self._source_bucket)
+                    .get()["Body"]
+                    .read()
+                    .decode("utf-8")
+                )
+
+                for record in _json_records(body):
+                    part.write(json.dumps(record).encode("utf-8") + b"\n")
+                    records += 1
+
+        return records
+
+    def _record(
+        self, db_hook: InstrumentedHook, objects: List[Tuple[str, str, int]]
+    ) -> None:
+        """Record the compacted source objects in the load ledger."""
+        compacted_at = datetime.utcnow()
+        conn = db_hook.get_conn()
+
+        try:
+            with conn.cursor() as cursor:
+                with db_hook.measure(cursor, SQL_QUERIES.INSERT_LOAD_LEDGER):
+                    execute_values(
+                        cursor,
+                        SQL_QUERIES.INSERT_LOAD_LEDGER,
+                        [
+                            (self._ledger_name, key, etag, size, compacted_at)
+                            for key, etag, size in objects
+                        ],
+                    )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def execute(self, context: Dict[str, Any]) -> List[str]:
+        """Execute the compaction.
+
+        Parameters
+        ----------
+        context : Dict[str, Any]
+            The Airflow execution context containing information about the
+            current execution.
+
+        Returns
+        -------
+        List[str]
+            The keys of the compacted files written, pushed to XCom.
+        """
+        self.log.info(
+            "Compacting s3://%s/%s...", self._source_bucket, self._source_prefix
+        )
+        self.log.debug("Using context: %s", context)
+
+        if self._connection_type != "Redshift":
+            self.log.info("Nothing to compact outside Redshift.")
+            return []
+
+        db_hook = get_db_hook(
+            self._db_connection_id, self._connection_type, self._session_stmts
+        )
+        s3_hook = S3Hook(aws_conn_id=self._aws_connection_id)
+
+        listed = list_objects(s3_hook, self._source_bucket, [self._source_prefix])
+        compacted = {
+            tuple(record)
+            for record in db_hook.get_records(
+                SQL_QUERIES.SELECT_LOAD_LEDGER, parameters=(self._ledger_name,)
+            )
+        }
+        unseen = [obj for obj in listed if obj not in compacted]
+
+        self.log.info(
+            "Found %s objects, %s not yet compacted.", len(listed), len(unseen)
+        )
+
+        if not unseen:
+            db_hook.publish(context)
+            return []
+
+        num_files = self._num_files or db_hook.get_first(
+            SQL_QUERIES.SELECT_SLICE_COUNT
+        )[0]
+        parts = [part for part in _balance(unseen, num_files) if part]
+        keys = []
+
+        with tempfile.TemporaryDirectory() as directory:
+            for index, part in enumerate(parts):
+                path = os.path.join(directory, f"part-{index:05d}")
+                key = (
+                    f"{self._target_prefix}{context['ts_nodash']}/"
+                    f"part-{index:05d}{COMPRESSIONS[self._compression]}"
+                )
+
+                records = self._write_part(s3_hook, part, path)
+                s3_hook.load_file(
+                    path, key=key, bucket_name=self._target_bucket, replace=True
+                )
+                os.remove(path)
+
+                self.log.info(
+                    "Wrote %s records from %s objects to %s.",
+                    records,
+                    len(part),
+                    key,
+                )
+                keys.append(key)
+
+        # Recorded only after every part is uploaded. A retry rewrites the
+        # same keys, so a failure in between does not duplicate records.
+        self._record(db_hook, unseen)
+        db_hook.publish(context)
+
+        self.log.info("Compacted %s objects into %s files.", len(unseen), len(keys))
+
+        return keys
@@ -1,10 +1,20 @@
 """Operators used to create tables in Redshift"""
 
-from typing import Dict, Any
+import hashlib
+import re
+from typing import Dict, Any, List, Tuple
 
-from airflow.hooks.postgres_hook import PostgresHook
 from airflow.models import BaseOperator
 
+import helpers.sql_queries as SQL_QUERIES
+from helpers.query_metrics import InstrumentedHook, get_db_hook
+from helpers.session_settings import render_session_settings
+
+FINGERPRINT_PREFIX = "schema_fingerprint:"
+TABLE_NAME_PATTERN = re.compile(
+    r"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?\"?(\w+)\"?", re.IGNORECASE
+)
+
 
 class CreateTablesOperator(BaseOperator):
     """Operator used to create tables in Redshift
@@ -17,6 +27,37 @@ class CreateTablesOperator(BaseOperator):
         A dictionary mapping table names to their SQL CREATE TABLE statements.
     connection_type : str, optional
         The type of database connection to use. Defaults to "Redshift".
+    single_session : bool, optional
+        Run every statement over one connection instead of opening a new one
+        per statement, and log how long each statement took. Defaults to
+        False.
+    single_transaction : bool, optional
+        With ``single_session``, commit all the statements together so that a
+        failure leaves the previous tables in place. Defaults to False.
+    reconcile : bool, optional
+        Instead of dropping and recreating every table, read the live schema
+        from the catalog and only create the tables that are missing, and
+        drop and recreate those whose columns or ``CREATE TABLE`` statement
+        changed. Each table records a fingerprint of its statement in its
+        comment. ``drop_table_stmts`` is not used. Defaults to False.
+    schema_name : str, optional
+        The schema reconciled. Defaults to "public".
+    on_recreate_stmts : List[str], optional
+        Statements run for every table that reconcile drops and recreates,
+        with the table name as ``{table}``, e.g. to forget what was loaded
+        into it. Defaults to an empty list.
+    truncate_on_create : Dict[str, List[str]], optional
+        The tables emptied when reconcile creates or recreates a table, by
+        that table's name, e.g. the staging tables a load ledger describes,
+        which would otherwise be loaded again on top of their rows. Defaults
+        to an empty dict.
+    backfill_tables : List[str], optional
+        The tables whose rows cannot be reloaded from staging. Reconcile logs
+        a warning that the DAG needs a backfill for each one it recreates.
+        Defaults to an empty list.
+    session_settings : Dict[str, Any], optional
+        WLM settings over ``session_defaults``, as in
+        ``helpers.session_settings``. The DDL runs in the "etl_ddl" query group.
 
     Methods
     -------
@@ -25,15 +66,244 @@ class CreateTablesOperator(BaseOperator):
     """
 
     ui_color = "#80BD9E"
+    template_fields = (
+        "_create_table_stmts",
+        "_drop_table_stmts",
+        "_schema_name",
+        "_on_recreate_stmts",
+        "_truncate_on_create",
+        "_backfill_tables",
+    )
+    session_defaults = {"query_group": "etl_ddl"}
 
     def __init__(self, **kwargs: Dict[str, Any]):
         self._db_connection_id = kwargs.pop("db_connection_id")
         self._create_table_stmts = kwargs.pop("create_table_stmts")
         self._drop_table_stmts = kwargs.pop("drop_table_stmts", [])
         self._connection_type = kwargs.pop("connection_type", "Redshift")
+        self._session_stmts = render_session_settings(
+            {**self.session_defaults, **(kwargs.pop("session_settings", None) or {})},
+            self._connection_type,
+        )
+        self._single_session = kwargs.pop("single_session", False)
+        self._single_transaction = kwargs.pop("single_transaction", False)
+        self._reconcile = kwargs.pop("reconcile", False)
+        self._schema_name = kwargs.pop("schema_name", "public")
+        self._on_recreate_stmts = kwargs.pop("on_recreate_stmts", [])
+        self._truncate_on_create = kwargs.pop("truncate_on_create", {})
+        self._backfill_tables = kwargs.pop("backfill_tables", [])
+
+        if self._single_transaction and not self._single_session:
+            raise ValueError("single_transaction requires single_session.")
+
+        if self._reconcile and self._connection_type == "DuckDB":
+            raise ValueError(
+                "reconcile reads pg_catalog and is not supported on DuckDB."
+            )
 
         super().__init__(**kwargs)
 
+    @staticmethod
+    def _table_name(sql: str) -> str:
+        """Return the name of the table a CREATE TABLE statement creates.
+
+        Parameters
+        ----------
+        sql : str
+            The CREATE TABLE statement.
+
+        Returns
+        -------
+        str
+            The table name.
+        """
+        match = TABLE_NAME_PATTERN.search(sql)
+
+        if not match:
+            raise ValueError(f"Not a CREATE TABLE statement: {sql}")
+
+        return match.group(1).lower()
+
+    @staticmethod
+    def _column_names(sql: str) -> List[str]:
+        """Return the column names of a CREATE TABLE statement, in order.
+
+        Expects one column or constraint per line, as in ``sql_queries``.
+
+        Parameters
+        ----------
+        sql : str
+            The CREATE TABLE statement.
+
+        Returns
+        -------
+        List[str]
+            The column names.
+        """
+        start = sql.index("(") + 1
+        end = start
+        depth = 1
+
+        # Find the parenthesis closing the column list, not a key clause.
+        while depth:
+            depth += {"(": 1, ")": -1}.get(sql[end], 0)
+            end += 1
+
+        body = sql[start : end - 1]
+        columns = []
+
+        for line in body.splitlines():
+            tokens = line.strip().split()
+
+            if not tokens or tokens[0].upper() in ("CONSTRAINT", "PRIMARY", "UNIQUE"):
+                continue
+
+            columns.append(tokens[0].strip('"').lower())
+
+        return columns
+
+    @staticmethod
+    def _fingerprint(sql: str) -> str:
+        """Fingerprint a CREATE TABLE statement, ignoring whitespace and case.
+
+        Parameters
+        ----------
+        sql : str
+            The CREATE TABLE statement.
+
+        Returns
+        -------
+        str
+            The fingerprint recorded in the table comment.
+        """
+        normalized = " ".join(sql.split()).lower()
+
+        return FINGERPRINT_PREFIX + hashlib.md5(normalized.encode()).hexdigest()
+
+    def _reconcile_stmts(self, db_hook: InstrumentedHook) -> List[str]:
+        """Compare the live schema with the CREATE TABLE statements.
+
+        Parameters
+        ----------
+        db_hook : InstrumentedHook
+            The hook connected to the database.
+
+        Returns
+        -------
+        List[str]
+            The statements that bring the live schema up to date, empty if it
+            already is.
+        """
+        tables = [(self._table_name(sql), sql) for sql in self._create_table_stmts]
+
+        live_columns: Dict[str, List[str]] = {}
+        live_fingerprints: Dict[str, str] = {}
+
+        for table_name, column_name, description in db_hook.get_records(
+            SQL_QUERIES.SELECT_SCHEMA_CATALOG,
+            parameters=(self._schema_name, tuple(name for name, _ in tables)),
+        ):
+            live_columns.setdefault(table_name, []).append(column_name)
+            live_fingerprints[table_name] = description
+
+        statements = []
+        created = []
+        recreated = []
+
+        for table_name, sql in tables:
+            fingerprint = self._fingerprint(sql)
+            comment = SQL_QUERIES.COMMENT_SCHEMA_FINGERPRINT.format(
+                table=table_name, fingerprint=fingerprint
+            )
+
+            if table_name not in live_columns:
+                self.log.info("Table %s is missing, creating it.", table_name)
+                statements.extend([sql, comment])
+                created.append(table_name)
+            elif (
+                live_fingerprints[table_name] == fingerprint
+                and live_columns[table_name] == self._column_names(sql)
+            ):
+                self.log.info("Table %s is unchanged.", table_name)
+            else:
+                self.log.info("Table %s changed, recreating it.", table_name)
+                statements.extend(
+                    [SQL_QUERIES.DROP_TABLE.format(table=table_name), sql, comment]
+                )
+                recreated.append(table_name)
+
+        # Run after every table exists, so they may refer to any of them.
+        for table_name in recreated:
+            statements.extend(
+                stmt.format(table=table_name) for stmt in self._on_recreate_stmts
+            )
+
+        truncated = [
+            truncated_table
+            for table_name in created + recreated
+            for truncated_table in self._truncate_on_create.get(table_name, [])
+            if truncated_table not in created + recreated
+        ]
+
+        for table_name in dict.fromkeys(truncated):
+            self.log.info("Emptying table %s.", table_name)
+            statements.append(SQL_QUERIES.DELETE_ALL_ROWS.format(table=table_name))
+
+        for table_name in recreated:
+            if table_name in self._backfill_tables:
+                self.log.warning(
+                    "Table %s was recreated EMPTY: backfill the DAG over the "
+                    "history it held, or its rows are lost.",
+                    table_name,
+                )
+
+        return statements
+
+    def _run_in_session(
+        self, db_hook: InstrumentedHook, statements: List[str]
+    ) -> List[Tuple[str, float]]:
+        """Run the statements in order over a single connection.
+
+        Parameters
+        ----------
+        db_hook : InstrumentedHook
+            The hook connected to the database.
+        statements : List[str]
+            The statements to run.
+
+        Returns
+        -------
+        List[Tuple[str, float]]
+            Each statement with the seconds it took to run.
+        """
+        timings = []
+        conn = db_hook.get_conn()
+        conn.autocommit = not self._single_transaction
+
+        try:
+            with conn.cursor() as cursor:
+                for sql in statements:
+                    with db_hook.measure(cursor, sql):
+                        cursor.execute(sql)
+
+                    elapsed = db_hook.metrics[-1]["wall_time"]
+
+                    self.log.info(
+                        "Ran in %.3fs: %s", elapsed, " ".join(sql.split()[:5])
+                    )
+                    timings.append((sql, elapsed))
+
+            if self._single_transaction:
+                conn.commit()
+        except Exception:
+            if self._single_transaction:
+                conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        return timings
+
     def execute(self, context: Dict[str, Any]) -> None:
         """Execute the create tables operation.
 
@@ -45,14 +315,33 @@ class CreateTablesOperator(BaseOperator):
         """
         self.log.debug("Using context: %s", context)
 
-        db_hook = PostgresHook(postgres_conn_id=self._db_connection_id)
+        db_hook = get_db_hook(
+            self._db_connection_id, self._connection_type, self._session_stmts
+        )
 
         self.log.info("Creating tables in %s...", self._connection_type)
 
-        for sql in self._drop_table_stmts:
-            db_hook.run(sql, autocommit=True)
+        if self._reconcile:
+            statements = self._reconcile_stmts(db_hook)
+
+            if not statements:
+                self.log.info("Schema is up to date in %s.", self._connection_type)
+                db_hook.publish(context)
+                return
+        else:
+            statements = list(self._drop_table_stmts) + list(self._create_table_stmts)
+
+        if self._single_session:
+            timings = self._run_in_session(db_hook, statements)
+            self.log.info(
+                "Ran %s statements in %.3fs.",
+                len(timings),
+                sum(elapsed for _, elapsed in timings),
+            )
+        else:
+            for sql in statements:
+                db_hook.run(sql, autocommit=True)
 
-        for sql in self._create_table_stmts:
-            db_hook.run(sql, autocommit=True)
+        db_hook.publish(context)
 
         self.log.info("Tables created successfully in %s...", self._connection_type)
@@ -1,16 +1,50 @@
 """Data quality check operator and related"""
 
-from typing import Tuple, List, Any, Dict
+import operator
+from datetime import datetime
+from typing import Tuple, List, Any, Dict, Optional
 
-from airflow.hooks.postgres_hook import PostgresHook
 from airflow.models import BaseOperator
 
+import helpers.sql_queries as SQL_QUERIES
+from helpers.data_api import (
+    FAILED_STATUSES,
+    DataAPIMixin,
+    DataAPIStatementError,
+    data_api_client,
+    statement_rows,
+)
+from helpers.query_metrics import InstrumentedHook, get_db_hook
+from helpers.session_settings import render_session_settings
+
+BATCH_MODES = ("union", "catalog")
+
+RULE_TYPES = ("row_count", "null_rate", "unique", "range", "expression")
+RULE_REQUIRED_KEYS = {
+    "row_count": (),
+    "null_rate": ("column",),
+    "unique": ("column",),
+    "range": ("column",),
+    "expression": ("sql", "expected"),
+}
+PROFILE_METRICS = ("approx_distinct", "null_fraction", "percentile")
+DRIFT_ACTIONS = ("warn", "fail")
+
+COMPARISONS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
 
 class DataQualityCheckError(Exception):
     """Raised when data quality check fails"""
 
 
-class DataQualityOperator(BaseOperator):
+class DataQualityOperator(DataAPIMixin, BaseOperator):
     """Basic data quality check operator. Checks the count of rows in each table.
 
     Parameters
@@ -21,54 +55,779 @@ class DataQualityOperator(BaseOperator):
         The names of the tables to check.
     connection_type : str, optional
         The type of database connection to use. Defaults to "Redshift".
+    batch_mode : str, optional
+        Count every table in a single query instead of one query per table.
+        "union" combines exact ``COUNT(*)`` checks with ``UNION ALL``;
+        "catalog" reads ``tbl_rows`` from ``svv_table_info``, which costs no
+        table scan but also counts deleted rows that have not been vacuumed
+        yet. Defaults to None.
+    schema_name : str, optional
+        The schema looked up in "catalog" mode. Defaults to "public".
+    rules : Dict[str, List[Dict[str, Any]]], optional
+        Declarative checks per table. Every rule is a dict with a ``rule``
+        key and its settings:
+
+        - ``row_count``: ``min``, defaults to 1.
+        - ``null_rate``: ``column`` and ``max``, defaults to 0.
+        - ``unique``: ``column`` may not hold duplicate non-null values.
+        - ``range``: ``column`` with ``min`` and/or ``max`` numeric bounds.
+        - ``expression``: an aggregate ``sql`` expression compared with
+          ``expected`` using ``comparison``, defaults to "==".
+
+        All the rules of a table run as one aggregate query, so each table is
+        scanned once. A table with rules but no ``row_count`` rule also gets
+        the default row count check, and is left out of the plain row count
+        checks of ``table_names``. Defaults to None.
+    profiles : Dict[str, List[Dict[str, Any]]], optional
+        Approximate metrics to profile per table, each a dict with a
+        ``metric`` and a ``column``:
+
+        - ``approx_distinct``: ``APPROXIMATE COUNT(DISTINCT column)``.
+        - ``null_fraction``: the share of NULLs in ``column``.
+        - ``percentile``: ``APPROXIMATE PERCENTILE_DISC`` at ``fraction``,
+          between 0 and 1, of a numeric ``column``.
+
+        and optionally its own ``tolerance``. Every profile also holds the
+        row count. The metrics are computed in the same aggregate query as
+        the table's rules, so each table is still scanned once. The profile
+        is recorded in ``data_quality_profiles``, and every metric is
+        compared with its average over the table's last ``profile_window``
+        profiles, read in a separate short query. Defaults to None.
+    profile_tolerance : float, optional
+        The relative distance from the trailing average beyond which a
+        metric drifts. Defaults to 0.5.
+    profile_window : int, optional
+        The number of past profiles averaged. Defaults to 7.
+    profile_min_history : int, optional
+        Drift is only checked once a metric has this many past profiles.
+        Defaults to 3.
+    on_drift : str, optional
+        "warn" logs drifting metrics, "fail" fails the task on them like a
+        failed check. Defaults to "warn".
+    deferrable : bool, optional
+        Submit every check query through the Redshift Data API at once and
+        defer the task until all have finished, then fetch their results and
+        evaluate them. Not supported with the "catalog" batch mode. Needs a
+        running triggerer. Defaults to False.
+    aws_connection_id : str, optional
+        The ID of the AWS connection used with ``deferrable``. Defaults to
+        "aws_default".
+    poll_interval : float, optional
+        The seconds between two checks on the queries with ``deferrable``.
+        Defaults to 15.
+    session_settings : Dict[str, Any], optional
+        WLM settings over ``session_defaults``, as in
+        ``helpers.session_settings``. The checks run in the "etl_check" query
+        group, so they do not queue behind loads, and are cancelled after 10
+        minutes.
 
     Methods
     -------
     execute(self, context: Dict[str, Any]) -> None
         Executes the data quality check operation.
+    execute_complete(self, context: Dict[str, Any], event: Dict[str, Any]) -> None
+        Evaluates deferred check queries once all of them have finished.
     """
 
     ui_color = "#89DA59"
+    template_fields = ("_table_names", "_data_quality_sql", "_schema_name")
+    session_defaults = {"query_group": "etl_check", "statement_timeout": 600}
 
     def __init__(self, **kwargs: Dict[str, Any]):
         self._db_connection_id = kwargs.pop("db_connection_id", None)
         self._table_names = kwargs.pop("table_names", [])
         self._connection_type = kwargs.pop("connection_type", "Redshift")
+        self._session_stmts = render_session_settings(
+            {**self.session_defaults, **(kwargs.pop("session_settings", None) or {})},
+            self._connection_type,
+        )
         self._data_quality_sql = kwargs.pop("data_quality_sql", None)
+        self._batch_mode = kwargs.pop("batch_mode", None)
+        self._schema_name = kwargs.pop("schema_name", "public")
+        self._rules = kwargs.pop("rules", None) or {}
+        self._profiles = kwargs.pop("profiles", None) or {}
+        self._profile_tolerance = kwargs.pop("profile_tolerance", 0.5)
+        self._profile_window = kwargs.pop("profile_window", 7)
+        self._profile_min_history = kwargs.pop("profile_min_history", 3)
+        self._on_drift = kwargs.pop("on_drift", "warn")
+        self._deferrable = kwargs.pop("deferrable", False)
+        self._aws_connection_id = kwargs.pop("aws_connection_id", "aws_default")
+        self._poll_interval = kwargs.pop("poll_interval", 15.0)
+
+        if self._batch_mode is not None and self._batch_mode not in BATCH_MODES:
+            raise ValueError(
+                f"Unknown batch mode {self._batch_mode}, expected one of {BATCH_MODES}."
+            )
+
+        if self._batch_mode == "catalog" and self._connection_type != "Redshift":
+            raise ValueError(
+                "Batch mode catalog reads svv_table_info and needs Redshift."
+            )
+
+        if self._batch_mode == "catalog" and self._deferrable:
+            raise ValueError("Batch mode catalog is not supported with deferrable.")
+
+        for table_name, rules in self._rules.items():
+            for rule in rules:
+                self._validate_rule(table_name, rule)
+
+        if self._on_drift not in DRIFT_ACTIONS:
+            raise ValueError(
+                f"Unknown on_drift {self._on_drift}, expected one of {DRIFT_ACTIONS}."
+            )
+
+        for table_name, specs in self._profiles.items():
+            for spec in specs:
+                self._validate_profile_metric(table_name, spec)
 
         super().__init__(**kwargs)
 
-    def execute(self, context: Dict[str, Any]) -> None:
-        """Execute the data quality check operation.
+    @staticmethod
+    def _validate_profile_metric(table_name: str, spec: Dict[str, Any]) -> None:
+        """Raise a ValueError if a profile metric is not well formed.
+
+        Parameters
+        ----------
+        table_name : str
+            The table the metric profiles.
+        spec : Dict[str, Any]
+            The metric to validate.
+        """
+        if spec.get("metric") not in PROFILE_METRICS:
+            raise ValueError(
+                f"Unknown profile metric {spec.get('metric')} for table "
+                f"{table_name}, expected one of {PROFILE_METRICS}."
+            )
+
+        if not spec.get("column"):
+            raise ValueError(
+                f"Profile metric {spec['metric']} for table {table_name} "
+                "requires column."
+            )
+
+        if spec["metric"] == "percentile" and not 0 < spec.get("fraction", -1) < 1:
+            raise ValueError(
+                f"Profile metric percentile for table {table_name} requires a "
+                "fraction between 0 and 1."
+            )
+
+    @staticmethod
+    def _validate_rule(table_name: str, rule: Dict[str, Any]) -> None:
+        """Raise a ValueError if a rule is not well formed.
 
         Parameters
         ----------
+        table_name : str
+            The table the rule applies to.
+        rule : Dict[str, Any]
+            The rule to validate.
+        """
+        rule_type = rule.get("rule")
+
+        if rule_type not in RULE_TYPES:
+            raise ValueError(
+                f"Unknown rule {rule_type} for table {table_name}, "
+                f"expected one of {RULE_TYPES}."
+            )
+
+        missing = [key for key in RULE_REQUIRED_KEYS[rule_type] if key not in rule]
+
+        if missing:
+            raise ValueError(
+                f"Rule {rule_type} for table {table_name} is missing {missing}."
+            )
+
+        if rule_type == "range" and "min" not in rule and "max" not in rule:
+            raise ValueError(
+                f"Rule range for table {table_name} requires min or max."
+            )
+
+        if rule.get("comparison", "==") not in COMPARISONS:
+            raise ValueError(
+                f"Unknown comparison {rule['comparison']} for table {table_name}, "
+                f"expected one of {tuple(COMPARISONS)}."
+            )
+
+    @staticmethod
+    def _rule_expression(rule: Dict[str, Any]) -> str:
+        """Render the aggregate expression a rule is checked against.
+
+        Parameters
+        ----------
+        rule : Dict[str, Any]
+            The rule to render.
+
+        Returns
+        -------
+        str
+            A SQL expression that yields one value per table.
+        """
+        rule_type = rule["rule"]
+
+        if rule_type == "row_count":
+            return SQL_QUERIES.DATA_QUALITY_ROW_COUNT
+
+        if rule_type == "null_rate":
+            return SQL_QUERIES.DATA_QUALITY_NULL_RATE.format(column=rule["column"])
+
+        if rule_type == "unique":
+            return SQL_QUERIES.DATA_QUALITY_DUPLICATES.format(column=rule["column"])
+
+        if rule_type == "range":
+            conditions = []
+
+            if "min" in rule:
+                conditions.append(f"{rule['column']} < {float(rule['min'])!r}")
+
+            if "max" in rule:
+                conditions.append(f"{rule['column']} > {float(rule['max'])!r}")
+
+            return SQL_QUERIES.DATA_QUALITY_OUT_OF_RANGE.format(
+                condition=" OR ".join(conditions)
+            )
+
+        return rule["sql"]
+
+    @staticmethod
+    def _rule_failure(rule: Dict[str, Any], value: Any) -> Optional[str]:
+        """Check a rule against the value its expression returned.
+
+        Parameters
+        ----------
+        rule : Dict[str, Any]
+            The rule to check.
+        value : Any
+            The value of the rule's expression.
+
+        Returns
+        -------
+        Optional[str]
+            A description of the failure, or None if the rule passed.
+        """
+        rule_type = rule["rule"]
+
+        if rule_type == "row_count":
+            minimum = rule.get("min", 1)
+            passed = value >= minimum
+            description = f"row count {value} is below {minimum}"
+        elif rule_type == "null_rate":
+            maximum = rule.get("max", 0)
+            # An empty table has no null rate; the row count rule covers it.
+            passed = value is None or value <= maximum
+            description = f"{rule['column']} null rate {value} is above {maximum}"
+        elif rule_type == "unique":
+            passed = value == 0
+            description = f"{rule['column']} has {value} duplicate values"
+        elif rule_type == "range":
+            passed = not value
+            description = f"{rule['column']} has {value} values out of range"
+        else:
+            comparison = rule.get("comparison", "==")
+            passed = COMPARISONS[comparison](value, rule["expected"])
+            description = (
+                f"{rule['sql']} returned {value}, expected {comparison} "
+                f"{rule['expected']}"
+            )
+
+        return None if passed else description
+
+    def _table_query(
+        self, table_name: str
+    ) -> Tuple[List[Dict[str, Any]], List[Tuple[str, str, float]], str]:
+        """Build the one aggregate query checking and profiling a table.
+
+        Parameters
+        ----------
+        table_name : str
+            The table to check, in ``rules``, ``profiles`` or both.
+
+        Returns
+        -------
+        Tuple[List[Dict[str, Any]], List[Tuple[str, str, float]], str]
+            The rules checked, including the default row count rule, the
+            profile metrics, and the query returning one value per rule then
+            one per metric, in the same order.
+        """
+        rules = list(self._rules.get(table_name, []))
+
+        if table_name in self._rules and not any(
+            rule["rule"] == "row_count" for rule in rules
+        ):
+            rules = [{"rule": "row_count"}] + rules
+
+        metrics = (
+            self._profile_metrics(self._profiles[table_name])
+            if table_name in self._profiles
+            else []
+        )
+
+        query = SQL_QUERIES.DATA_QUALITY_RULE_QUERY.format(
+            expressions=", ".join(
+                [
+                    f"{self._rule_expression(rule)} AS check_{index}"
+                    for index, rule in enumerate(rules)
+                ]
+                + [
+                    f"{expression} AS metric_{index}"
+                    for index, (_, expression, _) in enumerate(metrics)
+                ]
+            ),
+            table=table_name,
+        )
+
+        return rules, metrics, query
+
+    def _scanned_tables(self) -> List[str]:
+        """List the tables with rules or profiles, each scanned once.
+
+        The tables with rules come first, in the order of ``rules``, then
+        those only profiled, in the order of ``profiles``.
+        """
+        return list(self._rules) + [
+            table_name for table_name in self._profiles if table_name not in self._rules
+        ]
+
+    def _rule_failures(
+        self, table_name: str, rules: List[Dict[str, Any]], values: Tuple[Any, ...]
+    ) -> List[str]:
+        """Check the rules of a table against the values of their query.
+
+        Returns
+        -------
+        List[str]
+            A description of every rule that failed.
+        """
+        failures = []
+
+        for rule, value in zip(rules, values):
+            failure = self._rule_failure(rule, value)
+
+            if failure:
+                self.log.error("Rule failed in table %s: %s.", table_name, failure)
+                failures.append(f"{table_name}: {failure}")
+
+        return failures
+
+    def _scan_failures(
+        self,
+        db_hook: Optional[InstrumentedHook],
+        context: Dict[str, Any],
+        table_name: str,
+        values: Tuple[Any, ...],
+    ) -> Tuple[List[str], List[str]]:
+        """Check the rules of a table and record its profile from one scan.
+
+        Parameters
+        ----------
+        db_hook : InstrumentedHook, optional
+            The hook to read and record the profile history with, needed
+            only if the table is profiled.
         context : Dict[str, Any]
             The Airflow execution context containing information about the
             current execution.
+        table_name : str
+            The table scanned.
+        values : Tuple[Any, ...]
+            The values of its ``_table_query``.
+
+        Returns
+        -------
+        Tuple[List[str], List[str]]
+            A description of every rule that failed and of every metric
+            that drifted.
         """
-        self.log.info("Checking data quality for %s...", self._connection_type)
-        self.log.debug("Using context: %s", context)
+        rules, metrics, _ = self._table_query(table_name)
+        failures = self._rule_failures(table_name, rules, values[: len(rules)])
+        drifts = []
+
+        if metrics:
+            drifts = self._record_profile(
+                db_hook,
+                context,
+                table_name,
+                self._profiles[table_name],
+                values[len(rules) :],
+            )
+
+        return failures, drifts
+
+    def _batched_counts(
+        self, db_hook: InstrumentedHook, table_names: List[str]
+    ) -> List[Tuple[str, int]]:
+        """Count the rows of every table in one round trip.
+
+        Parameters
+        ----------
+        db_hook : InstrumentedHook
+            The hook connected to the database.
+        table_names : List[str]
+            The tables to count.
+
+        Returns
+        -------
+        List[Tuple[str, int]]
+            The name and row count of each table, in order.
+        """
+        if self._batch_mode == "catalog":
+            records = db_hook.get_records(
+                SQL_QUERIES.DATA_QUALITY_CATALOG_COUNT,
+                parameters=(self._schema_name, tuple(table_names)),
+            )
+        else:
+            records = db_hook.get_records(self._union_query(table_names))
+
+        return self._named_counts(table_names, records)
+
+    @staticmethod
+    def _union_query(table_names: List[str]) -> str:
+        """Build the "union" query counting every table."""
+        return "\nUNION ALL\n".join(
+            SQL_QUERIES.DATA_QUALITY_UNION_COUNT.format(table=table_name)
+            for table_name in table_names
+        )
+
+    @staticmethod
+    def _named_counts(
+        table_names: List[str], records: List[Tuple[str, int]]
+    ) -> List[Tuple[str, int]]:
+        """Order the (table name, row count) rows of a batched count."""
+        # svv_table_info has no row for a table that has never held data.
+        counts = {table_name.strip(): row_count for table_name, row_count in records}
+
+        return [
+            (table_name, counts.get(table_name, 0)) for table_name in table_names
+        ]
 
-        db_hook = PostgresHook(postgres_conn_id=self._db_connection_id)
+    def _row_counts(
+        self, db_hook: InstrumentedHook, table_names: List[str]
+    ) -> List[Tuple[str, int]]:
+        """Count the rows of every table with one query per table.
 
+        Parameters
+        ----------
+        db_hook : InstrumentedHook
+            The hook connected to the database.
+        table_names : List[str]
+            The tables to count.
+
+        Returns
+        -------
+        List[Tuple[str, int]]
+            The name and row count of each table, in order.
+        """
+        counts = []
+
+        for table_name in table_names:
+            self.log.info("Checking data quality in table %s...", table_name)
+            query = self._count_query(table_name)
+            counts.append((table_name, db_hook.get_first(query)[0]))
+
+        return counts
+
+    def _profile_metrics(
+        self, specs: List[Dict[str, Any]]
+    ) -> List[Tuple[str, str, float]]:
+        """List the metrics of a table profile.
+
+        Returns
+        -------
+        List[Tuple[str, str, float]]
+            The name, SQL expression and tolerance of every metric, the row
+            count first.
+        """
+        metrics = [
+            ("row_count", SQL_QUERIES.DATA_QUALITY_ROW_COUNT, self._profile_tolerance)
+        ]
+
+        for spec in specs:
+            column = spec["column"]
+
+            if spec["metric"] == "approx_distinct":
+                name = f"approx_distinct({column})"
+                expression = SQL_QUERIES.PROFILE_APPROX_DISTINCT.format(column=column)
+            elif spec["metric"] == "null_fraction":
+                name = f"null_fraction({column})"
+                expression = SQL_QUERIES.DATA_QUALITY_NULL_RATE.format(column=column)
+            else:
+                name = f"percentile_{spec['fraction']:g}({column})"
+                expression = SQL_QUERIES.PROFILE_PERCENTILE.format(
+                    fraction=float(spec["fraction"]), column=column
+                )
+
+            metrics.append(
+                (name, expression, spec.get("tolerance", self._profile_tolerance))
+            )
+
+        return metrics
+
+    def _record_profile(
+        self,
+        db_hook: InstrumentedHook,
+        context: Dict[str, Any],
+        table_name: str,
+        specs: List[Dict[str, Any]],
+        values: Tuple[Any, ...],
+    ) -> List[str]:
+        """Compare a table profile with its history and record it.
+
+        The profile replaces any earlier one of the same run, so a retry
+        does not count twice in the trailing average.
+
+        Parameters
+        ----------
+        db_hook : InstrumentedHook
+            The hook connected to the database.
+        context : Dict[str, Any]
+            The Airflow execution context containing information about the
+            current execution.
+        table_name : str
+            The profiled table.
+        specs : List[Dict[str, Any]]
+            The profile metrics of the table.
+        values : Tuple[Any, ...]
+            The values of the profile metrics, in order.
+
+        Returns
+        -------
+        List[str]
+            A description of every metric that drifted.
+        """
+        metrics = self._profile_metrics(specs)
+        values = [None if value is None else float(value) for value in values]
+        run_id = context["run_id"]
+
+        history = {
+            metric: (average, samples)
+            for metric, average, samples in db_hook.get_records(
+                SQL_QUERIES.PROFILE_TRAILING_AVERAGES,
+                parameters=(table_name, run_id, self._profile_window),
+            )
+        }
+
+        drifts = []
+
+        for (name, _, tolerance), value in zip(metrics, values):
+            average, samples = history.get(name, (None, 0))
+
+            if value is None or average is None or samples < self._profile_min_history:
+                continue
+
+            if average:
+                drift = abs(value - average) / abs(average)
+            else:
+                drift = float("inf") if value else 0.0
+
+            if drift > tolerance:
+                drifts.append(
+                    f"{table_name}: {name} {value:g} is {drift:.0%} off its "
+                    f"average {average:g} over {samples} runs"
+                )
+
+        profiled_at = datetime.utcnow()
+        insert = SQL_QUERIES.PROFILE_HISTORY_INSERT.format(
+            rows=", ".join([SQL_QUERIES.PROFILE_HISTORY_ROW] * len(metrics))
+        )
+        parameters = [
+            field
+            for (name, _, _), value in zip(metrics, values)
+            for field in (table_name, name, value, run_id, profiled_at)
+        ]
+
+        conn = db_hook.get_conn()
+
+        try:
+            with conn.cursor() as cursor:
+                with db_hook.measure(cursor, SQL_QUERIES.PROFILE_HISTORY_DELETE):
+                    cursor.execute(
+                        SQL_QUERIES.PROFILE_HISTORY_DELETE, (table_name, run_id)
+                    )
+
+                with db_hook.measure(cursor, insert):
+                    cursor.execute(insert, parameters)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        return drifts
+
+    def _drift_failures(self, drifts: List[str]) -> List[str]:
+        """Log drifted metrics, and return them as failures with "fail"."""
+        for drift in drifts:
+            self.log.warning("Profile drift in table %s.", drift)
+
+        return drifts if self._on_drift == "fail" else []
+
+    def _count_query(self, table_name: str) -> str:
+        """Build the query counting the rows of one table."""
         sql = (
             self._data_quality_sql
             if self._data_quality_sql
             else "SELECT COUNT(*) FROM {}"
         )
 
-        for table_name in self._table_names:
-            self.log.info("Checking data quality in table %s...", table_name)
-            query = sql.format(table_name)
-            result = db_hook.get_first(query)
+        return sql.format(table_name)
 
-            if result[0] == 0:
+    def _count_failures(self, counts: List[Tuple[str, int]]) -> List[str]:
+        """Report every table without rows.
+
+        Returns
+        -------
+        List[str]
+            A description of every failed check.
+        """
+        failed = []
+
+        for table_name, row_count in counts:
+            if row_count == 0:
                 self.log.error("Data quality check failed in table %s.", table_name)
-                raise DataQualityCheckError(
-                    f"Data quality check failed in table {table_name}."
-                )
+                failed.append(f"{table_name}: no rows")
+                continue
 
             self.log.info("Data quality check passed in table %s.", table_name)
 
+        return failed
+
+    def _deferred_queries(self) -> List[str]:
+        """Build every check query, each submitted on its own when deferred.
+
+        The count queries come first, one in "union" mode or one per table,
+        then one query per table with rules or profiles, in the order of
+        ``_scanned_tables``.
+        """
+        table_names = [name for name in self._table_names if name not in self._rules]
+
+        if not table_names:
+            queries = []
+        elif self._batch_mode:
+            queries = [self._union_query(table_names)]
+        else:
+            queries = [self._count_query(table_name) for table_name in table_names]
+
+        return queries + [
+            self._table_query(table_name)[2] for table_name in self._scanned_tables()
+        ]
+
+    def _raise_on_failure(self, failed: List[str]) -> None:
+        """Raise a DataQualityCheckError listing the failed checks, if any."""
+        if failed:
+            raise DataQualityCheckError(
+                f"Data quality check failed: {'; '.join(failed)}."
+            )
+
         self.log.info("Data quality check successful for %s...", self._connection_type)
+
+    def execute(self, context: Dict[str, Any]) -> None:
+        """Execute the data quality check operation.
+
+        Parameters
+        ----------
+        context : Dict[str, Any]
+            The Airflow execution context containing information about the
+            current execution.
+        """
+        self.log.info("Checking data quality for %s...", self._connection_type)
+        self.log.debug("Using context: %s", context)
+
+        if self._deferrable:
+            self.defer_statements([[query] for query in self._deferred_queries()])
+
+        db_hook = get_db_hook(
+            self._db_connection_id, self._connection_type, self._session_stmts
+        )
+
+        table_names = [name for name in self._table_names if name not in self._rules]
+        counts = (
+            self._batched_counts(db_hook, table_names)
+            if self._batch_mode and table_names
+            else self._row_counts(db_hook, table_names)
+        )
+
+        failed = self._count_failures(counts)
+        drifts = []
+
+        for table_name in self._scanned_tables():
+            rules, metrics, query = self._table_query(table_name)
+            self.log.info(
+                "Checking %s rules and profiling %s metrics in table %s...",
+                len(rules),
+                len(metrics),
+                table_name,
+            )
+            failures, table_drifts = self._scan_failures(
+                db_hook, context, table_name, db_hook.get_first(query)
+            )
+            failed.extend(failures)
+            drifts.extend(table_drifts)
+
+        failed.extend(self._drift_failures(drifts))
+
+        db_hook.publish(context)
+
+        self._raise_on_failure(failed)
+
+    def execute_complete(
+        self, context: Dict[str, Any], event: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Evaluate deferred check queries once all of them have finished.
+
+        Parameters
+        ----------
+        context : Dict[str, Any]
+            The Airflow execution context containing information about the
+            current execution.
+        event : Dict[str, Any], optional
+            The event fired by ``RedshiftStatementTrigger``.
+        """
+        outcomes = self.publish_event(context, event)
+        errors = [
+            f"{outcome['id']}: {outcome['error']}"
+            for outcome in outcomes
+            if outcome["status"] in FAILED_STATUSES
+        ]
+
+        if errors:
+            raise DataAPIStatementError(
+                f"Data quality queries failed: {'; '.join(errors)}."
+            )
+
+        client = data_api_client(
+            self._db_connection_id, self._connection_type, self._aws_connection_id
+        )
+        # Results come back in the order _deferred_queries built the queries.
+        results = (
+            statement_rows(client, outcome["result_id"]) for outcome in outcomes
+        )
+        table_names = [name for name in self._table_names if name not in self._rules]
+
+        if not table_names:
+            counts = []
+        elif self._batch_mode:
+            counts = self._named_counts(table_names, next(results))
+        else:
+            counts = [(table_name, next(results)[0][0]) for table_name in table_names]
+
+        failed = self._count_failures(counts)
+        drifts = []
+        # Reading and recording the history is short; only the table scans
+        # ran deferred.
+        db_hook = (
+            get_db_hook(
+                self._db_connection_id, self._connection_type, self._session_stmts
+            )
+            if self._profiles
+            else None
+        )
+
+        for table_name in self._scanned_tables():
+            failures, table_drifts = self._scan_failures(
+                db_hook, context, table_name, next(results)[0]
+            )
+            failed.extend(failures)
+            drifts.extend(table_drifts)
+
+        failed.extend(self._drift_failures(drifts))
+
+        self._raise_on_failure(failed)
@@ -1,10 +1,166 @@
-from typing import Tuple, Dict, Any
+from datetime import timezone
+from typing import Tuple, Dict, Any, List, Optional
 
-from airflow.hooks.postgres_hook import PostgresHook
 from airflow.models import BaseOperator
 
+import helpers.sql_queries as SQL_QUERIES
+from helpers.data_api import DataAPIMixin
+from helpers.query_metrics import get_db_hook
+from helpers.session_settings import render_session_settings
 
-class LoadDimensionOperator(BaseOperator):
+LOAD_MODES = ("append", "truncate-insert", "merge", "incremental")
+
+
+def check_load_mode(
+    load_mode: str,
+    table_name: Optional[str],
+    select_dim_stmt: Optional[str],
+    primary_key: List[str],
+    insert_dim_stmt: Optional[str] = None,
+) -> None:
+    """Raise ValueError unless the load mode has the settings it needs."""
+    if load_mode not in LOAD_MODES:
+        raise ValueError(f"Unknown load mode {load_mode}, expected one of {LOAD_MODES}.")
+
+    if load_mode != "append" and not table_name:
+        raise ValueError(f"Load mode {load_mode} requires table_name.")
+
+    if load_mode == "merge" and not (select_dim_stmt and primary_key):
+        raise ValueError("Load mode merge requires select_dim_stmt and primary_key.")
+
+    if load_mode == "incremental" and "{interval_filter}" not in (
+        insert_dim_stmt or ""
+    ):
+        raise ValueError(
+            "Load mode incremental requires an {interval_filter} in insert_dim_stmt."
+        )
+
+
+def interval_filter(context: Dict[str, Any]) -> str:
+    """Render START_TIME_INTERVAL_FILTER for the run's data interval.
+
+    Parameters
+    ----------
+    context : Dict[str, Any]
+        The Airflow execution context containing information about the
+        current execution.
+
+    Returns
+    -------
+    str
+        The filter, or "" for the empty interval of an unscheduled run.
+    """
+    start = context["data_interval_start"].astimezone(timezone.utc)
+    end = context["data_interval_end"].astimezone(timezone.utc)
+
+    if end <= start:
+        return ""
+
+    # start_time is a UTC timestamp without time zone.
+    return SQL_QUERIES.START_TIME_INTERVAL_FILTER.format(
+        start=start.strftime("%Y-%m-%d %H:%M:%S"),
+        end=end.strftime("%Y-%m-%d %H:%M:%S"),
+    )
+
+
+def event_interval_filter(context: Dict[str, Any]) -> str:
+    """Render SONGPLAY_INTERVAL_FILTER on the ts of the run's staged events.
+
+    Parameters
+    ----------
+    context : Dict[str, Any]
+        The Airflow execution context containing information about the
+        current execution.
+
+    Returns
+    -------
+    str
+        The filter, or "" for the empty interval of an unscheduled run.
+    """
+    start_ms = int(context["data_interval_start"].timestamp() * 1000)
+    end_ms = int(context["data_interval_end"].timestamp() * 1000)
+
+    if end_ms <= start_ms:
+        return ""
+
+    return SQL_QUERIES.SONGPLAY_INTERVAL_FILTER.format(
+        start_ms=start_ms, end_ms=end_ms
+    )
+
+
+def _merge_statements(
+    table_name: str, select_dim_stmt: str, primary_key: List[str]
+) -> List[str]:
+    """Build the statements that merge ``select_dim_stmt`` into the table.
+
+    Returns
+    -------
+    List[str]
+        The statements to run, in order, in a single transaction.
+    """
+    stage_table = f"{table_name}_merge_stage"
+    key_match = " AND ".join(
+        f"{table_name}.{column} = {stage_table}.{column}" for column in primary_key
+    )
+    params = {
+        "table": table_name,
+        "stage_table": stage_table,
+        "select_stmt": select_dim_stmt.strip(),
+        "key_match": key_match,
+    }
+
+    return [
+        SQL_QUERIES.MERGE_CREATE_STAGE.format(**params),
+        SQL_QUERIES.MERGE_INSERT_STAGE.format(**params),
+        SQL_QUERIES.MERGE_DELETE_MATCHED.format(**params),
+        SQL_QUERIES.MERGE_INSERT_TARGET.format(**params),
+        SQL_QUERIES.MERGE_DROP_STAGE.format(**params),
+    ]
+
+
+def dimension_statements(
+    insert_dim_stmt: str,
+    load_mode: str = "append",
+    table_name: Optional[str] = None,
+    select_dim_stmt: Optional[str] = None,
+    primary_key: Optional[List[str]] = None,
+    context: Optional[Dict[str, Any]] = None,
+) -> Tuple[List[str], bool]:
+    """Build the statements that load a dimension table in a load mode.
+
+    Parameters are as for ``LoadDimensionOperator``, plus the Airflow
+    execution ``context`` the "incremental" and "merge" modes bound their
+    statements with.
+
+    Returns
+    -------
+    Tuple[List[str], bool]
+        The statements to run, in order, and whether to run them in
+        autocommit mode rather than a single transaction.
+    """
+    if load_mode == "merge":
+        if "{interval_filter}" in select_dim_stmt:
+            select_dim_stmt = select_dim_stmt.format(
+                interval_filter=event_interval_filter(context) if context else ""
+            )
+
+        return _merge_statements(table_name, select_dim_stmt, primary_key), False
+
+    if load_mode == "truncate-insert":
+        # TRUNCATE commits on Redshift, so the table is briefly empty before
+        # the insert; in exchange there are no deleted rows to vacuum
+        # afterwards.
+        truncate = SQL_QUERIES.TRUNCATE_TABLE.format(table=table_name)
+        return [truncate, insert_dim_stmt], False
+
+    if load_mode == "incremental":
+        filter_sql = interval_filter(context) if context else ""
+        return [insert_dim_stmt.format(interval_filter=filter_sql)], True
+
+    return [insert_dim_stmt], True
+
+
+class LoadDimensionOperator(DataAPIMixin, BaseOperator):
     """Operator to load dimension data to Redshift.
 
     Parameters
@@ -15,19 +171,76 @@ class LoadDimensionOperator(BaseOperator):
         The SQL statement to insert dimension data into Redshift.
     connection_type : str, optional
         The type of database connection to use. Defaults to "Redshift".
+    load_mode : str, optional
+        One of "append", "truncate-insert", "merge" or "incremental".
+        "append" runs ``insert_dim_stmt`` as is, "truncate-insert" empties
+        ``table_name`` first, and "merge" replaces the rows of ``table_name``
+        whose ``primary_key`` appears in ``select_dim_stmt`` and inserts the
+        rest, in one transaction, after filling an ``{interval_filter}``
+        placeholder of ``select_dim_stmt`` with SONGPLAY_INTERVAL_FILTER on
+        the ts of the run's staged events. "incremental" fills the
+        ``{interval_filter}`` placeholder of ``insert_dim_stmt`` with
+        START_TIME_INTERVAL_FILTER for the run's data interval, for
+        statements that only insert new keys, such as
+        TIME_TABLE_INCREMENTAL_INSERT. Defaults to "append".
+    table_name : str, optional
+        The dimension table. Required for "truncate-insert" and "merge".
+    select_dim_stmt : str, optional
+        A SELECT returning one row per key, in table column order. Required
+        for "merge".
+    primary_key : List[str], optional
+        The key columns matched on. Required for "merge".
+    deferrable : bool, optional
+        Submit the load through the Redshift Data API, as one transaction,
+        and defer the task until it finishes, instead of holding a worker
+        slot and a connection while it runs. Needs a running triggerer.
+        Defaults to False.
+    aws_connection_id : str, optional
+        The ID of the AWS connection used with ``deferrable``. Defaults to
+        "aws_default".
+    poll_interval : float, optional
+        The seconds between two checks on the load with ``deferrable``.
+        Defaults to 15.
+    session_settings : Dict[str, Any], optional
+        WLM settings over ``session_defaults``, as in
+        ``helpers.session_settings``. The load runs in the "etl_load" query
+        group on 2 slots, for the joins and temporary table of a merge.
 
     Methods
     -------
     execute(self, context: Dict[str, Any]) -> None
         Execute the load dimension operation.
+    execute_complete(self, context: Dict[str, Any], event: Dict[str, Any]) -> None
+        Resume a deferred load once it has finished.
     """
 
     ui_color = "#80BD9E"
+    template_fields = ("_insert_dim_stmt", "_table_name", "_select_dim_stmt")
+    session_defaults = {"query_group": "etl_load", "wlm_query_slot_count": 2}
 
     def __init__(self, **kwargs: Dict[str, Any]):
         self._db_connection_id = kwargs.pop("db_connection_id", None)
         self._insert_dim_stmt = kwargs.pop("insert_dim_stmt", None)
         self._connection_type = kwargs.pop("connection_type", "Redshift")
+        self._session_stmts = render_session_settings(
+            {**self.session_defaults, **(kwargs.pop("session_settings", None) or {})},
+            self._connection_type,
+        )
+        self._load_mode = kwargs.pop("load_mode", "append")
+        self._table_name = kwargs.pop("table_name", None)
+        self._select_dim_stmt = kwargs.pop("select_dim_stmt", None)
+        self._primary_key = kwargs.pop("primary_key", [])
+        self._deferrable = kwargs.pop("deferrable", False)
+        self._aws_connection_id = kwargs.pop("aws_connection_id", "aws_default")
+        self._poll_interval = kwargs.pop("poll_interval", 15.0)
+
+        check_load_mode(
+            self._load_mode,
+            self._table_name,
+            self._select_dim_stmt,
+            self._primary_key,
+            self._insert_dim_stmt,
+        )
 
         super().__init__(**kwargs)
 
@@ -40,11 +253,31 @@ class LoadDimensionOperator(BaseOperator):
             The Airflow execution context containing information about the
             current execution.
         """
-        self.log.info("Loading dimension data to %s...", self._connection_type)
+        self.log.info(
+            "Loading dimension data to %s in %s mode...",
+            self._connection_type,
+            self._load_mode,
+        )
         self.log.debug("Using context: %s", context)
 
-        db_hook = PostgresHook(postgres_conn_id=self._db_connection_id)
-        db_hook.run(self._insert_dim_stmt, autocommit=True)
+        statements, autocommit = dimension_statements(
+            self._insert_dim_stmt,
+            self._load_mode,
+            self._table_name,
+            self._select_dim_stmt,
+            self._primary_key,
+            context,
+        )
+
+        if self._deferrable:
+            self.defer_statements([statements])
+
+        db_hook = get_db_hook(
+            self._db_connection_id, self._connection_type, self._session_stmts
+        )
+        db_hook.run(statements, autocommit=autocommit)
+
+        db_hook.publish(context)
 
         self.log.info(
             "Dimension data loaded successfully to %s.", self._connection_type
@@ -0,0 +1,274 @@
+"""Operator to load several dimension tables concurrently in one task."""
+
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from airflow.models import BaseOperator
+
+from helpers.data_api import FAILED_STATUSES, DataAPIMixin
+from helpers.query_metrics import InstrumentedHook, get_db_hook
+from helpers.session_settings import render_session_settings
+from load_dimension import check_load_mode, dimension_statements
+
+
+class DimensionLoadError(Exception):
+    """Raised when one or more dimension loads fail"""
+
+
+class LoadDimensionsOperator(DataAPIMixin, BaseOperator):
+    """Operator to load several dimension tables concurrently in one task.
+
+    A dimension load is usually a single short INSERT, so running each in its
+    own task costs more in worker slots, process start-up and scheduling than
+    in SQL. This operator runs the loads from a bounded thread pool instead,
+    with each worker reusing its connection for the loads it picks up. Every
+    load commits or fails on its own, and the task fails after all loads
+    have finished if any of them failed.
+
+    Parameters
+    ----------
+    db_connection_id : str
+        The ID of the database connection to use.
+    dimensions : List[Dict[str, Any]]
+        One entry per dimension table, with the ``insert_dim_stmt``,
+        ``load_mode``, ``table_name``, ``select_dim_stmt`` and
+        ``primary_key`` arguments of ``LoadDimensionOperator``. Every entry
+        needs a ``table_name``.
+    connection_type : str, optional
+        The type of database connection to use. Defaults to "Redshift".
+    max_workers : int, optional
+        The most loads, and connections, run at once. Defaults to 4.
+    deferrable : bool, optional
+        Submit every load through the Redshift Data API, each as one
+        transaction, and defer the task until all have finished, instead of
+        running them from the thread pool. ``max_workers`` is not used.
+        Needs a running triggerer. Defaults to False.
+    aws_connection_id : str, optional
+        The ID of the AWS connection used with ``deferrable``. Defaults to
+        "aws_default".
+    poll_interval : float, optional
+        The seconds between two checks on the loads with ``deferrable``.
+        Defaults to 15.
+    session_settings : Dict[str, Any], optional
+        WLM settings over ``session_defaults``, as in
+        ``helpers.session_settings``. The loads run in the "etl_load" query
+        group on one slot each, since up to ``max_workers`` of them share the
+        queue.
+
+    Methods
+    -------
+    execute(self, context: Dict[str, Any]) -> List[Dict[str, Any]]
+        Execute the load dimensions operation.
+    execute_complete(self, context: Dict[str, Any], event: Dict[str, Any])
+        Resume deferred loads once all of them have finished.
+    """
+
+    ui_color = "#80BD9E"
+    template_fields = ("_dimensions",)
+    session_defaults = {"query_group": "etl_load"}
+
+    def __init__(self, **kwargs: Dict[str, Any]):
+        self._db_connection_id = kwargs.pop("db_connection_id", None)
+        self._dimensions = kwargs.pop("dimensions", [])
+        self._connection_type = kwargs.pop("connection_type", "Redshift")
+        self._session_stmts = render_session_settings(
+            {**self.session_defaults, **(kwargs.pop("session_settings", None) or {})},
+            self._connection_type,
+        )
+        self._max_workers = kwargs.pop("max_workers", 4)
+        self._deferrable = kwargs.pop("deferrable", False)
+        self._aws_connection_id = kwargs.pop("aws_connection_id", "aws_default")
+        self._poll_interval = kwargs.pop("poll_interval", 15.0)
+
+        if self._max_workers < 1:
+            raise ValueError(f"max_workers must be >= 1, got {self._max_workers}.")
+
+        for dimension in self._dimensions:
+            if not dimension.get("table_name"):
+                raise ValueError("Every dimension requires table_name.")
+
+            check_load_mode(
+                dimension.get("load_mode", "append"),
+                dimension["table_name"],
+                dimension.get("select_dim_stmt"),
+                dimension.get("primary_key", []),
+                dimension.get("insert_dim_stmt"),
+            )
+
+        super().__init__(**kwargs)
+
+    def _load(
+        self,
+        db_hook: InstrumentedHook,
+        connections: "queue.Queue[Any]",
+        dimension: Dict[str, Any],
+        context: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """Load one dimension table on a pooled connection.
+
+        Returns
+        -------
+        Dict[str, Any]
+            The table name, "success" or "failed", the error if any and the
+            seconds taken.
+        """
+        statements, autocommit = dimension_statements(
+            dimension["insert_dim_stmt"],
+            dimension.get("load_mode", "append"),
+            dimension["table_name"],
+            dimension.get("select_dim_stmt"),
+            dimension.get("primary_key", []),
+            context,
+        )
+
+        try:
+            conn = connections.get_nowait()
+        except queue.Empty:
+            conn = db_hook.get_conn()
+
+        started = time.perf_counter()
+        result = {"table_name": dimension["table_name"], "status": "success"}
+
+        try:
+            db_hook.run(statements, autocommit=autocommit, conn=conn)
+        except Exception as error:  # pylint: disable=broad-except
+            self.log.exception("Loading %s failed.", dimension["table_name"])
+            result.update(status="failed", error=str(error))
+        finally:
+            connections.put(conn)
+
+        result["seconds"] = time.perf_counter() - started
+
+        self.log.info(
+            "Loading %s: %s in %.2fs.",
+            dimension["table_name"],
+            result["status"],
+            result["seconds"],
+        )
+
+        return result
+
+    def execute(self, context: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Execute the load dimensions operation.
+
+        Parameters
+        ----------
+        context : Dict[str, Any]
+            The Airflow execution context containing information about the
+            current execution.
+
+        Returns
+        -------
+        List[Dict[str, Any]]
+            The outcome of each load, pushed to XCom.
+        """
+        self.log.info(
+            "Loading %s dimension tables to %s with %s workers...",
+            len(self._dimensions),
+            self._connection_type,
+            self._max_workers,
+        )
+        self.log.debug("Using context: %s", context)
+
+        if self._deferrable:
+            self.defer_statements(
+                [
+                    dimension_statements(
+                        dimension["insert_dim_stmt"],
+                        dimension.get("load_mode", "append"),
+                        dimension["table_name"],
+                        dimension.get("select_dim_stmt"),
+                        dimension.get("primary_key", []),
+                        context,
+                    )[0]
+                    for dimension in self._dimensions
+                ]
+            )
+
+        db_hook = get_db_hook(
+            self._db_connection_id, self._connection_type, self._session_stmts
+        )
+        connections: "queue.Queue[Any]" = queue.Queue()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+                results = list(
+                    executor.map(
+                        lambda dimension: self._load(
+                            db_hook, connections, dimension, context
+                        ),
+                        self._dimensions,
+                    )
+                )
+        finally:
+            while not connections.empty():
+                connections.get_nowait().close()
+
+        db_hook.publish(context)
+
+        return self._raise_on_failure(results)
+
+    def execute_complete(
+        self, context: Dict[str, Any], event: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Resume deferred loads once all of them have finished.
+
+        Parameters
+        ----------
+        context : Dict[str, Any]
+            The Airflow execution context containing information about the
+            current execution.
+        event : Dict[str, Any], optional
+            The event fired by ``RedshiftStatementTrigger``.
+
+        Returns
+        -------
+        List[Dict[str, Any]]
+            The outcome of each load, pushed to XCom.
+        """
+        outcomes = self.publish_event(context, event)
+        results = []
+
+        # The trigger reports the loads in the order they were submitted.
+        for dimension, outcome in zip(self._dimensions, outcomes):
+            result = {
+                "table_name": dimension["table_name"],
+                "status": "success",
+                "seconds": outcome["duration"],
+            }
+
+            if outcome["status"] in FAILED_STATUSES:
+                result.update(status="failed", error=outcome["error"])
+
+            self.log.info(
+                "Loading %s: %s in %.2fs.",
+                result["table_name"],
+                result["status"],
+                result["seconds"],
+            )
+            results.append(result)
+
+        return self._raise_on_failure(results)
+
+    def _raise_on_failure(
+        self, results: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Raise a DimensionLoadError if any load failed, else return results."""
+        failed = [result for result in results if result["status"] == "failed"]
+
+        if failed:
+            raise DimensionLoadError(
+                "Dimension loads failed: "
+                + "; ".join(
+                    f"{result['table_name']}: {result['error']}" for result in failed
+                )
+                + "."
+            )
+
+        self.log.info(
+            "Dimension data loaded successfully to %s.", self._connection_type
+        )
+
+        return results
@@ -2,11 +2,15 @@
 
 from typing import Tuple, Dict, Any
 
-from airflow.hooks.postgres_hook import PostgresHook
 from airflow.models import BaseOperator
 
+import helpers.sql_queries as SQL_QUERIES
+from helpers.data_api import DataAPIMixin
+from helpers.query_metrics import get_db_hook
+from helpers.session_settings import render_session_settings
 
-class LoadFactOperator(BaseOperator):
+
+class LoadFactOperator(DataAPIMixin, BaseOperator):
     """Operator to load fact data to Redshift.
 
     Parameters
@@ -17,22 +21,106 @@ class LoadFactOperator(BaseOperator):
         The SQL statement to insert fact data into Redshift.
     connection_type : str, optional
         The type of database connection to use. Defaults to "Redshift".
+    incremental : bool, optional
+        Run ``incremental_fact_stmt`` instead of ``insert_fact_stmt``, bounded
+        to the run's data interval. Defaults to False.
+    incremental_fact_stmt : str, optional
+        The SQL statement for incremental loads, with an ``{interval_filter}``
+        placeholder for the ``ts`` bounds. Required with ``incremental``.
+    deferrable : bool, optional
+        Submit the insert through the Redshift Data API and defer the task
+        until it finishes, instead of holding a worker slot and a connection
+        while it runs. Needs a running triggerer. Defaults to False.
+    aws_connection_id : str, optional
+        The ID of the AWS connection used with ``deferrable``. Defaults to
+        "aws_default".
+    poll_interval : float, optional
+        The seconds between two checks on the statement with
+        ``deferrable``. Defaults to 15.
+    session_settings : Dict[str, Any], optional
+        WLM settings over ``session_defaults``, as in
+        ``helpers.session_settings``. The insert runs in the "etl_load" query
+        group on 2 slots, since joining the staging tables spills to disk on a
+        single slot's memory.
 
     Methods
     -------
     execute(self, context: Dict[str, Any]) -> None
         Execute the load fact operation.
+    execute_complete(self, context: Dict[str, Any], event: Dict[str, Any]) -> None
+        Resume a deferred load once the insert has finished.
     """
 
     ui_color = "#F98866"
+    template_fields = ("_insert_fact_stmt", "_incremental_fact_stmt")
+    session_defaults = {"query_group": "etl_load", "wlm_query_slot_count": 2}
 
     def __init__(self, **kwargs: Dict[str, Any]):
         self._db_connection_id = kwargs.pop("db_connection_id", None)
         self._insert_fact_stmt = kwargs.pop("insert_fact_stmt", None)
         self._connection_type = kwargs.pop("connection_type", "Redshift")
+        self._session_stmts = render_session_settings(
+            {**self.session_defaults, **(kwargs.pop("session_settings", None) or {})},
+            self._connection_type,
+        )
+        self._incremental = kwargs.pop("incremental", False)
+        self._incremental_fact_stmt = kwargs.pop("incremental_fact_stmt", None)
+        self._deferrable = kwargs.pop("deferrable", False)
+        self._aws_connection_id = kwargs.pop("aws_connection_id", "aws_default")
+        self._poll_interval = kwargs.pop("poll_interval", 15.0)
+
+        if self._incremental and not self._incremental_fact_stmt:
+            raise ValueError("Incremental loads require incremental_fact_stmt.")
 
         super().__init__(**kwargs)
 
+    def _interval_bounds(self, context: Dict[str, Any]) -> Tuple[int, int]:
+        """Return the run's data interval in epoch milliseconds.
+
+        Parameters
+        ----------
+        context : Dict[str, Any]
+            The Airflow execution context containing information about the
+            current execution.
+
+        Returns
+        -------
+        Tuple[int, int]
+            The inclusive start and exclusive end of the interval.
+        """
+        start = context["data_interval_start"]
+        end = context["data_interval_end"]
+
+        return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+    def _incremental_stmt(self, context: Dict[str, Any]) -> str:
+        """Render the incremental statement for the run's data interval.
+
+        Parameters
+        ----------
+        context : Dict[str, Any]
+            The Airflow execution context containing information about the
+            current execution.
+
+        Returns
+        -------
+        str
+            The statement to run.
+        """
+        start_ms, end_ms = self._interval_bounds(context)
+
+        # Unscheduled runs have an empty interval; they load every staged
+        # event and rely on the playid anti-join alone.
+        if end_ms > start_ms:
+            interval_filter = SQL_QUERIES.SONGPLAY_INTERVAL_FILTER.format(
+                start_ms=start_ms, end_ms=end_ms
+            )
+        else:
+            self.log.info("Empty data interval, loading all staged events.")
+            interval_filter = ""
+
+        return self._incremental_fact_stmt.format(interval_filter=interval_filter)
+
     def execute(self, context: Dict[str, Any]) -> None:
         """Execute the load fact operation.
 
@@ -45,7 +133,19 @@ class LoadFactOperator(BaseOperator):
         self.log.info("Loading fact data to %s...", self._connection_type)
         self.log.debug("Using context: %s", context)
 
-        db_hook = PostgresHook(postgres_conn_id=self._db_connection_id)
-        db_hook.run(self._insert_fact_stmt, autocommit=True)
+        statement = (
+            self._incremental_stmt(context)
+            if self._incremental
+            else self._insert_fact_stmt
+        )
+
+        if self._deferrable:
+            self.defer_statements([[statement]])
+
+        db_hook = get_db_hook(
+            self._db_connection_id, self._connection_type, self._session_stmts
+        )
+        db_hook.run(statement, autocommit=True)
+        db_hook.publish(context)
 
         self.log.info("Fact data loaded successfully to %s.", self._connection_type)
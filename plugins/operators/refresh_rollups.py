@@ -0,0 +1,182 @@
+"""Operator to refresh aggregate tables for the buckets a run touched."""
+
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Tuple
+
+from airflow.models import BaseOperator
+
+import helpers.sql_queries as SQL_QUERIES
+from helpers.query_metrics import get_db_hook
+from helpers.session_settings import render_session_settings
+
+GRAINS = {"day": timedelta(days=1), "hour": timedelta(hours=1)}
+
+
+def bucket_bounds(
+    start: datetime, end: datetime, grain: str
+) -> Tuple[datetime, datetime]:
+    """Widen an interval to whole buckets of a grain.
+
+    Parameters
+    ----------
+    start : datetime
+        The inclusive start of the interval.
+    end : datetime
+        The exclusive end of the interval.
+    grain : str
+        One of GRAINS.
+
+    Returns
+    -------
+    Tuple[datetime, datetime]
+        The start of the first bucket and the end of the last bucket the
+        interval touches, in UTC without time zone.
+    """
+    start = start.astimezone(timezone.utc).replace(tzinfo=None)
+    end = end.astimezone(timezone.utc).replace(tzinfo=None)
+    truncate = {"day": {"hour": 0, "minute": 0}, "hour": {"minute": 0}}[grain]
+
+    first = start.replace(second=0, microsecond=0, **truncate)
+    last = end.replace(second=0, microsecond=0, **truncate)
+
+    if last < end:
+        last += GRAINS[grain]
+
+    return first, last
+
+
+class RefreshRollupsOperator(BaseOperator):
+    """Operator to refresh aggregate tables for the buckets a run touched.
+
+    For each rollup, the day or hour buckets overlapping the run's data
+    interval are deleted and aggregated again from ``songplays``, all in one
+    transaction, so readers never see a half refreshed bucket. An empty
+    interval, as in an unscheduled run, rebuilds every bucket.
+
+    Parameters
+    ----------
+    db_connection_id : str
+        The ID of the database connection to use.
+    rollups : List[Dict[str, Any]]
+        One entry per aggregate table, with its ``table_name``, its ``grain``,
+        one of "day" or "hour", the ``bucket_column`` holding the bucket, and
+        an ``insert_stmt`` with a ``{source_filter}`` placeholder for the
+        start_time bounds, such as USER_DAILY_PLAYS_INSERT.
+    connection_type : str, optional
+        The type of database connection to use. Defaults to "Redshift".
+    session_settings : Dict[str, Any], optional
+        WLM settings over ``session_defaults``, as in
+        ``helpers.session_settings``. The refresh runs in the "etl_load" query
+        group on 2 slots, for the aggregations over ``songplays``.
+
+    Methods
+    -------
+    execute(self, context: Dict[str, Any]) -> None
+        Execute the rollup refresh.
+    """
+
+    ui_color = "#B5C7E8"
+    template_fields = ("_rollups",)
+    session_defaults = {"query_group": "etl_load", "wlm_query_slot_count": 2}
+
+    def __init__(self, **kwargs: Dict[str, Any]):
+        self._db_connection_id = kwargs.pop("db_connection_id", None)
+        self._rollups = kwargs.pop("rollups", [])
+        self._connection_type = kwargs.pop("connection_type", "Redshift")
+        self._session_stmts = render_session_settings(
+            {**self.session_defaults, **(kwargs.pop("session_settings", None) or {})},
+            self._connection_type,
+        )
+
+        for rollup in self._rollups:
+            if rollup.get("grain") not in GRAINS:
+                raise ValueError(
+                    f"Unknown grain {rollup.get('grain')} for "
+                    f"{rollup.get('table_name')}, expected one of {tuple(GRAINS)}."
+                )
+
+            if "{source_filter}" not in rollup.get("insert_stmt", ""):
+                raise ValueError(
+                    f"The insert_stmt of {rollup.get('table_name')} requires a "
+                    "{source_filter} placeholder."
+                )
+
+        super().__init__(**kwargs)
+
+    def _statements(
+        self, rollup: Dict[str, Any], interval: Optional[Tuple[datetime, datetime]]
+    ) -> List[str]:
+        """Build the delete and insert refreshing one rollup.
+
+        Parameters
+        ----------
+        rollup : Dict[str, Any]
+            The rollup entry.
+        interval : Tuple[datetime, datetime], optional
+            The run's data interval, or None to rebuild every bucket.
+
+        Returns
+        -------
+        List[str]
+            The statements to run, in order.
+        """
+        bucket_filter = source_filter = ""
+
+        if interval:
+            first, last = bucket_bounds(*interval, rollup["grain"])
+            fmt = "%Y-%m-%d" if rollup["grain"] == "day" else "%Y-%m-%d %H:%M:%S"
+
+            bucket_filter = SQL_QUERIES.ROLLUP_BUCKET_FILTER.format(
+                column=rollup["bucket_column"],
+                start=first.strftime(fmt),
+                end=last.strftime(fmt),
+            )
+            source_filter = SQL_QUERIES.ROLLUP_BUCKET_FILTER.format(
+                column="start_time",
+                start=first.strftime("%Y-%m-%d %H:%M:%S"),
+                end=last.strftime("%Y-%m-%d %H:%M:%S"),
+            )
+
+        return [
+            SQL_QUERIES.ROLLUP_DELETE.format(
+                table=rollup["table_name"], bucket_filter=bucket_filter
+            ),
+            rollup["insert_stmt"].format(source_filter=source_filter),
+        ]
+
+    def execute(self, context: Dict[str, Any]) -> None:
+        """Execute the rollup refresh.
+
+        Parameters
+        ----------
+        context : Dict[str, Any]
+            The Airflow execution context containing information about the
+            current execution.
+        """
+        self.log.info(
+            "Refreshing %s rollups in %s...", len(self._rollups), self._connection_type
+        )
+        self.log.debug("Using context: %s", context)
+
+        start = context["data_interval_start"]
+        end = context["data_interval_end"]
+
+        if end > start:
+            interval = (start, end)
+        else:
+            self.log.info("Empty data interval, rebuilding every bucket.")
+            interval = None
+
+        statements = [
+            statement
+            for rollup in self._rollups
+            for statement in self._statements(rollup, interval)
+        ]
+
+        db_hook = get_db_hook(
+            self._db_connection_id, self._connection_type, self._session_stmts
+        )
+        db_hook.run(statements, autocommit=False)
+        db_hook.publish(context)
+
+        self.log.info("Rollups refreshed successfully in %s.", self._connection_type)
@@ -0,0 +1,238 @@
+"""Operator to skip a run when its S3 sources have not changed."""
+
+from typing import Any, Dict, Optional, Tuple
+
+from airflow.models import BaseOperator, DagRun, XCom
+from airflow.models.skipmixin import SkipMixin
+from airflow.providers.amazon.aws.hooks.s3 import S3Hook
+from airflow.utils.session import NEW_SESSION, provide_session
+from airflow.utils.state import DagRunState
+from airflow.utils.xcom import XCOM_RETURN_KEY
+
+import helpers.sql_queries as SQL_QUERIES
+from helpers.query_metrics import get_db_hook
+from helpers.s3_objects import prefix_fingerprint
+from helpers.session_settings import render_session_settings
+
+
+class SourceFingerprintOperator(BaseOperator, SkipMixin):
+    """Operator to skip every downstream task when no source object changed.
+
+    Fingerprints each source prefix with ``prefix_fingerprint``, from one
+    listing of its keys, and compares the fingerprints with those pushed by
+    the same task in the latest successful run of the DAG. When they match,
+    every downstream task is skipped, as by ``ShortCircuitOperator``, so an
+    idle hour costs a listing instead of a full load. A run without a
+    previous fingerprint, with a changed source, or triggered with
+    ``{"force": true}`` in its conf proceeds.
+
+    An unchanged log prefix does not mean the run has nothing to load: a day's
+    log file holds every hour of the day, so the events of the run's data
+    interval may have been staged by an earlier run. A run with a non-empty
+    data interval is therefore only skipped when ``staging_events`` holds no
+    events inside it.
+
+    Parameters
+    ----------
+    sources : List[Dict[str, str]]
+        The ``bucket_name`` and ``prefix`` of each source, e.g.
+        ``{"bucket_name": "udacity-dend", "prefix": "song-data/"}``.
+    db_connection_id : str
+        The ID of the database connection holding ``staging_events``. On
+        DuckDB, its ``s3_root`` also stands in for S3.
+    aws_connection_id : str, optional
+        The ID of the AWS connection to use. Defaults to "aws_default".
+    connection_type : str, optional
+        The type of database connection to use. "DuckDB" lists the local
+        files under ``s3_root`` with ``LocalS3Hook``. Defaults to "Redshift".
+    session_settings : Dict[str, Any], optional
+        WLM settings over ``session_defaults``, as in
+        ``helpers.session_settings``. The staging count runs in the
+        "etl_check" query group.
+
+    Methods
+    -------
+    execute(self, context: Dict[str, Any]) -> Dict[str, Dict[str, Any]]
+        Fingerprint the sources and skip downstream tasks if unchanged.
+    """
+
+    ui_color = "#E8D5B7"
+    template_fields = ("_sources",)
+    session_defaults = {"query_group": "etl_check"}
+
+    def __init__(self, **kwargs: Dict[str, Any]):
+        self._sources = kwargs.pop("sources", [])
+        self._db_connection_id = kwargs.pop("db_connection_id", None)
+        self._aws_connection_id = kwargs.pop("aws_connection_id", "aws_default")
+        self._connection_type = kwargs.pop("connection_type", "Redshift")
+        self._session_stmts = render_session_settings(
+            {
+                **self.session_defaults,
+                **(kwargs.pop("session_settings", None) or {}),
+            },
+            self._connection_type,
+        )
+
+        if not self._sources:
+            raise ValueError("At least one source is required.")
+
+        for source in self._sources:
+            if not source.get("bucket_name") or "prefix" not in source:
+                raise ValueError(
+                    f"Every source needs a bucket_name and a prefix, got {source}."
+                )
+
+        if not self._db_connection_id:
+            raise ValueError("db_connection_id is required.")
+
+        super().__init__(**kwargs)
+
+    def _s3_hook(self) -> Any:
+        """Return the hook to list the sources with."""
+        if self._connection_type == "DuckDB":
+            # pylint: disable=import-outside-toplevel
+            from helpers.local_backend import LocalS3Hook
+
+            return LocalS3Hook(self._db_connection_id)
+
+        return S3Hook(aws_conn_id=self._aws_connection_id)
+
+    def _interval_bounds(self, context: Dict[str, Any]) -> Tuple[int, int]:
+        """Return the run's data interval in epoch milliseconds."""
+        start = context["data_interval_start"]
+        end = context["data_interval_end"]
+
+        return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+    def _staged_interval_events(self, context: Dict[str, Any]) -> int:
+        """Return the number of staged events inside the run's data interval.
+
+        Unscheduled runs have an empty interval; they have no hour of their
+        own and rely on the fingerprints alone.
+        """
+        start_ms, end_ms = self._interval_bounds(context)
+
+        if end_ms <= start_ms:
+            return 0
+
+        db_hook = get_db_hook(
+            self._db_connection_id, self._connection_type, self._session_stmts
+        )
+
+        return db_hook.get_first(
+            SQL_QUERIES.STAGING_EVENTS_INTERVAL_COUNT.format(
+                interval_filter=SQL_QUERIES.SONGPLAY_INTERVAL_FILTER.format(
+                    start_ms=start_ms, end_ms=end_ms
+                )
+            )
+        )[0]
+
+    @provide_session
+    def _previous_fingerprints(
+        self, context: Dict[str, Any], session: Any = NEW_SESSION
+    ) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Return the fingerprints of the latest successful run, if any."""
+        previous_run = (
+            session.query(DagRun)
+            .filter(
+                DagRun.dag_id == self.dag_id,
+                DagRun.state == DagRunState.SUCCESS,
+                DagRun.run_id != context["dag_run"].run_id,
+            )
+            .order_by(DagRun.execution_date.desc())
+            .first()
+        )
+
+        if previous_run is None:
+            return None
+
+        self.log.info("Comparing with successful run %s.", previous_run.run_id)
+
+        return XCom.get_one(
+            run_id=previous_run.run_id,
+            key=XCOM_RETURN_KEY,
+            task_id=self.task_id,
+            dag_id=self.dag_id,
+            session=session,
+        )
+
+    def execute(self, context: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Fingerprint the sources and skip downstream tasks if unchanged.
+
+        Parameters
+        ----------
+        context : Dict[str, Any]
+            The Airflow execution context containing information about the
+            current execution.
+
+        Returns
+        -------
+        Dict[str, Dict[str, Any]]
+            The fingerprint of each source by its ``s3://`` URL, pushed to
+            XCom for the next run to compare with.
+        """
+        self.log.info(
+            "Fingerprinting %s sources in %s...",
+            len(self._sources),
+            self._connection_type,
+        )
+        self.log.debug("Using context: %s", context)
+
+        s3_hook = self._s3_hook()
+        fingerprints = {}
+
+        for source in self._sources:
+            url = f"s3://{source['bucket_name']}/{source['prefix']}"
+            fingerprints[url] = prefix_fingerprint(
+                s3_hook, source["bucket_name"], source["prefix"]
+            )
+
+            self.log.info(
+                "%s: %s keys, last modified %s.",
+                url,
+                fingerprints[url]["keys"],
+                fingerprints[url]["last_modified"],
+            )
+
+        dag_run = context["dag_run"]
+
+        if (dag_run.conf or {}).get("force"):
+            self.log.info("Forced by the run's conf, proceeding.")
+            return fingerprints
+
+        previous = self._previous_fingerprints(context)
+
+        if previous != fingerprints:
+            changed = [
+                url
+                for url, fingerprint in fingerprints.items()
+                if (previous or {}).get(url) != fingerprint
+            ]
+            self.log.info("Sources changed since the last successful run: %s.", changed)
+            return fingerprints
+
+        staged = self._staged_interval_events(context)
+
+        if staged:
+            self.log.info(
+                "No source changed, but %s staged events fall in the data "
+                "interval, proceeding.",
+                staged,
+            )
+            return fingerprints
+
+        downstream_tasks = context["task"].get_flat_relatives(upstream=False)
+        self.log.info(
+            "No source changed since the last successful run, skipping %s tasks.",
+            len(downstream_tasks),
+        )
+
+        if downstream_tasks:
+            self.skip(
+                dag_run,
+                dag_run.execution_date,
+                downstream_tasks,
+                map_index=context["ti"].map_index,
+            )
+
+        return fingerprints
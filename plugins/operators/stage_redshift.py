@@ -1,12 +1,62 @@
 """Operators to load data from S3 to Redshift."""
 
-from typing import Tuple, Dict, Any
+import json
+from datetime import datetime, timedelta
+from typing import Tuple, Dict, Any, List, Optional
+
+from psycopg2.extras import execute_values
 
-from airflow.hooks.postgres_hook import PostgresHook
 from airflow.models import BaseOperator
+from airflow.providers.amazon.aws.hooks.s3 import S3Hook
+
+import helpers.sql_queries as SQL_QUERIES
+from helpers.copy_options import render_copy_options
+from helpers.data_api import DataAPIMixin
+from helpers.query_metrics import InstrumentedHook, get_db_hook
+from helpers.s3_objects import list_objects, partition_prefixes
+from helpers.session_settings import render_session_settings
+
+# Keeps each ledger INSERT of a deferred COPY under the Data API's 100 KB
+# statement limit.
+LEDGER_ROWS_PER_STATEMENT = 500
+
+
+def _sql_literal(value: Any) -> str:
+    """Render a ledger value as a SQL literal."""
+    if isinstance(value, int):
+        return str(value)
+
+    text = value.isoformat(sep=" ") if isinstance(value, datetime) else str(value)
 
+    return "'" + text.replace("'", "''") + "'"
+
+
+def ledger_insert_stmts(ledger_rows: List[Tuple[Any, ...]]) -> List[str]:
+    """Render INSERT_LOAD_LEDGER with literal values, for the Data API.
+
+    Parameters
+    ----------
+    ledger_rows : List[Tuple[Any, ...]]
+        The table name, key, ETag, size and load time of each object.
 
-class StageToRedshiftOperator(BaseOperator):
+    Returns
+    -------
+    List[str]
+        The INSERT statements, of up to LEDGER_ROWS_PER_STATEMENT rows each.
+    """
+    return [
+        SQL_QUERIES.INSERT_LOAD_LEDGER.replace(
+            "%s",
+            ",\n".join(
+                "(" + ", ".join(_sql_literal(value) for value in row) + ")"
+                for row in ledger_rows[start : start + LEDGER_ROWS_PER_STATEMENT]
+            ),
+        )
+        for start in range(0, len(ledger_rows), LEDGER_ROWS_PER_STATEMENT)
+    ]
+
+
+class StageToRedshiftOperator(DataAPIMixin, BaseOperator):
     """Operator to load data from S3 to Redshift.
 
     Parameters
@@ -19,51 +69,412 @@ class StageToRedshiftOperator(BaseOperator):
         The IAM role ARN.
     copy_table_stmt : str
         The SQL statement to copy data from S3 to Redshift.
+    s3_key : str
+        The key prefix within the bucket to copy from, e.g. "log-data/".
+    s3_partition_template : str, optional
+        A ``str.format`` template for the key prefix, rendered once for every
+        day in the run's data interval with the fields ``year``, ``month``,
+        ``day``, ``ds`` and ``ds_nodash``. When set, it takes the place of
+        ``s3_key`` so that each run only copies its own slice of the data.
+        An unscheduled run, whose interval is empty, copies ``s3_key``.
+    partition_date : str, optional
+        With ``s3_partition_template``, the one day, as "YYYY-MM-DD", to
+        render the template for instead of the data interval, e.g. to map
+        the operator over the days of a backfill.
     region_name : str, optional
         The AWS region for the S3 bucket. Defaults to "us-west-2".
+    use_manifest : bool, optional
+        Copy only the objects that are not yet recorded in the
+        ``staging_load_ledger`` table, through a COPY manifest, and record
+        them in the same transaction as the COPY. Defaults to False.
+    table_name : str, optional
+        The staging table that ``copy_table_stmt`` loads. Required with
+        ``use_manifest``.
+    aws_connection_id : str, optional
+        The ID of the AWS connection used to list the source objects and
+        write the manifest. Defaults to "aws_default".
+    manifest_bucket : str, optional
+        The bucket the manifest is written to. Defaults to ``bucket_name``.
+    manifest_prefix : str, optional
+        The key prefix the manifest is written under. Defaults to
+        "manifests/".
+    connection_type : str, optional
+        The type of database connection to use. "DuckDB" copies from local
+        files instead of S3, and does not support ``use_manifest``. Defaults
+        to "Redshift".
+    copy_options : Dict[str, Any], optional
+        COPY tuning options, rendered and validated by
+        ``helpers.copy_options.render_copy_options``, e.g.
+        ``{"compression": "gzip", "compupdate": False, "statupdate": False}``.
+    check_slices : bool, optional
+        With ``use_manifest``, look up the number of slices in ``stv_slices``
+        and warn when the files to copy do not spread evenly over them.
+        Defaults to False.
+    post_copy_stmts : List[str], optional
+        Statements run after the COPY in the same transaction, such as
+        STAGING_EVENTS_SONG_KEY_UPDATE to fill in derived columns of the
+        newly staged rows.
+    deferrable : bool, optional
+        Submit the COPY, and the ledger entries and ``post_copy_stmts`` in
+        the same transaction, through the Redshift Data API, and defer the
+        task until it finishes, instead of holding a worker slot and a
+        connection for the whole COPY. The objects are still listed and the
+        manifest written before deferring. A backlog whose ledger entries
+        would take more statements than one Data API transaction allows is
+        copied without deferring. Needs a running triggerer. Defaults to
+        False.
+    poll_interval : float, optional
+        The seconds between two checks on the COPY with ``deferrable``.
+        Defaults to 15.
+    session_settings : Dict[str, Any], optional
+        WLM settings over ``session_defaults``, as in
+        ``helpers.session_settings``. The COPY runs in the "etl_copy" query
+        group, apart from the inserts and checks it would otherwise hold up.
 
     Methods
     -------
     execute(self, context: Dict[str, Any]) -> None
         Execute the stage to Redshift operation.
+    execute_complete(self, context: Dict[str, Any], event: Dict[str, Any]) -> None
+        Resume a deferred COPY once it has finished.
     """
 
     ui_color = "#358140"
+    template_fields = (
+        "_bucket_name",
+        "_iam_role",
+        "_copy_table_stmt",
+        "_s3_key",
+        "_s3_partition_template",
+        "_partition_date",
+        "_json_format",
+        "_table_name",
+        "_manifest_bucket",
+        "_post_copy_stmts",
+    )
+    session_defaults = {"query_group": "etl_copy"}
 
-    def __init__(self, **kwargs: Dict[str, Any]):
-        self._db_connection_id = kwargs.pop("db_connection_id", None)
-        self._bucket_name = kwargs.pop("bucket_name", None)
-        self._iam_role = kwargs.pop("iam_role", None)
-        self._copy_table_stmt = kwargs.pop("copy_table_stmt", None)
-        self._region_name = kwargs.pop("region_name", None)
-        self._json_format = kwargs.pop("json_format", None)
+    # Airflow only accepts declared arguments in ``partial`` and ``expand``,
+    # so those the DAG maps stage_events with are declared; the rest are
+    # popped from kwargs, as in the other operators.
+    def __init__(
+        self,
+        *,
+        db_connection_id: Optional[str] = None,
+        bucket_name: Optional[str] = None,
+        iam_role: Optional[str] = None,
+        copy_table_stmt: Optional[str] = None,
+        s3_key: str = "",
+        s3_partition_template: Optional[str] = None,
+        partition_date: Optional[str] = None,
+        region_name: Optional[str] = None,
+        json_format: Optional[str] = None,
+        use_manifest: bool = False,
+        table_name: Optional[str] = None,
+        connection_type: str = "Redshift",
+        copy_options: Optional[Dict[str, Any]] = None,
+        check_slices: bool = False,
+        post_copy_stmts: Optional[List[str]] = None,
+        deferrable: bool = False,
+        **kwargs: Dict[str, Any],
+    ):
+        self._db_connection_id = db_connection_id
+        self._bucket_name = bucket_name
+        self._iam_role = iam_role
+        self._copy_table_stmt = copy_table_stmt
+        self._s3_key = s3_key
+        self._s3_partition_template = s3_partition_template
+        self._partition_date = partition_date
+        self._region_name = region_name
+        self._json_format = json_format
+        self._use_manifest = use_manifest
+        self._table_name = table_name
+        self._aws_connection_id = kwargs.pop("aws_connection_id", "aws_default")
+        self._manifest_bucket = kwargs.pop("manifest_bucket", None) or bucket_name
+        self._manifest_prefix = kwargs.pop("manifest_prefix", "manifests/")
+        self._connection_type = connection_type
+        self._copy_options = render_copy_options(copy_options or {})
+        self._check_slices = check_slices
+        self._post_copy_stmts = post_copy_stmts or []
+        self._deferrable = deferrable
+        self._poll_interval = kwargs.pop("poll_interval", 15.0)
+        self._session_stmts = render_session_settings(
+            {
+                **self.session_defaults,
+                **(kwargs.pop("session_settings", None) or {}),
+            },
+            self._connection_type,
+        )
+
+        if self._use_manifest and self._connection_type == "DuckDB":
+            raise ValueError("use_manifest needs S3 and is not supported on DuckDB.")
 
         super().__init__(**kwargs)
 
-    def execute(self, context: Dict[str, Any]) -> None:
-        """Execute the stage to Redshift operation.
+    def _partition_keys(self, context: Dict[str, Any]) -> List[str]:
+        """Render the partition template for each day to copy.
+
+        Parameters
+        ----------
+        context : Dict[str, Any]
+            The Airflow execution context containing information about the
+            current execution.
 
-        s3://{}/log_json_path.json
+        Returns
+        -------
+        List[str]
+            The distinct key prefixes covering ``partition_date`` or the
+            data interval, in order, or ``s3_key`` for an empty interval.
+        """
+        if self._partition_date:
+            start = datetime.strptime(self._partition_date, "%Y-%m-%d")
+            end = start + timedelta(days=1)
+        else:
+            start = context["data_interval_start"]
+            end = context["data_interval_end"]
+
+        if end <= start:
+            return [self._s3_key]
+
+        return partition_prefixes(self._s3_partition_template, start, end)
+
+    def _warn_on_uneven_slices(
+        self, db_hook: InstrumentedHook, num_files: int
+    ) -> None:
+        """Warn when ``num_files`` files leave slices idle during the COPY.
+
+        Parameters
+        ----------
+        db_hook : InstrumentedHook
+            The hook connected to Redshift.
+        num_files : int
+            The number of files about to be copied.
+        """
+        num_slices = db_hook.get_first(SQL_QUERIES.SELECT_SLICE_COUNT)[0]
+
+        if num_files % num_slices:
+            self.log.warning(
+                "Copying %s files into %s on %s slices leaves %s slices idle in "
+                "the last round. Compact or split the input into a multiple of "
+                "%s files.",
+                num_files,
+                self._table_name,
+                num_slices,
+                num_slices - num_files % num_slices,
+                num_slices,
+            )
+
+    def _write_manifest(
+        self, context: Dict[str, Any], db_hook: InstrumentedHook, s3_keys: List[str]
+    ) -> Optional[Tuple[str, List[Tuple[Any, ...]]]]:
+        """Write a manifest of the objects missing from the load ledger.
 
         Parameters
         ----------
         context : Dict[str, Any]
             The Airflow execution context containing information about the
             current execution.
+        db_hook : InstrumentedHook
+            The hook connected to Redshift.
+        s3_keys : List[str]
+            The key prefixes to load from.
+
+        Returns
+        -------
+        Optional[Tuple[str, List[Tuple[Any, ...]]]]
+            The COPY from the manifest and the ledger rows to record with it,
+            or None if there is nothing new to copy.
         """
-        self.log.info("Storing data from S3 to Redshift...")
-        self.log.debug("Using context: %s", context)
+        s3_hook = S3Hook(aws_conn_id=self._aws_connection_id)
+
+        listed = list_objects(s3_hook, self._bucket_name, s3_keys)
+        loaded = {
+            tuple(record)
+            for record in db_hook.get_records(
+                SQL_QUERIES.SELECT_LOAD_LEDGER, parameters=(self._table_name,)
+            )
+        }
+        unseen = [obj for obj in listed if obj not in loaded]
+
+        self.log.info(
+            "Found %s objects, %s not yet loaded into %s.",
+            len(listed),
+            len(unseen),
+            self._table_name,
+        )
 
-        db_hook = PostgresHook(postgres_conn_id=self._db_connection_id)
+        if not unseen:
+            self.log.info("Nothing new to stage into %s.", self._table_name)
+            return None
+
+        if self._check_slices:
+            self._warn_on_uneven_slices(db_hook, len(unseen))
+
+        manifest = {
+            "entries": [
+                {
+                    "url": f"s3://{self._bucket_name}/{key}",
+                    "mandatory": True,
+                    "meta": {"content_length": size},
+                }
+                for key, _, size in unseen
+            ]
+        }
+        # Mapped shards of one run each write their own manifest.
+        map_index = getattr(context["ti"], "map_index", -1)
+        shard = f"-{map_index}" if map_index >= 0 else ""
+        manifest_key = (
+            f"{self._manifest_prefix}{self._table_name}/"
+            f"{context['ts_nodash']}{shard}.manifest"
+        )
+
+        s3_hook.load_string(
+            json.dumps(manifest),
+            key=manifest_key,
+            bucket_name=self._manifest_bucket,
+            replace=True,
+        )
 
         fmt_copy = self._copy_table_stmt.format(
-            bucket=self._bucket_name,
+            bucket=self._manifest_bucket,
+            s3_key=manifest_key,
             iam_role=self._iam_role,
             json_format=self._json_format,
             region=self._region_name,
+            copy_options="\n".join(filter(None, ["MANIFEST", self._copy_options])),
         )
 
+        loaded_at = datetime.utcnow()
+        ledger_rows = [
+            (self._table_name, key, etag, size, loaded_at)
+            for key, etag, size in unseen
+        ]
+
+        return fmt_copy, ledger_rows
+
+    def _copy_from_manifest(
+        self,
+        db_hook: InstrumentedHook,
+        fmt_copy: str,
+        ledger_rows: List[Tuple[Any, ...]],
+    ) -> None:
+        """Copy from a manifest and record its objects in the load ledger.
+
+        Parameters
+        ----------
+        db_hook : InstrumentedHook
+            The hook connected to Redshift.
+        fmt_copy : str
+            The COPY from the manifest.
+        ledger_rows : List[Tuple[Any, ...]]
+            The ledger rows of the objects in the manifest.
+        """
         self.log.info("Executing SQL: %s", fmt_copy)
-        db_hook.run(fmt_copy, autocommit=True)
+
+        # The COPY and the ledger entries commit together, so a retry after a
+        # failure sees either both or neither.
+        conn = db_hook.get_conn()
+
+        try:
+            with conn.cursor() as cursor:
+                with db_hook.measure(cursor, fmt_copy):
+                    cursor.execute(fmt_copy)
+
+                with db_hook.measure(cursor, SQL_QUERIES.INSERT_LOAD_LEDGER):
+                    execute_values(
+                        cursor,
+                        SQL_QUERIES.INSERT_LOAD_LEDGER,
+                        ledger_rows,
+                        page_size=len(ledger_rows),
+                    )
+
+                for statement in self._post_copy_stmts:
+                    with db_hook.measure(cursor, statement):
+                        cursor.execute(statement)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def execute(self, context: Dict[str, Any]) -> None:
+        """Execute the stage to Redshift operation.
+
+        Parameters
+        ----------
+        context : Dict[str, Any]
+            The Airflow execution context containing information about the
+            current execution.
+        """
+        self.log.info("Storing data from S3 to Redshift...")
+        self.log.debug("Using context: %s", context)
+
+        db_hook = get_db_hook(
+            self._db_connection_id, self._connection_type, self._session_stmts
+        )
+
+        s3_keys = (
+            self._partition_keys(context)
+            if self._s3_partition_template
+            else [self._s3_key]
+        )
+
+        if self._use_manifest:
+            copy = self._write_manifest(context, db_hook, s3_keys)
+
+            if copy:
+                fmt_copy, ledger_rows = copy
+
+                statements = (
+                    [fmt_copy]
+                    + ledger_insert_stmts(ledger_rows)
+                    + list(self._post_copy_stmts)
+                )
+
+                if self._deferrable and self.fits_in_batch(statements):
+                    self.defer_statements([statements])
+                elif self._deferrable:
+                    # A backlog too large for one Data API transaction is
+                    # copied over a connection instead of split, so the COPY
+                    # still commits with all of its ledger entries.
+                    self.log.warning(
+                        "%s objects need %s statements, over the Data API's "
+                        "limit, copying without deferring.",
+                        len(ledger_rows),
+                        len(statements),
+                    )
+
+                self._copy_from_manifest(db_hook, fmt_copy, ledger_rows)
+
+            db_hook.publish(context)
+            self.log.info("Data stored to Redshift successfully.")
+            return
+
+        fmt_copies = [
+            self._copy_table_stmt.format(
+                bucket=self._bucket_name,
+                s3_key=s3_key,
+                iam_role=self._iam_role,
+                json_format=self._json_format,
+                region=self._region_name,
+                copy_options=self._copy_options,
+            )
+            for s3_key in s3_keys
+        ]
+
+        for fmt_copy in fmt_copies:
+            self.log.info("Executing SQL: %s", fmt_copy)
+
+        statements = fmt_copies + list(self._post_copy_stmts)
+
+        if self._deferrable:
+            self.defer_statements([statements])
+
+        # Every partition's COPY and the post-copy statements run in one
+        # transaction, so a failed partition does not leave the staging table
+        # half loaded, or rows staged without their derived columns.
+        db_hook.run(statements, autocommit=len(statements) == 1)
+        db_hook.publish(context)
 
         self.log.info("Data stored to Redshift successfully.")
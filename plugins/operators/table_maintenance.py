@@ -0,0 +1,221 @@
+"""Operator to vacuum and analyze Redshift tables that need it."""
+
+import time
+from datetime import datetime
+from typing import Dict, Any, List
+
+from psycopg2.extras import execute_values
+
+from airflow.models import BaseOperator
+
+import helpers.sql_queries as SQL_QUERIES
+from helpers.query_metrics import InstrumentedHook, get_db_hook
+from helpers.session_settings import render_session_settings
+
+VACUUM_MODES = ("FULL", "SORT ONLY", "DELETE ONLY", "REINDEX")
+
+
+class TableMaintenanceOperator(BaseOperator):
+    """Operator to vacuum and analyze Redshift tables that need it.
+
+    Reads ``unsorted``, ``stats_off`` and ``tbl_rows`` from ``svv_table_info``
+    and only vacuums the tables whose unsorted share, or analyzes the tables
+    whose stale statistics share, crosses its threshold.
+
+    Parameters
+    ----------
+    db_connection_id : str
+        The ID of the database connection to use.
+    table_names : List[str]
+        The names of the tables to maintain.
+    connection_type : str, optional
+        The type of database connection to use. Defaults to "Redshift".
+    unsorted_threshold : float, optional
+        The percentage of unsorted rows above which a table is vacuumed.
+        Defaults to 10.
+    stats_off_threshold : float, optional
+        The ``stats_off`` percentage above which a table is analyzed.
+        Defaults to 10.
+    min_rows : int, optional
+        Tables with fewer rows are skipped. Defaults to 1000.
+    vacuum_mode : str, optional
+        One of "FULL", "SORT ONLY", "DELETE ONLY" or "REINDEX". Defaults to
+        "FULL".
+    vacuum_to_percent : int, optional
+        The sorted percentage VACUUM stops at. Defaults to 95.
+    schema_name : str, optional
+        The schema of the tables. Defaults to "public".
+    log_table : bool, optional
+        Record each action in ``table_maintenance_log``. Defaults to True.
+    session_settings : Dict[str, Any], optional
+        WLM settings over ``session_defaults``, as in
+        ``helpers.session_settings``. VACUUM and ANALYZE run in the
+        "etl_maintenance" query group on 2 slots, which gives VACUUM more memory
+        to sort with.
+
+    Methods
+    -------
+    execute(self, context: Dict[str, Any]) -> List[Dict[str, Any]]
+        Execute the table maintenance operation.
+    """
+
+    ui_color = "#D9B3FF"
+    template_fields = ("_table_names", "_schema_name")
+    session_defaults = {"query_group": "etl_maintenance", "wlm_query_slot_count": 2}
+
+    def __init__(self, **kwargs: Dict[str, Any]):
+        self._db_connection_id = kwargs.pop("db_connection_id", None)
+        self._table_names = kwargs.pop("table_names", [])
+        self._connection_type = kwargs.pop("connection_type", "Redshift")
+        self._session_stmts = render_session_settings(
+            {**self.session_defaults, **(kwargs.pop("session_settings", None) or {})},
+            self._connection_type,
+        )
+        self._unsorted_threshold = kwargs.pop("unsorted_threshold", 10)
+        self._stats_off_threshold = kwargs.pop("stats_off_threshold", 10)
+        self._min_rows = kwargs.pop("min_rows", 1000)
+        self._vacuum_mode = kwargs.pop("vacuum_mode", "FULL")
+        self._vacuum_to_percent = kwargs.pop("vacuum_to_percent", 95)
+        self._schema_name = kwargs.pop("schema_name", "public")
+        self._log_table = kwargs.pop("log_table", True)
+
+        if self._vacuum_mode not in VACUUM_MODES:
+            raise ValueError(
+                f"Unknown vacuum mode {self._vacuum_mode}, "
+                f"expected one of {VACUUM_MODES}."
+            )
+
+        super().__init__(**kwargs)
+
+    def _plan(self, db_hook: InstrumentedHook) -> List[Dict[str, Any]]:
+        """Decide which tables to vacuum or analyze.
+
+        Parameters
+        ----------
+        db_hook : InstrumentedHook
+            The hook connected to Redshift.
+
+        Returns
+        -------
+        List[Dict[str, Any]]
+            One entry per action, with the table's health figures.
+        """
+        records = db_hook.get_records(
+            SQL_QUERIES.SELECT_TABLE_HEALTH,
+            parameters=(self._schema_name, tuple(self._table_names)),
+        )
+
+        actions = []
+
+        for table_name, unsorted, stats_off, tbl_rows in records:
+            table_name = table_name.strip()
+            health = {
+                "table_name": table_name,
+                "unsorted": float(unsorted) if unsorted is not None else None,
+                "stats_off": float(stats_off) if stats_off is not None else None,
+                "tbl_rows": int(tbl_rows or 0),
+            }
+
+            if health["tbl_rows"] < self._min_rows:
+                self.log.info("Skipping %s, %s rows.", table_name, health["tbl_rows"])
+                continue
+
+            # Tables without a sort key report no unsorted share.
+            if (health["unsorted"] or 0) > self._unsorted_threshold:
+                actions.append(dict(health, action=f"VACUUM {self._vacuum_mode}"))
+
+            if (health["stats_off"] or 0) > self._stats_off_threshold:
+                actions.append(dict(health, action="ANALYZE"))
+
+        return actions
+
+    def execute(self, context: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Execute the table maintenance operation.
+
+        Parameters
+        ----------
+        context : Dict[str, Any]
+            The Airflow execution context containing information about the
+            current execution.
+
+        Returns
+        -------
+        List[Dict[str, Any]]
+            The actions taken, pushed to XCom.
+        """
+        self.log.info("Maintaining tables in %s...", self._connection_type)
+        self.log.debug("Using context: %s", context)
+
+        if self._connection_type != "Redshift":
+            self.log.info("Nothing to maintain outside Redshift.")
+            return []
+
+        db_hook = get_db_hook(
+            self._db_connection_id, self._connection_type, self._session_stmts
+        )
+
+        actions = self._plan(db_hook)
+
+        if not actions:
+            self.log.info("No table needs maintenance in %s.", self._connection_type)
+            db_hook.publish(context)
+            return []
+
+        run_at = datetime.utcnow()
+
+        for action in actions:
+            if action["action"] == "ANALYZE":
+                sql = SQL_QUERIES.ANALYZE_TABLE.format(table=action["table_name"])
+            else:
+                sql = SQL_QUERIES.VACUUM_TABLE.format(
+                    mode=self._vacuum_mode,
+                    table=action["table_name"],
+                    percent=self._vacuum_to_percent,
+                )
+
+            self.log.info(
+                "Running %s (unsorted %s%%, stats off %s%%, %s rows)...",
+                sql,
+                action["unsorted"],
+                action["stats_off"],
+                action["tbl_rows"],
+            )
+
+            # VACUUM cannot run inside a transaction block.
+            started = time.perf_counter()
+            db_hook.run(sql, autocommit=True)
+            action["duration_seconds"] = time.perf_counter() - started
+
+        if self._log_table:
+            conn = db_hook.get_conn()
+
+            try:
+                with conn.cursor() as cursor:
+                    with db_hook.measure(cursor, SQL_QUERIES.INSERT_MAINTENANCE_LOG):
+                        execute_values(
+                            cursor,
+                            SQL_QUERIES.INSERT_MAINTENANCE_LOG,
+                            [
+                                (
+                                    action["table_name"],
+                                    action["action"],
+                                    action["unsorted"],
+                                    action["stats_off"],
+                                    action["tbl_rows"],
+                                    action["duration_seconds"],
+                                    run_at,
+                                )
+                                for action in actions
+                            ],
+                        )
+                conn.commit()
+            finally:
+                conn.close()
+
+        db_hook.publish(context)
+
+        self.log.info(
+            "Ran %s maintenance actions in %s.", len(actions), self._connection_type
+        )
+
+        return actions
@@ -0,0 +1,287 @@
+"""Operator to export tables and queries from Redshift to S3 as Parquet."""
+
+from datetime import timezone
+from typing import Dict, Any, List, Optional
+
+from airflow.models import BaseOperator
+
+import helpers.sql_queries as SQL_QUERIES
+from helpers.query_metrics import get_db_hook
+from helpers.session_settings import render_session_settings
+
+
+def render_unload(
+    query: str,
+    bucket: str,
+    s3_key: str,
+    iam_role: str,
+    partition_by: Optional[List[str]] = None,
+    max_file_size_mb: Optional[int] = None,
+    manifest: bool = False,
+    parallel: bool = True,
+    cleanpath: bool = True,
+    allow_overwrite: bool = False,
+    region: Optional[str] = None,
+) -> str:
+    """Render the UNLOAD statement for one export.
+
+    Parameters
+    ----------
+    query : str
+        The SELECT to export.
+    bucket : str
+        The bucket to write to.
+    s3_key : str
+        The key prefix to write under.
+    iam_role : str
+        The IAM role ARN.
+    partition_by : List[str], optional
+        Columns to partition the files by, as ``column=value/`` key parts.
+    max_file_size_mb : int, optional
+        The largest file written, between 5 and 6200 MB. Defaults to
+        Redshift's 6200 MB.
+    manifest : bool, optional
+        Also write a manifest of the files. Defaults to False.
+    parallel : bool, optional
+        Write one file per slice rather than a single file. Defaults to True.
+    cleanpath : bool, optional
+        Remove the files under ``s3_key`` first, so each export is a full
+        snapshot. Defaults to True.
+    allow_overwrite : bool, optional
+        Overwrite files of the same name instead of failing on them, and keep
+        the others. Requires ``cleanpath`` to be False. Defaults to False.
+    region : str, optional
+        The region of the bucket, when it differs from the cluster's.
+
+    Returns
+    -------
+    str
+        The UNLOAD statement.
+    """
+    if max_file_size_mb is not None and not 5 <= max_file_size_mb <= 6200:
+        raise ValueError(
+            f"max_file_size_mb must be between 5 and 6200, got {max_file_size_mb}."
+        )
+
+    if cleanpath and allow_overwrite:
+        raise ValueError("cleanpath and allow_overwrite are mutually exclusive.")
+
+    options = []
+
+    if partition_by:
+        options.append(f"PARTITION BY ({', '.join(partition_by)})")
+
+    if max_file_size_mb is not None:
+        options.append(f"MAXFILESIZE {max_file_size_mb} MB")
+
+    if manifest:
+        options.append("MANIFEST")
+
+    options.append(f"PARALLEL {'ON' if parallel else 'OFF'}")
+
+    if cleanpath:
+        options.append("CLEANPATH")
+
+    if allow_overwrite:
+        options.append("ALLOWOVERWRITE")
+
+    if region:
+        options.append(f"REGION '{region}'")
+
+    return SQL_QUERIES.UNLOAD_TO_S3.format(
+        query=query.strip().replace("'", "''"),
+        bucket=bucket,
+        s3_key=s3_key,
+        iam_role=iam_role,
+        unload_options="\n".join(options),
+    )
+
+
+class UnloadToS3Operator(BaseOperator):
+    """Operator to export tables and queries from Redshift to S3 as Parquet.
+
+    Each export is written with a parallel UNLOAD under
+    ``{s3_prefix}{name}/``, so downstream readers can query the files instead
+    of the cluster. A table or query is replaced by a full snapshot on every
+    run, while an export with an ``interval_column`` only writes the rows of
+    the run's data interval, into their own partitions, and leaves those of
+    the other intervals in place.
+
+    Parameters
+    ----------
+    db_connection_id : str
+        The ID of the database connection to use.
+    bucket_name : str
+        The bucket to export to.
+    iam_role : str
+        The IAM role ARN.
+    exports : List[Dict[str, Any]]
+        One entry per export, with a ``name`` and either a ``table`` or a
+        ``query``, and optionally ``partition_by``, a list of columns, and
+        ``interval_column``, the UTC timestamp column that places a row in a
+        data interval. An interval export requires ``partition_by`` down to
+        the schedule's granularity, so that each run owns the partitions it
+        overwrites. An unscheduled run, with an empty interval, writes every
+        row.
+    s3_prefix : str, optional
+        The key prefix of all exports. Defaults to "exports/".
+    max_file_size_mb : int, optional
+        The largest file written, between 5 and 6200 MB.
+    manifest : bool, optional
+        Also write a manifest for each export. Defaults to False.
+    region_name : str, optional
+        The region of the bucket, when it differs from the cluster's.
+    connection_type : str, optional
+        The type of database connection to use. On "DuckDB" the exports are
+        written as local Parquet files. Defaults to "Redshift".
+    session_settings : Dict[str, Any], optional
+        WLM settings over ``session_defaults``, as in
+        ``helpers.session_settings``. The exports run in the "etl_unload" query
+        group.
+
+    Methods
+    -------
+    execute(self, context: Dict[str, Any]) -> List[str]
+        Execute the export.
+    """
+
+    ui_color = "#F7C873"
+    template_fields = ("_bucket_name", "_iam_role", "_s3_prefix", "_exports")
+    session_defaults = {"query_group": "etl_unload"}
+
+    def __init__(self, **kwargs: Dict[str, Any]):
+        self._db_connection_id = kwargs.pop("db_connection_id", None)
+        self._bucket_name = kwargs.pop("bucket_name", None)
+        self._iam_role = kwargs.pop("iam_role", None)
+        self._exports = kwargs.pop("exports", [])
+        self._s3_prefix = kwargs.pop("s3_prefix", "exports/")
+        self._max_file_size_mb = kwargs.pop("max_file_size_mb", None)
+        self._manifest = kwargs.pop("manifest", False)
+        self._region_name = kwargs.pop("region_name", None)
+        self._connection_type = kwargs.pop("connection_type", "Redshift")
+        self._session_stmts = render_session_settings(
+            {**self.session_defaults, **(kwargs.pop("session_settings", None) or {})},
+            self._connection_type,
+        )
+
+        for export in self._exports:
+            if not export.get("name") or bool(export.get("table")) == bool(
+                export.get("query")
+            ):
+                raise ValueError(
+                    "Every export requires a name and one of table or query."
+                )
+
+            if export.get("interval_column") and not export.get("partition_by"):
+                raise ValueError(
+                    f"Export {export['name']} has an interval_column but no "
+                    "partition_by, so each run would overwrite the last."
+                )
+
+        super().__init__(**kwargs)
+
+    @staticmethod
+    def _export_query(export: Dict[str, Any], context: Dict[str, Any]) -> str:
+        """Return the SELECT of an export, limited to the run's data interval.
+
+        Parameters
+        ----------
+        export : Dict[str, Any]
+            The export.
+        context : Dict[str, Any]
+            The Airflow execution context containing information about the
+            current execution.
+
+        Returns
+        -------
+        str
+            The SELECT to unload.
+        """
+        query = export.get("query") or SQL_QUERIES.EXPORT_TABLE_SELECT.format(
+            table=export["table"]
+        )
+
+        if not export.get("interval_column") or not context:
+            return query
+
+        start = context["data_interval_start"].astimezone(timezone.utc)
+        end = context["data_interval_end"].astimezone(timezone.utc)
+
+        if end <= start:
+            return query
+
+        return SQL_QUERIES.EXPORT_INTERVAL_SELECT.format(
+            query=query.strip().rstrip(";"),
+            column=export["interval_column"],
+            start=start.strftime("%Y-%m-%d %H:%M:%S"),
+            end=end.strftime("%Y-%m-%d %H:%M:%S"),
+        )
+
+    def unload_statements(self, context: Optional[Dict[str, Any]] = None) -> List[str]:
+        """Render the UNLOAD statement of every export.
+
+        Snapshots clean their prefix first. Interval exports overwrite only
+        the files of the partitions they write, as a rerun of the same
+        interval does, and keep the rest.
+
+        Parameters
+        ----------
+        context : Dict[str, Any], optional
+            The Airflow execution context, for the data interval. Without it,
+            interval exports write every row.
+
+        Returns
+        -------
+        List[str]
+            The statements, in the order of ``exports``.
+        """
+        return [
+            render_unload(
+                self._export_query(export, context),
+                self._bucket_name,
+                f"{self._s3_prefix}{export['name']}/",
+                self._iam_role,
+                partition_by=export.get("partition_by"),
+                max_file_size_mb=self._max_file_size_mb,
+                manifest=self._manifest,
+                cleanpath=not export.get("interval_column"),
+                allow_overwrite=bool(export.get("interval_column")),
+                region=self._region_name,
+            )
+            for export in self._exports
+        ]
+
+    def execute(self, context: Dict[str, Any]) -> List[str]:
+        """Execute the export.
+
+        Parameters
+        ----------
+        context : Dict[str, Any]
+            The Airflow execution context containing information about the
+            current execution.
+
+        Returns
+        -------
+        List[str]
+            The S3 key prefixes written, pushed to XCom.
+        """
+        self.log.info(
+            "Exporting %s tables from %s...", len(self._exports), self._connection_type
+        )
+        self.log.debug("Using context: %s", context)
+
+        db_hook = get_db_hook(
+            self._db_connection_id, self._connection_type, self._session_stmts
+        )
+
+        # Each UNLOAD commits on its own, so one failed export does not undo
+        # the ones written before it.
+        for statement in self.unload_statements(context):
+            self.log.info("Executing SQL: %s", statement)
+            db_hook.run(statement, autocommit=True)
+
+        db_hook.publish(context)
+
+        self.log.info("Export to s3://%s completed.", self._bucket_name)
+
+        return [f"{self._s3_prefix}{export['name']}/" for export in self._exports]
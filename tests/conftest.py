@@ -0,0 +1,37 @@
+"""Shared fixtures for the plugin tests"""
+
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+PLUGINS = os.path.join(ROOT, "plugins")
+sys.path[:0] = [PLUGINS, os.path.join(PLUGINS, "operators")]
+
+
+@pytest.fixture
+def s3_root(tmp_path):
+    """A local directory standing in for S3."""
+    root = tmp_path / "s3"
+    root.mkdir()
+    return root
+
+
+@pytest.fixture
+def duckdb_connection(tmp_path, s3_root, monkeypatch):
+    """The ID of an Airflow connection to a fresh embedded DuckDB database."""
+    monkeypatch.setenv(
+        "AIRFLOW_CONN_DUCKDB",
+        json.dumps(
+            {
+                "conn_type": "generic",
+                "extra": {
+                    "database": str(tmp_path / "etl.duckdb"),
+                    "s3_root": str(s3_root),
+                },
+            }
+        ),
+    )
+    return "duckdb"
@@ -0,0 +1,37 @@
+"""Tests for splitting and reading the small objects compacted"""
+
+import pytest
+
+pytest.importorskip("airflow")
+
+# pylint: disable=wrong-import-position,protected-access
+from compact_s3 import _balance, _json_records
+
+
+def test_balance_evens_out_the_part_sizes():
+    objects = [(f"song-{size}.json", f"etag-{size}", size) for size in range(1, 11)]
+
+    parts = _balance(objects, 3)
+
+    assert sorted(sum(size for _, _, size in part) for part in parts) == [18, 18, 19]
+    assert sorted(obj for part in parts for obj in part) == sorted(objects)
+    # Each part keeps the source order.
+    assert all(part == sorted(part) for part in parts)
+
+
+def test_balance_leaves_extra_parts_empty():
+    objects = [("a.json", "etag-a", 5), ("b.json", "etag-b", 7)]
+
+    assert _balance(objects, 4) == [
+        [("b.json", "etag-b", 7)],
+        [("a.json", "etag-a", 5)],
+        [],
+        [],
+    ]
+
+
+def test_json_records_reads_concatenated_and_line_delimited_values():
+    body = '{"a": 1}{"a": 2}\n\n  {"a": 3}\n'
+
+    assert list(_json_records(body)) == [{"a": 1}, {"a": 2}, {"a": 3}]
+    assert not list(_json_records("  \n"))
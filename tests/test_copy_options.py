@@ -0,0 +1,50 @@
+"""Tests for rendering and validating COPY tuning options"""
+
+import pytest
+
+from helpers.copy_options import render_copy_options
+
+
+def test_renders_every_option_in_order():
+    assert render_copy_options(
+        {
+            "compression": "zstd",
+            "compupdate": False,
+            "statupdate": True,
+            "maxerror": 10,
+            "truncatecolumns": True,
+            "acceptinvchars": "?",
+            "blanksasnull": True,
+            "emptyasnull": False,
+        }
+    ).split("\n") == [
+        "ZSTD",
+        "COMPUPDATE OFF",
+        "STATUPDATE ON",
+        "MAXERROR 10",
+        "TRUNCATECOLUMNS",
+        "ACCEPTINVCHARS AS '?'",
+        "BLANKSASNULL",
+    ]
+
+
+def test_no_options_render_nothing():
+    assert render_copy_options({}) == ""
+
+
+@pytest.mark.parametrize(
+    "options, message",
+    [
+        ({"gzip": True}, "Unknown COPY option gzip"),
+        ({"compression": "snappy"}, "Unknown compression snappy"),
+        ({"compupdate": "off"}, "compupdate must be a bool"),
+        # bool is an int, but not a number of errors.
+        ({"maxerror": True}, "maxerror must be a int"),
+        ({"maxerror": -1}, "maxerror must be >= 0"),
+        ({"acceptinvchars": "??"}, "acceptinvchars must be one character"),
+        ({"acceptinvchars": "'"}, "acceptinvchars must be one character"),
+    ],
+)
+def test_invalid_options_are_rejected(options, message):
+    with pytest.raises(ValueError, match=message):
+        render_copy_options(options)
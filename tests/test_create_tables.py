@@ -0,0 +1,131 @@
+"""Tests for reconciling the live schema with the CREATE TABLE statements"""
+
+import logging
+
+import pytest
+
+pytest.importorskip("airflow")
+
+# pylint: disable=wrong-import-position,protected-access
+import helpers.sql_queries as SQL_QUERIES
+from create_tables import CreateTablesOperator
+
+TABLES = {
+    "staging_events": SQL_QUERIES.CREATE_STAGING_EVENTS_TABLE,
+    "staging_songs": SQL_QUERIES.CREATE_STAGING_SONGS_TABLE,
+    "staging_load_ledger": SQL_QUERIES.CREATE_LOAD_LEDGER_TABLE,
+    "songplays": SQL_QUERIES.CREATE_SONGPLAYS_TABLE,
+}
+
+
+class CatalogHook:
+    """Answers the catalog query with the tables it was given."""
+
+    def __init__(self, live_tables):
+        self._live_tables = live_tables
+
+    def get_records(self, sql, parameters=None):
+        assert sql == SQL_QUERIES.SELECT_SCHEMA_CATALOG
+        return [
+            (table_name, column_name, CreateTablesOperator._fingerprint(create))
+            for table_name, create in self._live_tables.items()
+            for column_name in CreateTablesOperator._column_names(create)
+        ]
+
+
+def reconcile(live_tables):
+    """Return the reconcile statements against ``live_tables``."""
+    operator = CreateTablesOperator(
+        task_id="create_tables",
+        db_connection_id="redshift",
+        create_table_stmts=list(TABLES.values()),
+        reconcile=True,
+        on_recreate_stmts=[SQL_QUERIES.DELETE_LOAD_LEDGER_ENTRIES],
+        truncate_on_create={
+            "staging_load_ledger": ["staging_events", "staging_songs"]
+        },
+        backfill_tables=["songplays"],
+    )
+
+    return operator._reconcile_stmts(CatalogHook(live_tables))
+
+
+def test_fingerprint_ignores_whitespace_and_case():
+    create = SQL_QUERIES.CREATE_SONGPLAYS_TABLE
+
+    assert CreateTablesOperator._fingerprint(create) == (
+        CreateTablesOperator._fingerprint("  " + create.upper().replace(" ", "\n "))
+    )
+    assert CreateTablesOperator._fingerprint(create) != (
+        CreateTablesOperator._fingerprint(SQL_QUERIES.CREATE_USERS_TABLE)
+    )
+
+
+def test_column_names_skip_constraints():
+    assert CreateTablesOperator._column_names(
+        SQL_QUERIES.CREATE_LOAD_LEDGER_TABLE
+    ) == ["table_name", "s3_key", "etag", "size", "loaded_at"]
+
+
+def test_unchanged_schema_needs_no_statements():
+    assert reconcile(TABLES) == []
+
+
+def test_changed_table_is_recreated_and_forgotten():
+    live_tables = {
+        **TABLES,
+        "staging_songs": TABLES["staging_songs"].replace("float8", "numeric(18,3)"),
+    }
+
+    assert reconcile(live_tables) == [
+        "DROP TABLE IF EXISTS staging_songs;",
+        TABLES["staging_songs"],
+        SQL_QUERIES.COMMENT_SCHEMA_FINGERPRINT.format(
+            table="staging_songs",
+            fingerprint=CreateTablesOperator._fingerprint(TABLES["staging_songs"]),
+        ),
+        "DELETE FROM staging_load_ledger WHERE table_name = 'staging_songs';",
+    ]
+
+
+def test_recreated_ledger_empties_the_staging_tables():
+    live_tables = {
+        **TABLES,
+        "staging_load_ledger": TABLES["staging_load_ledger"].replace(
+            "etag", "e_tag"
+        ),
+    }
+
+    statements = reconcile(live_tables)
+
+    assert statements[0] == "DROP TABLE IF EXISTS staging_load_ledger;"
+    assert statements[-2:] == [
+        "DELETE FROM staging_events;",
+        "DELETE FROM staging_songs;",
+    ]
+
+
+def test_missing_ledger_empties_the_staging_tables():
+    live_tables = dict(TABLES)
+    del live_tables["staging_load_ledger"]
+
+    statements = reconcile(live_tables)
+
+    assert statements[0] == TABLES["staging_load_ledger"]
+    assert statements[-2:] == [
+        "DELETE FROM staging_events;",
+        "DELETE FROM staging_songs;",
+    ]
+
+
+def test_recreated_fact_table_warns_of_a_backfill(caplog):
+    live_tables = {
+        **TABLES,
+        "songplays": TABLES["songplays"].replace("level", "tier"),
+    }
+
+    with caplog.at_level(logging.WARNING):
+        statements = reconcile(live_tables)
+
+    assert "DROP TABLE IF EXISTS songplays;" in statements
+    assert "Table songplays was recreated EMPTY" in caplog.text
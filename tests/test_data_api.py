@@ -0,0 +1,183 @@
+"""Tests for deferred execution through the Data API, on the local stand-in"""
+
+import asyncio
+import logging
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("airflow")
+pytest.importorskip("duckdb")
+
+# pylint: disable=wrong-import-position,protected-access
+from airflow.exceptions import AirflowException
+
+from helpers.data_api import (
+    MAX_BATCH_STATEMENTS,
+    DataAPIMixin,
+    DataAPIStatementError,
+    RedshiftStatementTrigger,
+    statement_rows,
+    submit_statements,
+)
+from helpers.local_backend import LocalDataAPI
+
+
+class TaskInstance:
+    """Records what an operator pushes to XCom."""
+
+    dag_id = "test_dag"
+    task_id = "test_task"
+
+    def __init__(self):
+        self.xcom = {}
+
+    def xcom_push(self, key, value):
+        self.xcom[key] = value
+
+
+class DeferredOperator(DataAPIMixin):
+    """The attributes DataAPIMixin expects of an operator."""
+
+    task_id = "test_task"
+    log = logging.getLogger(__name__)
+
+    def __init__(self, db_connection_id):
+        self._db_connection_id = db_connection_id
+        self._connection_type = "DuckDB"
+        self._aws_connection_id = "aws_default"
+        self._poll_interval = 0
+        self._session_stmts = []
+
+
+def run_trigger(statement_ids, db_connection_id):
+    """Run the trigger to its event and return the event's payload."""
+    trigger = RedshiftStatementTrigger(
+        statement_ids, db_connection_id, "DuckDB", poll_interval=0
+    )
+
+    async def first_event():
+        async for event in trigger.run():
+            return event.payload
+
+    return asyncio.run(first_event())
+
+
+def test_trigger_reports_single_and_batch_statements(duckdb_connection):
+    client = LocalDataAPI(duckdb_connection)
+    create = submit_statements(
+        client, {}, ["CREATE TABLE plays (n int, price decimal(5,2))"], "create"
+    )
+    load = submit_statements(
+        client,
+        {},
+        [
+            "INSERT INTO plays VALUES (1, 1.50), (2, 2.25)",
+            "SELECT n, price FROM plays ORDER BY n",
+        ],
+        "load",
+    )
+
+    event = run_trigger([create, load], duckdb_connection)
+
+    assert event["status"] == "success"
+    assert [outcome["id"] for outcome in event["statements"]] == [create, load]
+    assert event["statements"][0]["result_id"] == create
+    # A batch's rows are those of its last sub-statement.
+    assert event["statements"][1]["result_id"] == f"{load}:2"
+    assert event["statements"][1]["rows"] == 2
+    assert statement_rows(client, event["statements"][1]["result_id"]) == [
+        (1, Decimal("1.50")),
+        (2, Decimal("2.25")),
+    ]
+
+
+def test_statement_rows_follows_next_token(duckdb_connection):
+    client = LocalDataAPI(duckdb_connection, page_size=2)
+    statement_id = submit_statements(
+        client, {}, ["SELECT range AS n FROM range(5)"], "select"
+    )
+
+    event = run_trigger([statement_id], duckdb_connection)
+
+    assert client.get_statement_result(Id=statement_id)["NextToken"] == "2"
+    assert statement_rows(client, event["statements"][0]["result_id"]) == [
+        (0,),
+        (1,),
+        (2,),
+        (3,),
+        (4,),
+    ]
+
+
+def test_failed_batch_rolls_back_and_fails_the_task(duckdb_connection):
+    client = LocalDataAPI(duckdb_connection)
+    run_trigger(
+        [submit_statements(client, {}, ["CREATE TABLE plays (n int)"], "create")],
+        duckdb_connection,
+    )
+    load = submit_statements(
+        client,
+        {},
+        ["INSERT INTO plays VALUES (1)", "INSERT INTO missing VALUES (1)"],
+        "load",
+    )
+
+    event = run_trigger([load], duckdb_connection)
+
+    assert event["status"] == "error"
+    assert event["statements"][0]["status"] == "FAILED"
+    assert "missing" in event["statements"][0]["error"]
+
+    count = submit_statements(client, {}, ["SELECT COUNT(*) FROM plays"], "count")
+    run_trigger([count], duckdb_connection)
+    assert statement_rows(client, count) == [(0,)]
+
+    operator = DeferredOperator(duckdb_connection)
+    task_instance = TaskInstance()
+
+    with pytest.raises(DataAPIStatementError, match=load):
+        operator.execute_complete({"ti": task_instance}, event)
+
+    assert len(task_instance.xcom["query_metrics"]) == 1
+
+
+def test_execute_complete_publishes_successful_statements(duckdb_connection):
+    client = LocalDataAPI(duckdb_connection)
+    event = run_trigger(
+        [submit_statements(client, {}, ["SELECT 1"], "select")], duckdb_connection
+    )
+    task_instance = TaskInstance()
+
+    DeferredOperator(duckdb_connection).execute_complete({"ti": task_instance}, event)
+
+    assert task_instance.xcom["query_metrics"][0]["sql"] == "SELECT 1"
+
+
+def test_submit_rejects_more_statements_than_a_batch_holds(duckdb_connection):
+    client = LocalDataAPI(duckdb_connection)
+    statements = ["SELECT 1"] * (MAX_BATCH_STATEMENTS + 1)
+
+    with pytest.raises(ValueError, match="at most 40"):
+        submit_statements(client, {}, statements, "load")
+
+    submit_statements(client, {}, statements[:MAX_BATCH_STATEMENTS], "load")
+
+
+def test_defer_counts_the_session_statements(duckdb_connection):
+    operator = DeferredOperator(duckdb_connection)
+    operator._session_stmts = ["SET query_group TO 'etl_load';"]
+    statements = ["SELECT 1"] * MAX_BATCH_STATEMENTS
+
+    assert operator.fits_in_batch(statements[1:])
+    assert not operator.fits_in_batch(statements)
+
+    with pytest.raises(ValueError, match="41"):
+        operator.defer_statements([["SELECT 1"], statements])
+
+
+def test_execute_complete_without_an_event_fails(duckdb_connection):
+    with pytest.raises(AirflowException, match="without an event"):
+        DeferredOperator(duckdb_connection).execute_complete(
+            {"ti": TaskInstance()}, None
+        )
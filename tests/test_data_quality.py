@@ -0,0 +1,266 @@
+"""Tests for the data quality checks, on the embedded DuckDB backend"""
+
+import pytest
+
+pytest.importorskip("airflow")
+pytest.importorskip("duckdb")
+
+# pylint: disable=wrong-import-position,protected-access
+import helpers.sql_queries as SQL_QUERIES
+from data_quality import DataQualityCheckError, DataQualityOperator
+from helpers.query_metrics import get_db_hook
+
+RULES = {
+    "plays": [
+        {"rule": "null_rate", "column": "userid", "max": 0.5},
+        {"rule": "unique", "column": "playid"},
+    ]
+}
+PROFILES = {
+    "plays": [
+        {"metric": "approx_distinct", "column": "userid"},
+        {"metric": "null_fraction", "column": "userid"},
+    ]
+}
+
+
+class TaskInstance:
+    """Records what an operator pushes to XCom."""
+
+    dag_id = "test_dag"
+    task_id = "run_quality_checks"
+
+    def __init__(self):
+        self.xcom = {}
+
+    def xcom_push(self, key, value):
+        self.xcom[key] = value
+
+
+@pytest.fixture
+def db_hook(duckdb_connection):
+    """A hook to a database with an empty plays table and the profile history."""
+    db_hook = get_db_hook(duckdb_connection, "DuckDB")
+    db_hook.run(
+        [
+            "CREATE TABLE plays (playid varchar, userid int, duration float8);",
+            SQL_QUERIES.CREATE_PROFILES_TABLE,
+        ],
+        autocommit=True,
+    )
+
+    return db_hook
+
+
+def load_plays(db_hook, count, first=0):
+    """Replace the plays with ``count`` plays of distinct users."""
+    db_hook.run(
+        [
+            "DELETE FROM plays;",
+            "INSERT INTO plays SELECT 'play-' || i, i, 200.0 "
+            f"FROM range({first}, {first + count}) AS t(i);",
+        ],
+        autocommit=True,
+    )
+
+
+def check(connection_id, run_id, **kwargs):
+    """Run the checks of one DAG run and return the statements it ran."""
+    task_instance = TaskInstance()
+    operator = DataQualityOperator(
+        task_id="run_quality_checks",
+        db_connection_id=connection_id,
+        connection_type="DuckDB",
+        **kwargs,
+    )
+
+    operator.execute({"ti": task_instance, "run_id": run_id})
+
+    return [metric["sql"] for metric in task_instance.xcom["query_metrics"]]
+
+
+def test_rules_and_profile_share_one_query(duckdb_connection):
+    operator = DataQualityOperator(
+        task_id="run_quality_checks",
+        db_connection_id=duckdb_connection,
+        table_names=["plays", "users"],
+        rules=RULES,
+        profiles={**PROFILES, "users": PROFILES["plays"]},
+    )
+
+    rules, metrics, query = operator._table_query("plays")
+
+    assert [rule["rule"] for rule in rules] == ["row_count", "null_rate", "unique"]
+    assert [name for name, _, _ in metrics] == [
+        "row_count",
+        "approx_distinct(userid)",
+        "null_fraction(userid)",
+    ]
+    assert query.startswith("SELECT COUNT(*) AS check_0, ")
+    assert "APPROXIMATE COUNT(DISTINCT userid) AS metric_1" in query
+    assert query.endswith(" FROM plays;")
+
+    # users has no rules of its own: a plain count, then its profile.
+    assert operator._deferred_queries() == [
+        "SELECT COUNT(*) FROM users",
+        query,
+        operator._table_query("users")[2],
+    ]
+
+
+def test_profile_is_recorded_from_the_rules_scan(duckdb_connection, db_hook):
+    load_plays(db_hook, 10)
+
+    statements = check(
+        duckdb_connection,
+        "run-1",
+        table_names=["plays"],
+        rules=RULES,
+        profiles=PROFILES,
+    )
+
+    # The one scan of plays; metrics keep the first 200 characters of SQL.
+    assert len([sql for sql in statements if "AS check_0" in sql]) == 1
+    assert not [sql for sql in statements if sql.startswith("SELECT COUNT(*) AS m")]
+
+    profile = dict(
+        db_hook.get_records(
+            "SELECT metric, value FROM data_quality_profiles WHERE run_id = 'run-1'"
+        )
+    )
+
+    assert profile["row_count"] == 10
+    assert profile["null_fraction(userid)"] == 0
+    assert profile["approx_distinct(userid)"] == pytest.approx(10, rel=0.2)
+
+
+def test_drift_from_the_trailing_average_fails(duckdb_connection, db_hook):
+    for run in range(3):
+        load_plays(db_hook, 10, first=run * 10)
+        check(duckdb_connection, f"run-{run}", profiles=PROFILES, on_drift="fail")
+
+    load_plays(db_hook, 4)
+
+    with pytest.raises(DataQualityCheckError, match=r"row_count 4 is 60% off"):
+        check(duckdb_connection, "run-3", profiles=PROFILES, on_drift="fail")
+
+    # A warning only, and the run's profile replaces the failed attempt's.
+    check(duckdb_connection, "run-3", profiles=PROFILES)
+
+    assert db_hook.get_first(
+        "SELECT COUNT(*) FROM data_quality_profiles WHERE run_id = 'run-3'"
+    ) == (3,)
+
+
+def test_union_mode_counts_every_table_in_one_query(duckdb_connection, db_hook):
+    load_plays(db_hook, 3)
+    db_hook.run(
+        ["CREATE TABLE users (userid int);", "CREATE TABLE songs (songid int);"],
+        autocommit=True,
+    )
+
+    with pytest.raises(
+        DataQualityCheckError, match="users: no rows; songs: no rows"
+    ) as error:
+        check(
+            duckdb_connection,
+            "run-1",
+            table_names=["plays", "users", "songs"],
+            batch_mode="union",
+        )
+
+    assert "plays" not in str(error.value)
+
+    operator = DataQualityOperator(
+        task_id="run_quality_checks",
+        table_names=["plays", "users", "songs"],
+        batch_mode="union",
+    )
+    assert operator._deferred_queries() == [
+        operator._union_query(["plays", "users", "songs"])
+    ]
+    assert operator._union_query(["plays", "users"]).count("UNION ALL") == 1
+
+
+def test_catalog_counts_are_ordered_and_default_to_zero():
+    # svv_table_info pads names, and has no row for a table never loaded.
+    assert DataQualityOperator._named_counts(
+        ["plays", "users", "songs"], [("users   ", 5), ("plays", 7)]
+    ) == [("plays", 7), ("users", 5), ("songs", 0)]
+
+
+@pytest.mark.parametrize(
+    "kwargs, message",
+    [
+        ({"batch_mode": "scan"}, "Unknown batch mode"),
+        ({"batch_mode": "catalog", "connection_type": "DuckDB"}, "needs Redshift"),
+        ({"batch_mode": "catalog", "deferrable": True}, "deferrable"),
+    ],
+)
+def test_batch_mode_validation(kwargs, message):
+    with pytest.raises(ValueError, match=message):
+        DataQualityOperator(task_id="run_quality_checks", **kwargs)
+
+
+def test_every_failed_rule_is_reported_from_one_scan(duckdb_connection, db_hook):
+    db_hook.run(
+        "INSERT INTO plays VALUES ('a', 1, 200.0), ('a', NULL, 200.0), "
+        "('b', NULL, -1.0), ('c', 2, 900.0);",
+        autocommit=True,
+    )
+    rules = {
+        "plays": [
+            {"rule": "null_rate", "column": "userid", "max": 0.25},
+            {"rule": "unique", "column": "playid"},
+            {"rule": "range", "column": "duration", "min": 0, "max": 600},
+            {
+                "rule": "expression",
+                "sql": "MAX(duration)",
+                "expected": 600,
+                "comparison": "<=",
+            },
+            {"rule": "row_count", "min": 4},
+        ]
+    }
+
+    with pytest.raises(DataQualityCheckError) as error:
+        check(duckdb_connection, "run-1", rules=rules)
+
+    assert str(error.value) == (
+        "Data quality check failed: "
+        "plays: userid null rate 0.5 is above 0.25; "
+        "plays: playid has 1 duplicate values; "
+        "plays: duration has 2 values out of range; "
+        "plays: MAX(duration) returned 900.0, expected <= 600."
+    )
+
+    # The rules that pass fold into the same single scan.
+    statements = check(duckdb_connection, "run-2", rules={"plays": rules["plays"][4:]})
+    assert len([sql for sql in statements if "FROM plays" in sql]) == 1
+
+
+def test_a_table_with_rules_gets_the_default_row_count(duckdb_connection, db_hook):
+    with pytest.raises(DataQualityCheckError, match="plays: row count 0 is below 1"):
+        check(
+            duckdb_connection,
+            "run-1",
+            table_names=["plays"],
+            rules={"plays": [{"rule": "unique", "column": "playid"}]},
+        )
+
+
+@pytest.mark.parametrize(
+    "rule, message",
+    [
+        ({"rule": "not_null", "column": "userid"}, "Unknown rule not_null"),
+        ({"rule": "null_rate"}, r"missing \['column'\]"),
+        ({"rule": "range", "column": "duration"}, "requires min or max"),
+        (
+            {"rule": "expression", "sql": "1", "expected": 1, "comparison": "~"},
+            "Unknown comparison",
+        ),
+    ],
+)
+def test_rule_validation(rule, message):
+    with pytest.raises(ValueError, match=message):
+        DataQualityOperator(task_id="run_quality_checks", rules={"plays": [rule]})
@@ -0,0 +1,198 @@
+"""Tests for merging dimensions from the rows a run staged, on DuckDB"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("airflow")
+pytest.importorskip("duckdb")
+
+# pylint: disable=wrong-import-position
+import helpers.sql_queries as SQL_QUERIES
+from helpers.query_metrics import get_db_hook
+from load_dimension import (
+    check_load_mode,
+    dimension_statements,
+    event_interval_filter,
+    interval_filter,
+)
+
+HOUR_START = datetime(2018, 11, 1, 21, tzinfo=timezone.utc)
+HOUR_END = datetime(2018, 11, 1, 22, tzinfo=timezone.utc)
+HOUR_MS = int(HOUR_START.timestamp() * 1000)
+CONTEXT = {"data_interval_start": HOUR_START, "data_interval_end": HOUR_END}
+
+
+@pytest.fixture
+def db_hook(duckdb_connection):
+    """A hook to a database with the staging and dimension tables."""
+    db_hook = get_db_hook(duckdb_connection, "DuckDB")
+    db_hook.run(
+        [
+            SQL_QUERIES.CREATE_STAGING_EVENTS_TABLE,
+            SQL_QUERIES.CREATE_STAGING_SONGS_TABLE,
+            SQL_QUERIES.CREATE_USERS_TABLE,
+            SQL_QUERIES.CREATE_SONGS_TABLE,
+        ],
+        autocommit=True,
+    )
+
+    return db_hook
+
+
+def merge(db_hook, table_name, select_dim_stmt, primary_key, context=None):
+    """Merge ``select_dim_stmt`` into the table and return the table's rows."""
+    statements, autocommit = dimension_statements(
+        "", "merge", table_name, select_dim_stmt, primary_key, context
+    )
+    db_hook.run(statements, autocommit=autocommit)
+
+    return sorted(db_hook.get_records(f"SELECT * FROM {table_name}"))
+
+
+def test_event_interval_filter():
+    assert event_interval_filter(CONTEXT) == (
+        f"AND ts >= {HOUR_MS} AND ts < {HOUR_MS + 3_600_000}"
+    )
+    assert event_interval_filter(
+        {"data_interval_start": HOUR_END, "data_interval_end": HOUR_END}
+    ) == ""
+
+
+def test_interval_filter_renders_the_interval_in_utc():
+    pacific = timezone(timedelta(hours=-8))
+
+    assert interval_filter(
+        {
+            "data_interval_start": HOUR_START.astimezone(pacific),
+            "data_interval_end": HOUR_END.astimezone(pacific),
+        }
+    ) == (
+        "AND plays.start_time >= '2018-11-01 21:00:00' "
+        "AND plays.start_time < '2018-11-01 22:00:00'"
+    )
+    assert interval_filter(
+        {"data_interval_start": HOUR_END, "data_interval_end": HOUR_END}
+    ) == ""
+
+
+def test_incremental_load_mode_requires_an_interval_filter():
+    with pytest.raises(ValueError, match="interval_filter"):
+        check_load_mode("incremental", "time", None, [], SQL_QUERIES.TIME_TABLE_INSERT)
+
+    check_load_mode(
+        "incremental", "time", None, [], SQL_QUERIES.TIME_TABLE_INCREMENTAL_INSERT
+    )
+
+
+def test_incremental_time_load_reads_only_the_run_interval(db_hook):
+    db_hook.run(
+        [
+            SQL_QUERIES.CREATE_SONGPLAYS_TABLE,
+            SQL_QUERIES.CREATE_TIME_TABLE,
+            "INSERT INTO songplays (playid, start_time, userid) VALUES "
+            "('a', '2018-11-01 20:59:59', 1), ('b', '2018-11-01 21:00:00', 1), "
+            "('c', '2018-11-01 21:00:00', 2), ('d', '2018-11-01 22:00:00', 2);",
+        ],
+        autocommit=True,
+    )
+    statements, autocommit = dimension_statements(
+        SQL_QUERIES.TIME_TABLE_INCREMENTAL_INSERT,
+        load_mode="incremental",
+        table_name="time",
+        context=CONTEXT,
+    )
+
+    assert autocommit
+    db_hook.run(statements * 2, autocommit=True)
+
+    assert db_hook.get_records("SELECT start_time, hour FROM time") == [
+        (datetime(2018, 11, 1, 21), 21)
+    ]
+
+
+def test_users_merge_reads_only_the_run_interval(db_hook):
+    db_hook.run(
+        [
+            "INSERT INTO users VALUES (1, 'Ann', 'Lee', 'F', 'free'), "
+            "(3, 'Cy', 'Ng', 'M', 'free');",
+            # User 1 upgraded in the hour; user 2 only played the hour before.
+            "INSERT INTO staging_events "
+            "(userid, firstname, lastname, gender, level, page, ts) VALUES "
+            f"(1, 'Ann', 'Lee', 'F', 'free', 'NextSong', {HOUR_MS}), "
+            f"(1, 'Ann', 'Lee', 'F', 'paid', 'NextSong', {HOUR_MS + 60_000}), "
+            f"(1, 'Ann', 'Lee', 'F', 'paid', 'Logout', {HOUR_MS + 120_000}), "
+            f"(2, 'Bo', 'Li', 'M', 'free', 'NextSong', {HOUR_MS - 1});",
+        ],
+        autocommit=True,
+    )
+
+    assert merge(
+        db_hook, "users", SQL_QUERIES.USER_TABLE_SELECT, ["userid"], CONTEXT
+    ) == [
+        (1, "Ann", "Lee", "F", "paid"),
+        (3, "Cy", "Ng", "M", "free"),
+    ]
+
+    # An unscheduled run has no interval and merges every staged event.
+    assert [
+        row[0]
+        for row in merge(db_hook, "users", SQL_QUERIES.USER_TABLE_SELECT, ["userid"])
+    ] == [1, 2, 3]
+
+
+def test_songs_merge_reads_only_the_latest_batch(db_hook):
+    db_hook.run(
+        [
+            "INSERT INTO songs VALUES ('S1', 'Old title', 'A1', 2000, 200.0);",
+            "INSERT INTO staging_songs (song_id, title, artist_id, year, duration, "
+            "staged_at) VALUES "
+            "('S1', 'Old title', 'A1', 2000, 200.0, '2018-11-01 20:00:00'), "
+            "('S2', 'Stale', 'A2', 2001, 180.0, '2018-11-01 20:00:00'), "
+            "('S1', 'New title', 'A1', 2000, 200.0, '2018-11-01 21:00:00');",
+        ],
+        autocommit=True,
+    )
+
+    assert merge(db_hook, "songs", SQL_QUERIES.SONG_TABLE_SELECT, ["songid"]) == [
+        ("S1", "New title", "A1", 2000, 200.0)
+    ]
+
+
+def test_copied_rows_are_tagged_and_keyed_in_their_transaction(db_hook):
+    db_hook.run(
+        "INSERT INTO staging_events (song, artist, length, page, ts) VALUES "
+        f"('Old', 'Band', 100.0, 'NextSong', {HOUR_MS - 1});",
+        autocommit=True,
+    )
+    # COPY leaves staged_at out of its column list, as does this INSERT.
+    db_hook.run(
+        [
+            "INSERT INTO staging_events (song, artist, length, page, ts) VALUES "
+            f"('Song', 'Band', 200.0, 'NextSong', {HOUR_MS}), "
+            f"(NULL, NULL, NULL, 'Home', {HOUR_MS + 1});",
+            SQL_QUERIES.STAGING_EVENTS_SONG_KEY_UPDATE,
+        ],
+        autocommit=False,
+    )
+
+    rows = db_hook.get_records(
+        "SELECT page, song_key, staged_at IS NOT NULL FROM staging_events ORDER BY ts"
+    )
+    song_key = db_hook.get_first(
+        "SELECT "
+        + SQL_QUERIES.SONG_KEY_EXPRESSION.format(
+            title="'Song'", artist="'Band'", duration="200.0::float8"
+        )
+    )[0]
+
+    assert [(page, staged) for page, _, staged in rows] == [
+        ("NextSong", True),
+        ("NextSong", True),
+        ("Home", True),
+    ]
+    # Keyed once, in the transaction that staged the row.
+    assert rows[0][1] is None
+    assert rows[1][1] == song_key
+    # Every other event gets a key of its own, for the distribution.
+    assert rows[2][1] not in (None, song_key)
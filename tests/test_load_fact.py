@@ -0,0 +1,86 @@
+"""Tests for the incremental songplays load of a run's data interval"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("airflow")
+
+# pylint: disable=wrong-import-position,protected-access
+import helpers.sql_queries as SQL_QUERIES
+from helpers.query_metrics import get_db_hook
+from load_fact import LoadFactOperator
+
+HOUR_START = datetime(2018, 11, 1, 21, tzinfo=timezone.utc)
+HOUR_END = datetime(2018, 11, 1, 22, tzinfo=timezone.utc)
+HOUR_MS = int(HOUR_START.timestamp() * 1000)
+CONTEXT = {"data_interval_start": HOUR_START, "data_interval_end": HOUR_END}
+
+
+def incremental_operator():
+    """An operator loading songplays incrementally."""
+    return LoadFactOperator(
+        task_id="load_songplays",
+        insert_fact_stmt=SQL_QUERIES.SONGPLAY_TABLE_INSERT,
+        incremental=True,
+        incremental_fact_stmt=SQL_QUERIES.SONGPLAY_TABLE_INCREMENTAL_INSERT,
+    )
+
+
+def test_incremental_stmt_bounds_ts_to_the_interval():
+    pacific = timezone(timedelta(hours=-8))
+    statement = incremental_operator()._incremental_stmt(
+        {
+            "data_interval_start": HOUR_START.astimezone(pacific),
+            "data_interval_end": HOUR_END.astimezone(pacific),
+        }
+    )
+
+    assert f"AND ts >= {HOUR_MS} AND ts < {HOUR_MS + 3_600_000}" in statement
+    assert "{interval_filter}" not in statement
+
+
+def test_incremental_stmt_of_an_empty_interval_loads_every_event():
+    statement = incremental_operator()._incremental_stmt(
+        {"data_interval_start": HOUR_END, "data_interval_end": HOUR_END}
+    )
+
+    assert "AND ts >=" not in statement
+    assert "{interval_filter}" not in statement
+
+
+def test_incremental_requires_incremental_fact_stmt():
+    with pytest.raises(ValueError, match="incremental_fact_stmt"):
+        LoadFactOperator(task_id="load_songplays", incremental=True)
+
+
+def test_incremental_load_inserts_only_new_plays_of_the_interval(duckdb_connection):
+    pytest.importorskip("duckdb")
+
+    db_hook = get_db_hook(duckdb_connection, "DuckDB")
+    db_hook.run(
+        [
+            SQL_QUERIES.CREATE_STAGING_EVENTS_TABLE,
+            SQL_QUERIES.CREATE_STAGING_SONGS_TABLE,
+            SQL_QUERIES.CREATE_SONGPLAYS_TABLE,
+            "INSERT INTO staging_events (page, ts, sessionid, userid) VALUES "
+            f"('NextSong', {HOUR_MS - 1}, 1, 1), "
+            f"('NextSong', {HOUR_MS}, 1, 1), "
+            f"('Home', {HOUR_MS + 1}, 1, 1), "
+            f"('NextSong', {HOUR_MS + 3_599_999}, 2, 2), "
+            f"('NextSong', {HOUR_MS + 3_600_000}, 2, 2);",
+        ],
+        autocommit=True,
+    )
+    statement = incremental_operator()._incremental_stmt(CONTEXT)
+
+    db_hook.run(statement, autocommit=True)
+    # A rerun of the same interval skips the plays it already loaded.
+    db_hook.run(statement, autocommit=True)
+
+    assert db_hook.get_records(
+        "SELECT start_time, sessionid FROM songplays ORDER BY start_time"
+    ) == [
+        (datetime(2018, 11, 1, 21), 1),
+        (datetime(2018, 11, 1, 21, 59, 59), 2),
+    ]
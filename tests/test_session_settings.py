@@ -0,0 +1,51 @@
+"""Tests for rendering and validating WLM session settings"""
+
+import pytest
+
+from helpers.session_settings import render_session_settings
+
+
+def test_redshift_renders_every_setting_in_order():
+    assert render_session_settings(
+        {
+            "wlm_query_slot_count": 2,
+            "statement_timeout": 600,
+            "label": "backfill",
+            "query_group": "etl_load",
+        }
+    ) == [
+        "SET query_group TO 'etl_load.backfill';",
+        "SET statement_timeout TO 600000;",
+        "SET wlm_query_slot_count TO 2;",
+    ]
+
+
+def test_postgres_gets_only_the_timeout_and_duckdb_nothing():
+    settings = {"query_group": "etl_load", "statement_timeout": 5}
+
+    assert render_session_settings(settings, "Postgres") == [
+        "SET statement_timeout TO 5000;"
+    ]
+    assert not render_session_settings(settings, "DuckDB")
+
+
+def test_none_leaves_a_setting_at_the_cluster_default():
+    assert not render_session_settings(
+        {"query_group": None, "statement_timeout": None}
+    )
+
+
+@pytest.mark.parametrize(
+    "settings, message",
+    [
+        ({"queue": "etl"}, "Unknown session setting queue"),
+        ({"statement_timeout": "600"}, "must be a int"),
+        ({"wlm_query_slot_count": True}, "must be a int"),
+        ({"wlm_query_slot_count": 0}, "must be >= 1"),
+        ({"query_group": "etl'; DROP TABLE users; --"}, "may only hold"),
+        ({"label": "backfill"}, "label requires query_group"),
+    ],
+)
+def test_invalid_settings_raise(settings, message):
+    with pytest.raises(ValueError, match=message):
+        render_session_settings(settings)
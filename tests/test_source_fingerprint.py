@@ -0,0 +1,198 @@
+"""Tests for skipping runs whose sources have not changed, on local S3"""
+
+import os
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("airflow")
+
+# pylint: disable=wrong-import-position
+import helpers.sql_queries as SQL_QUERIES
+from helpers.local_backend import LocalS3Hook
+from helpers.query_metrics import get_db_hook
+from helpers.s3_objects import prefix_fingerprint
+from source_fingerprint import SourceFingerprintOperator
+
+# 2018-11-01 21:00 to 22:00 UTC, an hour of the day the log file covers.
+HOUR_START = datetime(2018, 11, 1, 21, tzinfo=timezone.utc)
+HOUR_END = datetime(2018, 11, 1, 22, tzinfo=timezone.utc)
+
+SOURCES = [
+    {"bucket_name": "my-bucket", "prefix": "log-data/"},
+    {"bucket_name": "udacity-dend", "prefix": "song-data/"},
+]
+
+
+@pytest.fixture
+def sources(s3_root):
+    """One log file and two song files under the local S3 root."""
+    for path in (
+        "my-bucket/log-data/2018/11/2018-11-01-events.json",
+        "udacity-dend/song-data/A/A/TRAAAAA.json",
+        "udacity-dend/song-data/A/B/TRAAAAB.json",
+        "udacity-dend/song-data-compacted/part-00000.json.gz",
+    ):
+        (s3_root / path).parent.mkdir(parents=True, exist_ok=True)
+        (s3_root / path).write_text('{"title": "Song"}\n', encoding="utf-8")
+
+    return s3_root
+
+
+@pytest.fixture
+def staging_events(duckdb_connection):
+    """Run statements against an empty staging_events table."""
+    db_hook = get_db_hook(duckdb_connection, "DuckDB")
+    db_hook.run(SQL_QUERIES.CREATE_STAGING_EVENTS_TABLE, autocommit=True)
+
+    return db_hook
+
+
+def run_operator(connection_id, previous, conf=None, interval=(HOUR_END, HOUR_END)):
+    """Run the operator after a successful run that pushed ``previous``.
+
+    ``interval`` is the run's data interval, empty by default as for a
+    manually triggered run.
+
+    Returns
+    -------
+    Tuple[Dict[str, Dict[str, Any]], List[str]]
+        The fingerprints pushed to XCom and the IDs of the skipped tasks.
+    """
+    operator = SourceFingerprintOperator(
+        task_id="check_new_data",
+        sources=SOURCES,
+        db_connection_id=connection_id,
+        connection_type="DuckDB",
+    )
+    skipped = []
+    operator._previous_fingerprints = (  # pylint: disable=protected-access
+        lambda context: previous
+    )
+    operator.skip = lambda dag_run, execution_date, tasks, map_index: (
+        skipped.extend(tasks)
+    )
+    context = {
+        "dag_run": SimpleNamespace(run_id="run", conf=conf, execution_date=None),
+        "task": SimpleNamespace(
+            get_flat_relatives=lambda upstream: ["create_tables", "stage_events"]
+        ),
+        "ti": SimpleNamespace(map_index=-1),
+        "data_interval_start": interval[0],
+        "data_interval_end": interval[1],
+    }
+
+    return operator.execute(context), skipped
+
+
+def test_prefix_fingerprint_of_local_files(duckdb_connection, sources):
+    fingerprint = prefix_fingerprint(
+        LocalS3Hook(duckdb_connection), "udacity-dend", "song-data/"
+    )
+    paged = prefix_fingerprint(
+        LocalS3Hook(duckdb_connection, page_size=1), "udacity-dend", "song-data/"
+    )
+    latest = max(
+        os.path.getmtime(path)
+        for path in (sources / "udacity-dend/song-data").rglob("*.json")
+    )
+
+    # song-data-compacted/ shares the prefix "song-data", but not "song-data/".
+    assert fingerprint["keys"] == 2
+    assert fingerprint["last_modified"] == (
+        datetime.fromtimestamp(latest, tz=timezone.utc).isoformat()
+    )
+    assert paged == fingerprint
+
+    (sources / "udacity-dend/song-data/A/B/TRAAAAB.json").write_text(
+        '{"title": "Other"}\n', encoding="utf-8"
+    )
+    changed = prefix_fingerprint(
+        LocalS3Hook(duckdb_connection), "udacity-dend", "song-data/"
+    )
+
+    assert changed["keys"] == 2
+    assert changed["etag_digest"] != fingerprint["etag_digest"]
+
+
+def test_empty_prefix_fingerprint(duckdb_connection, sources):
+    fingerprint = prefix_fingerprint(
+        LocalS3Hook(duckdb_connection), "my-bucket", "missing/"
+    )
+
+    assert fingerprint["keys"] == 0
+    assert fingerprint["last_modified"] is None
+
+
+def test_proceeds_without_a_previous_run(duckdb_connection, sources):
+    fingerprints, skipped = run_operator(duckdb_connection, None)
+
+    assert list(fingerprints) == [
+        "s3://my-bucket/log-data/",
+        "s3://udacity-dend/song-data/",
+    ]
+    assert fingerprints["s3://my-bucket/log-data/"]["keys"] == 1
+    assert skipped == []
+
+
+def test_skips_downstream_when_nothing_changed(duckdb_connection, sources):
+    previous, _ = run_operator(duckdb_connection, None)
+
+    fingerprints, skipped = run_operator(duckdb_connection, previous)
+
+    assert fingerprints == previous
+    assert skipped == ["create_tables", "stage_events"]
+
+
+def test_proceeds_when_a_source_changed(duckdb_connection, sources):
+    previous, _ = run_operator(duckdb_connection, None)
+    (sources / "my-bucket/log-data/2018/11/2018-11-02-events.json").write_text(
+        "{}\n", encoding="utf-8"
+    )
+
+    fingerprints, skipped = run_operator(duckdb_connection, previous)
+
+    assert fingerprints["s3://my-bucket/log-data/"]["keys"] == 2
+    assert skipped == []
+
+
+def test_force_proceeds_when_nothing_changed(duckdb_connection, sources):
+    previous, _ = run_operator(duckdb_connection, None)
+
+    _, skipped = run_operator(duckdb_connection, previous, conf={"force": True})
+
+    assert skipped == []
+
+
+def test_skips_an_hour_without_staged_events(
+    duckdb_connection, sources, staging_events
+):
+    previous, _ = run_operator(duckdb_connection, None)
+
+    _, skipped = run_operator(
+        duckdb_connection, previous, interval=(HOUR_START, HOUR_END)
+    )
+
+    assert skipped == ["create_tables", "stage_events"]
+
+
+def test_proceeds_when_unchanged_sources_left_events_in_the_interval(
+    duckdb_connection, sources, staging_events
+):
+    # The previous run staged the whole day's log file, including this hour.
+    hour_ms = int(HOUR_START.timestamp() * 1000)
+    staging_events.run(
+        "INSERT INTO staging_events (page, ts) VALUES "
+        f"('NextSong', {hour_ms - 1}), ('Home', {hour_ms}), "
+        f"('NextSong', {hour_ms + 60_000});",
+        autocommit=True,
+    )
+    previous, _ = run_operator(duckdb_connection, None)
+
+    fingerprints, skipped = run_operator(
+        duckdb_connection, previous, interval=(HOUR_START, HOUR_END)
+    )
+
+    assert fingerprints == previous
+    assert skipped == []
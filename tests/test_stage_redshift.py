@@ -0,0 +1,189 @@
+"""Tests for the S3 keys and objects the staging COPYs read"""
+
+import json
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("airflow")
+
+# pylint: disable=wrong-import-position,protected-access
+import helpers.sql_queries as SQL_QUERIES
+import stage_redshift
+from helpers.local_backend import LocalS3Hook
+from helpers.query_metrics import get_db_hook
+from stage_redshift import StageToRedshiftOperator, ledger_insert_stmts
+
+TEMPLATE = "log-data/{year}/{month:02d}/{ds}"
+
+
+def partition_keys(start, end, **kwargs):
+    """Return the keys a run over [start, end) copies."""
+    operator = StageToRedshiftOperator(
+        task_id="stage_events",
+        s3_key="log-data/",
+        s3_partition_template=TEMPLATE,
+        **kwargs,
+    )
+
+    return operator._partition_keys(
+        {"data_interval_start": start, "data_interval_end": end}
+    )
+
+
+def test_partition_keys_cover_each_day_of_the_interval():
+    assert partition_keys(
+        datetime(2018, 11, 30, 22, tzinfo=timezone.utc),
+        datetime(2018, 12, 1, 2, tzinfo=timezone.utc),
+    ) == ["log-data/2018/11/2018-11-30", "log-data/2018/12/2018-12-01"]
+
+    # An hourly run reads only its day.
+    assert partition_keys(
+        datetime(2018, 11, 1, 21, tzinfo=timezone.utc),
+        datetime(2018, 11, 1, 22, tzinfo=timezone.utc),
+    ) == ["log-data/2018/11/2018-11-01"]
+
+
+def test_partition_date_takes_the_place_of_the_interval():
+    assert partition_keys(
+        datetime(2018, 11, 1, tzinfo=timezone.utc),
+        datetime(2018, 11, 8, tzinfo=timezone.utc),
+        partition_date="2018-11-03",
+    ) == ["log-data/2018/11/2018-11-03"]
+
+
+def test_empty_interval_copies_the_whole_prefix():
+    now = datetime(2018, 11, 1, 21, tzinfo=timezone.utc)
+
+    assert partition_keys(now, now) == ["log-data/"]
+
+
+class ManifestS3Hook(LocalS3Hook):
+    """Lists the local files and keeps the manifests written, by key."""
+
+    def __init__(self, duckdb_conn_id):
+        super().__init__(duckdb_conn_id)
+        self.manifests = {}
+
+    def load_string(self, string_data, key, bucket_name, replace):
+        assert replace
+        self.manifests[f"{bucket_name}/{key}"] = json.loads(string_data)
+
+
+@pytest.fixture
+def log_files(s3_root):
+    """Three log files under the local S3 root."""
+    for day in ("01", "02", "03"):
+        path = s3_root / f"my-bucket/log-data/2018/11/2018-11-{day}-events.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f'{{"ts": {day}}}\n', encoding="utf-8")
+
+    return s3_root
+
+
+def write_manifest(connection_id, ledger_rows, monkeypatch):
+    """Write the manifest of the log files against a ledger of ``ledger_rows``.
+
+    Returns
+    -------
+    Tuple[Optional[Tuple[str, List[Tuple[Any, ...]]]], Dict[str, Any]]
+        What ``_write_manifest`` returned and the manifests written, by key.
+    """
+    s3_hook = ManifestS3Hook(connection_id)
+    monkeypatch.setattr(stage_redshift, "S3Hook", lambda aws_conn_id: s3_hook)
+
+    db_hook = get_db_hook(connection_id, "DuckDB")
+    db_hook.run(SQL_QUERIES.CREATE_LOAD_LEDGER_TABLE, autocommit=True)
+
+    for statement in ledger_insert_stmts(ledger_rows):
+        db_hook.run(statement, autocommit=True)
+
+    operator = StageToRedshiftOperator(
+        task_id="stage_events",
+        bucket_name="my-bucket",
+        iam_role="role",
+        copy_table_stmt=SQL_QUERIES.COPY_STAGING_EVENTS,
+        json_format="auto",
+        use_manifest=True,
+        table_name="staging_events",
+    )
+    copy = operator._write_manifest(
+        {"ti": SimpleNamespace(map_index=2), "ts_nodash": "20181103T000000"},
+        db_hook,
+        ["log-data/2018/11/"],
+    )
+
+    return copy, s3_hook.manifests
+
+
+def test_manifest_lists_only_the_objects_missing_from_the_ledger(
+    duckdb_connection, log_files, monkeypatch
+):
+    listed = stage_redshift.list_objects(
+        LocalS3Hook(duckdb_connection), "my-bucket", ["log-data/2018/11/"]
+    )
+    first, second, third = sorted(listed)
+    loaded_at = datetime(2018, 11, 2)
+
+    copy, manifests = write_manifest(
+        duckdb_connection,
+        [
+            ("staging_events", *first, loaded_at),
+            # The second file changed since it was loaded.
+            ("staging_events", second[0], "stale-etag", second[2], loaded_at),
+            # Loading a file into another table does not count.
+            ("staging_songs", *third, loaded_at),
+        ],
+        monkeypatch,
+    )
+    fmt_copy, ledger_rows = copy
+
+    # The manifest of map index 2 is keyed on it.
+    manifest_key = "manifests/staging_events/20181103T000000-2.manifest"
+    manifest = manifests[f"my-bucket/{manifest_key}"]
+    assert [entry["url"] for entry in manifest["entries"]] == [
+        f"s3://my-bucket/{second[0]}",
+        f"s3://my-bucket/{third[0]}",
+    ]
+    assert manifest["entries"][0]["meta"] == {"content_length": second[2]}
+    assert f"FROM 's3://my-bucket/{manifest_key}'" in fmt_copy
+    assert "MANIFEST" in fmt_copy
+    assert [row[:4] for row in ledger_rows] == [
+        ("staging_events", *second),
+        ("staging_events", *third),
+    ]
+
+
+def test_no_manifest_when_the_ledger_has_every_object(
+    duckdb_connection, log_files, monkeypatch
+):
+    listed = stage_redshift.list_objects(
+        LocalS3Hook(duckdb_connection), "my-bucket", ["log-data/2018/11/"]
+    )
+
+    copy, manifests = write_manifest(
+        duckdb_connection,
+        [("staging_events", *obj, datetime(2018, 11, 2)) for obj in listed],
+        monkeypatch,
+    )
+
+    assert copy is None
+    assert manifests == {}
+
+
+def test_ledger_insert_stmts_split_and_quote_the_rows():
+    loaded_at = datetime(2018, 11, 2, 3, 4, 5)
+    rows = [
+        ("staging_events", f"log-data/it's-{n}.json", "etag", n, loaded_at)
+        for n in range(stage_redshift.LEDGER_ROWS_PER_STATEMENT * 2 + 1)
+    ]
+
+    statements = ledger_insert_stmts(rows)
+
+    assert len(statements) == 3
+    assert statements[2].count("'staging_events'") == 1
+    assert (
+        "('staging_events', 'log-data/it''s-0.json', 'etag', 0, "
+        "'2018-11-02 03:04:05')"
+    ) in statements[0]
@@ -0,0 +1,195 @@
+"""Tests for the UNLOAD statements of the Parquet exports"""
+
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("airflow")
+
+# pylint: disable=wrong-import-position
+from unload_s3 import UnloadToS3Operator, render_unload
+
+# 2018-11-01 21:00 to 22:00 UTC, the data interval of an hourly run.
+HOUR_CONTEXT = {
+    "data_interval_start": datetime(2018, 11, 1, 21, tzinfo=timezone.utc),
+    "data_interval_end": datetime(2018, 11, 1, 22, tzinfo=timezone.utc),
+}
+
+
+def export_operator(connection_id="redshift", connection_type="Redshift"):
+    """An operator exporting a snapshot of users and the hourly plays."""
+    return UnloadToS3Operator(
+        task_id="export_star_schema",
+        db_connection_id=connection_id,
+        bucket_name="my-bucket",
+        iam_role="role",
+        exports=[
+            {"name": "users", "table": "users"},
+            {
+                "name": "plays",
+                "table": "plays",
+                "partition_by": ["day", "hour"],
+                "interval_column": "start_time",
+            },
+        ],
+        connection_type=connection_type,
+    )
+
+
+def test_render_unload_with_every_option():
+    sql = render_unload(
+        "SELECT * FROM songplays WHERE level = 'paid';",
+        "my-bucket",
+        "exports/songplays/",
+        "arn:aws:iam::123456789012:role/unload",
+        partition_by=["year", "month"],
+        max_file_size_mb=256,
+        manifest=True,
+        region="us-west-2",
+    )
+
+    assert sql.split("\n") == [
+        "",
+        "UNLOAD ('SELECT * FROM songplays WHERE level = ''paid'';')",
+        "TO 's3://my-bucket/exports/songplays/'",
+        "IAM_ROLE 'arn:aws:iam::123456789012:role/unload'",
+        "FORMAT AS PARQUET",
+        "PARTITION BY (year, month)",
+        "MAXFILESIZE 256 MB",
+        "MANIFEST",
+        "PARALLEL ON",
+        "CLEANPATH",
+        "REGION 'us-west-2';",
+        "",
+    ]
+
+
+def test_render_unload_defaults():
+    sql = render_unload("SELECT * FROM users", "my-bucket", "exports/users/", "role")
+
+    assert "PARTITION BY" not in sql
+    assert "MAXFILESIZE" not in sql
+    assert "MANIFEST" not in sql
+    assert sql.rstrip().endswith("PARALLEL ON\nCLEANPATH;")
+
+
+def test_render_unload_rejects_cleanpath_with_allow_overwrite():
+    with pytest.raises(ValueError, match="mutually exclusive"):
+        render_unload("SELECT 1", "my-bucket", "x/", "role", allow_overwrite=True)
+
+
+def test_render_unload_rejects_max_file_size_out_of_range():
+    with pytest.raises(ValueError, match="max_file_size_mb"):
+        render_unload("SELECT 1", "my-bucket", "x/", "role", max_file_size_mb=4)
+
+
+def test_rendered_unload_runs_on_the_local_backend(duckdb_connection, s3_root):
+    pytest.importorskip("duckdb")
+    # pylint: disable-next=import-outside-toplevel
+    from helpers.local_backend import DuckDBHook, translate_sql
+
+    partitioned = render_unload(
+        "SELECT n, n % 2 AS parity, 'it''s' AS quote FROM range(4) t(n)",
+        "my-bucket",
+        "exports/numbers/",
+        "role",
+        partition_by=["parity"],
+    )
+    single = render_unload(
+        "SELECT 'it''s' AS quote", "my-bucket", "exports/single/", "role"
+    )
+
+    assert translate_sql(partitioned, str(s3_root), lambda table: []) == (
+        "COPY (SELECT n, n % 2 AS parity, 'it''s' AS quote FROM range(4) t(n)) "
+        f"TO '{s3_root}/my-bucket/exports/numbers/' "
+        "(FORMAT PARQUET, PARTITION_BY (parity), OVERWRITE true);"
+    )
+
+    conn = DuckDBHook(duckdb_connection).get_conn()
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(partitioned)
+            cursor.execute(single)
+    finally:
+        conn.close()
+
+    exports = s3_root / "my-bucket" / "exports"
+    assert sorted(path.name for path in (exports / "numbers").iterdir()) == [
+        "parity=0",
+        "parity=1",
+    ]
+    assert [path.name for path in (exports / "single").iterdir()] == [
+        "0000_part_00.parquet"
+    ]
+
+
+def test_interval_export_writes_only_the_run_s_partitions():
+    snapshot, plays = export_operator().unload_statements(HOUR_CONTEXT)
+
+    assert "CLEANPATH" in snapshot
+    assert "WHERE" not in snapshot
+    assert "CLEANPATH" not in plays
+    assert "ALLOWOVERWRITE" in plays
+    assert "PARTITION BY (day, hour)" in plays
+    assert (
+        "WHERE start_time >= ''2018-11-01 21:00:00'' "
+        "AND start_time < ''2018-11-01 22:00:00''"
+    ) in plays
+
+
+def test_interval_export_of_an_unscheduled_run_writes_every_row():
+    end = HOUR_CONTEXT["data_interval_end"]
+    _, plays = export_operator().unload_statements(
+        {"data_interval_start": end, "data_interval_end": end}
+    )
+
+    assert "WHERE" not in plays
+    assert "ALLOWOVERWRITE" in plays
+
+
+def test_interval_export_requires_partition_by():
+    with pytest.raises(ValueError, match="partition_by"):
+        UnloadToS3Operator(
+            task_id="export",
+            exports=[{"name": "plays", "table": "plays", "interval_column": "ts"}],
+        )
+
+
+def test_interval_export_keeps_the_other_hours_locally(duckdb_connection, s3_root):
+    pytest.importorskip("duckdb")
+    # pylint: disable-next=import-outside-toplevel
+    from helpers.query_metrics import get_db_hook
+
+    db_hook = get_db_hook(duckdb_connection, "DuckDB")
+    db_hook.run(
+        "CREATE TABLE users AS SELECT 1 AS userid;"
+        "CREATE TABLE plays AS SELECT "
+        "TIMESTAMP '2018-11-01 20:00:00' + n * INTERVAL 30 MINUTE AS start_time, "
+        "1 AS day, 20 + n // 2 AS hour FROM range(4) t(n);",
+        autocommit=True,
+    )
+    operator = export_operator(duckdb_connection, "DuckDB")
+    plays = s3_root / "my-bucket" / "exports" / "plays" / "day=1"
+    task_instance = SimpleNamespace(
+        dag_id="test_dag",
+        task_id="export_star_schema",
+        xcom_push=lambda key, value: None,
+    )
+
+    operator.execute(
+        {
+            "ti": task_instance,
+            "data_interval_start": datetime(2018, 11, 1, 20, tzinfo=timezone.utc),
+            "data_interval_end": datetime(2018, 11, 1, 21, tzinfo=timezone.utc),
+        }
+    )
+    operator.execute({"ti": task_instance, **HOUR_CONTEXT})
+    # A rerun of the same hour replaces its own files.
+    operator.execute({"ti": task_instance, **HOUR_CONTEXT})
+
+    assert sorted(path.name for path in plays.iterdir()) == ["hour=20", "hour=21"]
+    assert [path.name for path in (plays / "hour=21").iterdir()] == [
+        "data_0.parquet"
+    ]